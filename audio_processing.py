@@ -1,5 +1,13 @@
-import numpy as np
+from __future__ import annotations
 from collections import deque
+from lazy_import import lazy_import
+
+np = lazy_import('numpy')
+
+PILOT_FREQ = 19000
+PILOT_TOLERANCE = 100
+SUBCARRIER_FREQ = 38000
+SUBCARRIER_TOLERANCE = 200
 
 
 class AudioProcessor:
@@ -43,6 +51,10 @@ class AudioProcessor:
         return output
 
     def process(self, audio_data: np.ndarray) -> np.ndarray:
+        # Nothing enabled: hand the block on as is rather than round-trip it through float
+        if not self.agc_enabled and not self.limiter_enabled:
+            return audio_data
+
         audio_float = audio_data.astype(np.float32) / 32768.0
 
         audio_float = self.apply_agc(audio_float)
@@ -50,6 +62,37 @@ class AudioProcessor:
 
         return (audio_float * 32768.0).astype(np.int16)
 
+    def clone(self) -> 'AudioProcessor':
+        """Copy with the same settings and gain state, to stage a change on a running stream."""
+        processor = AudioProcessor(self.samplerate)
+        processor.agc_enabled = self.agc_enabled
+        processor.limiter_enabled = self.limiter_enabled
+        processor.target_level = self.target_level
+        processor.current_gain = self.current_gain
+        return processor
+
+
+def crossfade(old: np.ndarray, new: np.ndarray) -> np.ndarray:
+    """Blend one block linearly from `old` to `new` (same shape, int16)."""
+    ramp = np.linspace(0.0, 1.0, len(new), dtype=np.float32).reshape(-1, *([1] * (new.ndim - 1)))
+    mixed = old.astype(np.float32) * (1.0 - ramp) + new.astype(np.float32) * ramp
+    return mixed.astype(np.int16)
+
+
+def fade(block: np.ndarray, fade_in: bool, length: int) -> np.ndarray:
+    """Copy of `block` faded in over its first `length` frames or out over its last."""
+    length = min(length, len(block))
+    output = np.array(block, dtype=np.int16)
+    if length == 0:
+        return output
+
+    ramp = np.linspace(0.0, 1.0, length, dtype=np.float32).reshape(-1, *([1] * (block.ndim - 1)))
+    if fade_in:
+        output[:length] = (output[:length] * ramp).astype(np.int16)
+    else:
+        output[-length:] = (output[-length:] * ramp[::-1]).astype(np.int16)
+    return output
+
 
 class FFTAnalyzer:
     def __init__(self, samplerate=192000, fft_size=8192):
@@ -82,10 +125,7 @@ class FFTAnalyzer:
         if freqs is None:
             return -60.0
 
-        pilot_freq = 19000
-        tolerance = 100
-
-        mask = (freqs >= pilot_freq - tolerance) & (freqs <= pilot_freq + tolerance)
+        mask = (freqs >= PILOT_FREQ - PILOT_TOLERANCE) & (freqs <= PILOT_FREQ + PILOT_TOLERANCE)
         if np.any(mask):
             return np.max(magnitude_db[mask])
 
@@ -96,10 +136,7 @@ class FFTAnalyzer:
         if freqs is None:
             return -60.0
 
-        subcarrier_freq = 38000
-        tolerance = 200
-
-        mask = (freqs >= subcarrier_freq - tolerance) & (freqs <= subcarrier_freq + tolerance)
+        mask = (freqs >= SUBCARRIER_FREQ - SUBCARRIER_TOLERANCE) & (freqs <= SUBCARRIER_FREQ + SUBCARRIER_TOLERANCE)
         if np.any(mask):
             return np.max(magnitude_db[mask])
 
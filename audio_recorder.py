@@ -0,0 +1,317 @@
+from __future__ import annotations
+import collections
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+from lazy_import import lazy_import
+
+try:
+    import fcntl
+except ImportError:  # Windows: an open file cannot be renamed, which protects it from recovery instead
+    fcntl = None
+
+np = lazy_import('numpy')
+
+PARTIAL_SUFFIX = '.partial'
+HEADER_SIZE = 4096
+DS64_OFFSET = 12
+FMT_OFFSET = 48
+PAD_OFFSET = 72
+DATA_OFFSET = HEADER_SIZE - 8
+RIFF_LIMIT = 0xFFFFFFFF
+
+
+def wav_header(channels: int, samplerate: int, data_size: int, final: bool = True) -> bytes:
+    """
+    16-bit PCM header padded to HEADER_SIZE so sample data starts page-aligned.
+
+    The chunk after WAVE is a 28-byte JUNK chunk that becomes the ds64 chunk when
+    the file outgrows RIFF (RF64, EBU Tech 3306). While recording (final=False) the
+    JUNK chunk carries the 64-bit sizes written so far, which is what recovery reads.
+    """
+    block_align = channels * 2
+    riff_size = data_size + HEADER_SIZE - 8
+    ds64 = struct.pack('<QQQI', riff_size, data_size, data_size // block_align, 0)
+    rf64 = final and riff_size > RIFF_LIMIT
+
+    header = bytearray(HEADER_SIZE)
+    if rf64:
+        struct.pack_into('<4sI4s4sI', header, 0, b'RF64', RIFF_LIMIT, b'WAVE', b'ds64', len(ds64))
+    else:
+        struct.pack_into('<4sI4s4sI', header, 0, b'RIFF', min(riff_size, RIFF_LIMIT), b'WAVE', b'JUNK', len(ds64))
+    header[DS64_OFFSET + 8:FMT_OFFSET] = ds64
+    struct.pack_into('<4sIHHIIHH', header, FMT_OFFSET, b'fmt ', 16, 1, channels, samplerate,
+                     samplerate * block_align, block_align, 16)
+    struct.pack_into('<4sI', header, PAD_OFFSET, b'JUNK', DATA_OFFSET - PAD_OFFSET - 8)
+    struct.pack_into('<4sI', header, DATA_OFFSET, b'data', RIFF_LIMIT if rf64 else min(data_size, RIFF_LIMIT))
+    return bytes(header)
+
+
+def read_partial_header(f):
+    """(channels, samplerate, checkpointed data size) of a file written by WavWriter, or None."""
+    f.seek(0)
+    header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or header[8:12] != b'WAVE' or header[FMT_OFFSET:FMT_OFFSET + 4] != b'fmt ':
+        return None
+    _, data_size, _, _ = struct.unpack_from('<QQQI', header, DS64_OFFSET + 8)
+    _, _, _, channels, samplerate = struct.unpack_from('<4sIHHI', header, FMT_OFFSET)
+    return channels, samplerate, data_size
+
+
+class WavWriter:
+    """
+    Writes one WAV/RF64 file from the recorder's writer thread.
+
+    Samples are collected into `buffer_bytes` and written in whole aligned
+    buffers; the file is preallocated `preallocate_bytes` ahead of the write
+    position. After every write the size is checkpointed in the header, so a
+    crash loses at most one buffer. The file is named *.wav.partial until
+    close() trims the preallocation, finalizes the header and renames it.
+    """
+
+    def __init__(self, path: str, channels: int, samplerate: int, buffer_bytes: int = 4 * 1024 * 1024,
+                 preallocate_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.channels = channels
+        self.samplerate = samplerate
+        self.buffer_bytes = max(HEADER_SIZE, buffer_bytes - buffer_bytes % HEADER_SIZE)
+        self.preallocate_bytes = preallocate_bytes
+
+        self.buffer = bytearray()
+        self.data_size = 0
+        self.allocated = 0
+
+        self.file = open(path + PARTIAL_SUFFIX, 'w+b', buffering=0)
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.file.write(wav_header(channels, samplerate, 0, final=False))
+
+    def write(self, data: bytes):
+        self.buffer += data
+        if len(self.buffer) >= self.buffer_bytes:
+            length = len(self.buffer) - len(self.buffer) % self.buffer_bytes
+            self._write_out(length)
+
+    @property
+    def size(self) -> int:
+        """Audio bytes written or buffered so far."""
+        return self.data_size + len(self.buffer)
+
+    def flush(self):
+        """Write out whatever is buffered, aligned or not."""
+        if self.buffer:
+            self._write_out(len(self.buffer))
+
+    def _write_out(self, length: int):
+        end = HEADER_SIZE + self.data_size + length
+        if self.preallocate_bytes and end > self.allocated and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(self.file.fileno(), self.allocated, end + self.preallocate_bytes - self.allocated)
+                self.allocated = end + self.preallocate_bytes
+            except OSError:
+                self.preallocate_bytes = 0
+
+        self.file.seek(HEADER_SIZE + self.data_size)
+        with memoryview(self.buffer) as view:
+            self.file.write(view[:length])
+        del self.buffer[:length]
+        self.data_size += length
+
+        self.file.seek(0)
+        self.file.write(wav_header(self.channels, self.samplerate, self.data_size, final=False))
+
+    def close(self) -> str:
+        self.flush()
+        self.file.truncate(HEADER_SIZE + self.data_size)
+        self.file.seek(0)
+        self.file.write(wav_header(self.channels, self.samplerate, self.data_size))
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.path + PARTIAL_SUFFIX, self.path)
+        return self.path
+
+
+def recover_recordings(record_dir: str) -> List[str]:
+    """
+    Finalize *.wav.partial files left by a crash: trim to the last checkpointed
+    size (whole frames), write the final header and rename to *.wav. Files still
+    open by a running recorder are skipped.
+    """
+    recovered = []
+    if not os.path.isdir(record_dir):
+        return recovered
+
+    for filename in sorted(os.listdir(record_dir)):
+        if not filename.endswith('.wav' + PARTIAL_SUFFIX):
+            continue
+        partial = os.path.join(record_dir, filename)
+        try:
+            with open(partial, 'r+b') as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                header = read_partial_header(f)
+                if header is None:
+                    continue
+                channels, samplerate, data_size = header
+                data_size = min(data_size, os.fstat(f.fileno()).st_size - HEADER_SIZE)
+                data_size -= data_size % (channels * 2)
+                f.truncate(HEADER_SIZE + data_size)
+                f.seek(0)
+                f.write(wav_header(channels, samplerate, data_size))
+                os.fsync(f.fileno())
+            path = partial[:-len(PARTIAL_SUFFIX)]
+            os.replace(partial, path)
+            recovered.append(path)
+        except OSError:
+            continue
+    return recovered
+
+
+class AudioRecorder:
+    """
+    Records int16 audio blocks to WAV (RF64 beyond 4 GB) in `record_dir`.
+
+    write_audio() is called from the audio callback or network thread and only
+    appends the block to a deque, which is safe without a lock; a full queue
+    drops the block and counts it. A writer thread drains the queue into a
+    WavWriter. A change of channel count or samplerate mid-recording closes the
+    file and continues in a new one. Partial files from a crash are recovered
+    when the recorder is created.
+
+    With `segment_seconds` the recording rolls over to a new file every that many
+    seconds of audio, and each closed file is handed to `compressor` (a
+    SegmentCompressor) if one is given.
+    """
+
+    def __init__(self, record_dir: str = "recordings", buffer_bytes: int = 4 * 1024 * 1024,
+                 preallocate_bytes: int = 256 * 1024 * 1024, max_queue: int = 1024,
+                 poll_interval: float = 0.05, segment_seconds: float = 0.0, compressor=None):
+        self.record_dir = record_dir
+        self.segment_seconds = segment_seconds
+        self.compressor = compressor
+        self.buffer_bytes = buffer_bytes
+        self.preallocate_bytes = preallocate_bytes
+        self.max_queue = max_queue
+        self.poll_interval = poll_interval
+
+        self.is_recording = False
+        self.blocks = collections.deque()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+        self.direction = None
+        self.files: List[str] = []
+        self.blocks_dropped = 0
+        self.bytes_written = 0
+        self.error = None
+
+        self.recovered = recover_recordings(record_dir)
+
+    def start_recording(self, direction: str = "incoming"):
+        with self.lock:
+            if self.is_recording:
+                return
+
+            os.makedirs(self.record_dir, exist_ok=True)
+            self.direction = direction
+            self.files = []
+            self.blocks_dropped = 0
+            self.bytes_written = 0
+            self.error = None
+            self.blocks = collections.deque()
+            self.is_recording = True
+            self.thread = threading.Thread(target=self._writer, daemon=True)
+            self.thread.start()
+
+    def write_audio(self, block: np.ndarray, samplerate: int):
+        if not self.is_recording:
+            return
+        if len(self.blocks) >= self.max_queue:
+            self.blocks_dropped += 1
+            return
+        channels = block.shape[1] if block.ndim > 1 else 1
+        self.blocks.append((samplerate, channels, np.asarray(block, dtype=np.int16).tobytes()))
+
+    def stop_recording(self) -> List[str]:
+        """Stop, finalize the file(s) and return their paths."""
+        with self.lock:
+            if not self.is_recording:
+                return []
+            self.is_recording = False
+            thread, self.thread = self.thread, None
+
+        if thread is not None:
+            thread.join()
+        return list(self.files)
+
+    def get_stats(self):
+        stats = {
+            'recording': self.is_recording,
+            'queue_depth': len(self.blocks),
+            'blocks_dropped': self.blocks_dropped,
+            'bytes_written': self.bytes_written,
+            'files': list(self.files),
+            'error': self.error
+        }
+        if self.compressor is not None:
+            stats['compression'] = self.compressor.get_stats()
+        return stats
+
+    def _new_path(self) -> str:
+        base = f"{self.direction}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        path = os.path.join(self.record_dir, base + '.wav')
+        suffix = 1
+        while os.path.exists(path) or os.path.exists(path + PARTIAL_SUFFIX):
+            suffix += 1
+            path = os.path.join(self.record_dir, f"{base}_{suffix}.wav")
+        return path
+
+    def _open_writer(self, channels: int, samplerate: int) -> WavWriter:
+        writer = WavWriter(self._new_path(), channels, samplerate, self.buffer_bytes, self.preallocate_bytes)
+        self.files.append(writer.path)
+        return writer
+
+    def _close_writer(self, writer: WavWriter):
+        path = writer.close()
+        if self.compressor is not None:
+            self.compressor.submit(path)
+
+    def _writer(self):
+        writer: Optional[WavWriter] = None
+        segment_bytes = 0
+        try:
+            while True:
+                running = self.is_recording
+                while self.blocks:
+                    samplerate, channels, data = self.blocks.popleft()
+                    if writer is None or (writer.channels, writer.samplerate) != (channels, samplerate):
+                        if writer is not None:
+                            self._close_writer(writer)
+                        writer = self._open_writer(channels, samplerate)
+                        segment_bytes = int(self.segment_seconds * samplerate) * channels * 2
+
+                    self.bytes_written += len(data)
+                    # Roll over at the exact frame the segment length ends on
+                    while segment_bytes and writer.size + len(data) > segment_bytes:
+                        room = segment_bytes - writer.size
+                        writer.write(data[:room])
+                        data = data[room:]
+                        self._close_writer(writer)
+                        writer = self._open_writer(channels, samplerate)
+                    if data:
+                        writer.write(data)
+                if not running:
+                    break
+                time.sleep(self.poll_interval)
+        except OSError as e:
+            self.error = str(e)
+            self.is_recording = False
+        finally:
+            if writer is not None:
+                try:
+                    self._close_writer(writer)
+                except OSError as e:
+                    self.error = str(e)
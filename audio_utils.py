@@ -1,21 +1,17 @@
-import numpy as np
-import sounddevice as sd
-from typing import List, Tuple
+from __future__ import annotations
+from typing import List, Optional, Tuple
+from lazy_import import lazy_import
+from device_registry import DeviceRegistry
 
+np = lazy_import('numpy')
 
-def get_audio_devices() -> Tuple[List[str], List[str]]:
-    """Get lists of input and output audio devices."""
-    devices = sd.query_devices()
-    input_devices = []
-    output_devices = []
+_registry = DeviceRegistry()
 
-    for idx, device in enumerate(devices):
-        if device['max_input_channels'] > 0:
-            input_devices.append(f"{idx}: {device['name']}")
-        if device['max_output_channels'] > 0:
-            output_devices.append(f"{idx}: {device['name']}")
 
-    return input_devices, output_devices
+def get_audio_devices(registry: DeviceRegistry = None) -> Tuple[List[str], List[str]]:
+    """Get lists of input and output audio devices (cached; see DeviceRegistry)."""
+    registry = registry or _registry
+    return registry.labels('input'), registry.labels('output')
 
 
 def calculate_db_fs(audio_data: np.ndarray) -> Tuple[float, float]:
@@ -29,19 +25,82 @@ def calculate_db_fs(audio_data: np.ndarray) -> Tuple[float, float]:
     if audio_data.ndim == 1:
         audio_data = audio_data.reshape(-1, 1)
 
-    left_channel = audio_data[:, 0] if audio_data.shape[1] > 0 else np.array([0])
-    right_channel = audio_data[:, 1] if audio_data.shape[1] > 1 else left_channel
+    # All channels in one reduction; mono reads the same on both sides
+    mean_square = np.einsum('ij,ij->j', audio_data, audio_data) / len(audio_data)
+    left_db = float(amplitude_to_db(np.sqrt(mean_square[0])))
+    right_db = float(amplitude_to_db(np.sqrt(mean_square[1]))) if len(mean_square) > 1 else left_db
+    return left_db, right_db
 
-    left_rms = np.sqrt(np.mean(left_channel**2))
-    right_rms = np.sqrt(np.mean(right_channel**2))
 
-    left_db = 20 * np.log10(left_rms) if left_rms > 0 else -60.0
-    right_db = 20 * np.log10(right_rms) if right_rms > 0 else -60.0
+def block_moments(block: np.ndarray):
+    """
+    Per-channel moments of an int16 block (frames, channels) from one float64
+    copy: the channels' Gram matrix (sums of squares on the diagonal, cross
+    products off it), sums, maxima and minima. int16 products and their sums are
+    exact integers in float64 for blocks below 2**23 frames, so nothing
+    overflows or rounds. Any channel count works.
+    """
+    x = np.ascontiguousarray(block.T, dtype=np.float64)
+    return x @ x.T, np.add.reduce(x, axis=1), np.maximum.reduce(x, axis=1), np.minimum.reduce(x, axis=1)
 
-    left_db = max(left_db, -60.0)
-    right_db = max(right_db, -60.0)
 
-    return left_db, right_db
+class LevelMeter:
+    """
+    Accumulates per-channel sum of squares, peak and clipped samples of int16
+    audio across blocks; read() turns the window since the previous read into
+    dBFS, so log10 runs at the reader's rate rather than per block.
+    """
+
+    def __init__(self, floor_db: float = -60.0):
+        self.floor_db = floor_db
+        self.rms_db: List[float] = [floor_db]
+        self.peak_db: List[float] = [floor_db]
+        self.clips: List[int] = [0]
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.sum_squares: Optional[List[float]] = None
+        self.peak: Optional[List[float]] = None
+        self.clipped: Optional[List[int]] = None
+
+    def add(self, frames: int, sum_squares: List[float], peak: List[float], clipped: Optional[List[int]] = None):
+        if self.sum_squares is None or len(self.sum_squares) != len(sum_squares):
+            self.frames = frames
+            self.sum_squares = list(sum_squares)
+            self.peak = list(peak)
+            self.clipped = list(clipped) if clipped else [0] * len(peak)
+            return
+        self.frames += frames
+        self.sum_squares = [a + b for a, b in zip(self.sum_squares, sum_squares)]
+        self.peak = [max(a, b) for a, b in zip(self.peak, peak)]
+        if clipped:
+            self.clipped = [a + b for a, b in zip(self.clipped, clipped)]
+
+    def add_block(self, block: np.ndarray):
+        if block.ndim == 1:
+            block = block.reshape(-1, 1)
+        if not len(block):
+            return
+        gram, _, high, low = block_moments(block)
+        self.add(len(block), gram.diagonal().tolist(), np.maximum(high, -low).tolist())
+
+    def read(self) -> Tuple[List[float], List[float], List[int]]:
+        """(rms dBFS, peak dBFS, clipped samples) per channel since the last read; the last values if none came in."""
+        if self.frames:
+            scale = 1.0 / (self.frames * 32768.0 * 32768.0)
+            self.rms_db = [float(v) for v in amplitude_to_db(np.sqrt(np.array(self.sum_squares) * scale),
+                                                              self.floor_db)]
+            self.peak_db = [float(v) for v in amplitude_to_db(np.array(self.peak) / 32768.0, self.floor_db)]
+            self.clips = list(self.clipped)
+            self.reset()
+        return self.rms_db, self.peak_db, self.clips
+
+
+def amplitude_to_db(amplitude, floor: float = -60.0):
+    """20 * log10 of a linear amplitude (scalar or array), never below `floor`."""
+    with np.errstate(divide='ignore'):
+        return np.maximum(20 * np.log10(amplitude), floor)
 
 
 def normalize_db(db_value: float, min_db: float = -60.0, max_db: float = 0.0) -> float:
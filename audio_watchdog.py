@@ -0,0 +1,183 @@
+import collections
+from typing import Dict, List, Optional
+from lazy_import import lazy_import
+from audio_utils import LevelMeter, amplitude_to_db, block_moments
+
+np = lazy_import('numpy')
+
+# condition -> (severity while active, alert message)
+CONDITIONS = {
+    'silence': ('error', 'Silence detected'),
+    'clipping': ('warning', 'Audio clipping'),
+    'dc_offset': ('warning', 'DC offset'),
+    'phase_inverted': ('warning', 'Channels out of phase'),
+    'stuck': ('error', 'Stuck samples')
+}
+
+
+class Hysteresis:
+    """
+    Raises once a condition has held for `raise_after` seconds and clears once it
+    has been absent for `clear_after` seconds. By default absences shorter than
+    that do not reset the time accumulated, so intermittent conditions (clipping)
+    still raise; with `continuous` any absence starts the count again, for
+    conditions that only matter unbroken (silence, stuck samples).
+    """
+    __slots__ = ('raise_after', 'clear_after', 'continuous', 'active', 'on', 'off')
+
+    def __init__(self, raise_after: float, clear_after: float, continuous: bool = False):
+        self.raise_after = raise_after
+        self.clear_after = clear_after
+        self.continuous = continuous
+        self.reset()
+
+    def reset(self):
+        self.active = False
+        self.on = 0.0
+        self.off = 0.0
+
+    def update(self, condition: bool, seconds: float) -> Optional[bool]:
+        """True when the condition becomes active, False when it clears, None otherwise."""
+        if condition:
+            self.on += seconds
+            self.off = 0.0
+            if not self.active and self.on >= self.raise_after:
+                self.active = True
+                return True
+        else:
+            self.off += seconds
+            if self.continuous and not self.active:
+                self.on = 0.0
+            if self.off >= self.clear_after:
+                self.on = 0.0
+                if self.active:
+                    self.active = False
+                    return False
+        return None
+
+
+class AudioWatchdog:
+    """
+    Per-block audio health check for the sender and receiver paths.
+
+    process() takes each int16 block as it is sent or played and, with one
+    block_moments() pass, derives per-channel mean square, DC, peak and the
+    L/R cross product, from which it judges silence, clipping, DC offset, phase
+    inversion (negative L/R correlation) and stuck samples (a channel holding one
+    non-zero value for the whole block). Each condition runs through a Hysteresis
+    timer on audio time; transitions are queued and check_alerts(), polled from
+    the stats thread like CallbackMonitor.check_alerts(), raises them.
+
+    The same moments accumulate in `meter` (a LevelMeter) for the VU meters, so
+    dB conversion only happens when the meters are read.
+    """
+
+    def __init__(self, silence_db: float = -60.0, silence_seconds: float = 10.0, clip_level: float = 1.0,
+                 clip_seconds: float = 1.0, dc_threshold: float = 0.01, dc_seconds: float = 5.0,
+                 phase_threshold: float = -0.5, phase_seconds: float = 5.0, stuck_seconds: float = 1.0,
+                 clear_seconds: float = 2.0):
+        self.silence_power = (10 ** (silence_db / 20) * 32768) ** 2
+        self.clip = min(32767, int(clip_level * 32768))
+        self.dc_level = dc_threshold * 32768
+        self.phase_threshold = phase_threshold
+        self.timers = {
+            'silence': Hysteresis(silence_seconds, clear_seconds, continuous=True),
+            'clipping': Hysteresis(clip_seconds, clear_seconds),
+            'dc_offset': Hysteresis(dc_seconds, clear_seconds),
+            'phase_inverted': Hysteresis(phase_seconds, clear_seconds),
+            'stuck': Hysteresis(stuck_seconds, clear_seconds, continuous=True)
+        }
+        self.events = collections.deque()
+        self.meter = LevelMeter()
+        self.reset()
+
+    def reset(self):
+        for timer in self.timers.values():
+            timer.reset()
+        self.events.clear()
+        self.meter.reset()
+        self.power = [0.0]
+        self.peak = [0.0]
+        self.dc = [0.0]
+        self.correlation: Optional[float] = None
+        self.blocks = 0
+        self.clipped_samples = 0
+
+    def process(self, block, samplerate: int, judge: bool = True):
+        """Meter `block`; with `judge` also advance the condition timers (off until a stream has started)."""
+        if block.ndim == 1:
+            block = block.reshape(-1, 1)
+        frames, channels = block.shape
+        if not frames:
+            return
+
+        gram, total, high, low = block_moments(block)
+        sum_squares = gram.diagonal().tolist()
+        high = high.tolist()
+        low = low.tolist()
+        peak = [max(h, -l) for h, l in zip(high, low)]
+        clipping = [p >= self.clip for p in peak]
+        clipped = None
+        if True in clipping:
+            clipped = np.count_nonzero((block >= self.clip) | (block <= -self.clip), axis=0).tolist()
+            self.clipped_samples += sum(clipped)
+        self.meter.add(frames, sum_squares, peak, clipped)
+
+        power = [q / frames for q in sum_squares]
+        dc = (total / frames).tolist()
+        self.power, self.peak, self.dc = power, peak, dc
+        self.correlation = None
+        if channels >= 2:
+            norm = sum_squares[0] * sum_squares[1]
+            self.correlation = float(gram[0, 1]) / norm ** 0.5 if norm > 0 else 0.0
+        self.blocks += 1
+        if not judge:
+            return
+
+        silent = [p < self.silence_power for p in power]
+        dc_offset = [abs(d) > self.dc_level for d in dc]
+        stuck = [h == l and h != 0 for h, l in zip(high, low)]
+        inverted = (self.correlation is not None and self.correlation < self.phase_threshold
+                    and not silent[0] and not silent[1])
+
+        seconds = frames / samplerate
+        timers = self.timers
+        for name, flags in (('silence', silent), ('clipping', clipping), ('dc_offset', dc_offset),
+                            ('stuck', stuck), ('phase_inverted', [inverted, inverted])):
+            change = timers[name].update(True in flags, seconds)
+            if change is not None:
+                self.events.append((name, change, [c + 1 for c, flag in enumerate(flags) if flag]))
+
+    def rms_db(self) -> List[float]:
+        return [float(amplitude_to_db(p ** 0.5 / 32768.0)) for p in self.power]
+
+    def peak_db(self) -> List[float]:
+        return [float(amplitude_to_db(p / 32768.0)) for p in self.peak]
+
+    def check_alerts(self, alerts, link: Optional[str] = None):
+        while self.events:
+            name, raised, channels = self.events.popleft()
+            severity, message = CONDITIONS[name]
+            details = {'channels': channels}
+            if link is not None:
+                details['link'] = link
+            if name == 'phase_inverted':
+                details['correlation'] = self.correlation
+            elif name == 'dc_offset':
+                details['dc_offset'] = [round(v / 32768.0, 4) for v in self.dc]
+            elif name == 'clipping':
+                details['clipped_samples'] = self.clipped_samples
+            if raised:
+                alerts.raise_alert(severity, message, details)
+            else:
+                alerts.raise_alert('info', f"{message} cleared", details)
+
+    def get_stats(self) -> Dict:
+        return {
+            'rms_db': self.rms_db(),
+            'peak_db': self.peak_db(),
+            'dc_offset': [v / 32768.0 for v in self.dc],
+            'correlation': self.correlation,
+            'clipped_samples': self.clipped_samples,
+            'conditions': {name: timer.active for name, timer in self.timers.items()}
+        }
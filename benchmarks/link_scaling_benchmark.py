@@ -0,0 +1,165 @@
+"""
+Scaling benchmark for hosted links.
+
+Drives the real SenderEngine/ReceiverEngine block path (process, FEC/encryption,
+framing, UDP over loopback, decode, jitter buffer, playout, metering) without
+audio devices, so it runs on any box:
+
+1. single-core cost: CPU time per second of audio for one sender+receiver pair,
+   and the links per core that implies;
+2. real-time sweep: worker processes pinned one per core, each pacing its share
+   of links at the audio block rate, reporting CPU load and late blocks.
+
+    python benchmarks/link_scaling_benchmark.py --samplerate 192000 --processes 1,2,4
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from link_engine import LinkConfig, SenderEngine, ReceiverEngine
+from protocol import monotonic_ns, unpack_udp_frame
+
+
+class LinkPair:
+    """One sender feeding one receiver over loopback UDP, driven block by block."""
+
+    def __init__(self, samplerate: int, blocksize: int, fec: bool = False, password: str = ''):
+        config = LinkConfig(protocol='UDP', host='127.0.0.1', samplerate=samplerate, blocksize=blocksize,
+                            fec=fec, password=password)
+        self.blocksize = blocksize
+        self.sender = SenderEngine(config, history_dir=None, stats_interval=None)
+        self.receiver = ReceiverEngine(LinkConfig(**{**config.to_dict(), 'mode': 'receiver'}),
+                                       history_dir=None, stats_interval=None)
+
+        self.rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rx.bind(('127.0.0.1', 0))
+        self.tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.tx.connect(self.rx.getsockname())
+
+        for engine in (self.sender, self.receiver):
+            engine.apply_config()
+            engine.monitor.start()
+            engine.is_running = True
+        self.sender.transport = self.sender.udp_transport(self.tx)
+
+        t = np.arange(blocksize) / samplerate
+        tone = (np.sin(2 * np.pi * 1000.0 * t) * 8000).astype(np.int16)
+        self.block = np.column_stack([tone, tone])
+        self.out = np.zeros((blocksize, 2), dtype=np.int16)
+
+    def run_block(self):
+        self.sender.audio_callback(self.block, self.blocksize, None, None)
+        frame = unpack_udp_frame(self.rx.recv(65536))
+        if frame is not None:
+            packet_type, sequence, capture_ts, payload = frame
+            self.receiver.handle_packet(packet_type, sequence, capture_ts, monotonic_ns(), payload)
+        self.receiver.audio_output_callback(self.out, self.blocksize, None, None)
+
+    def close(self):
+        self.tx.close()
+        self.rx.close()
+
+
+def measure_cost(samplerate: int, blocksize: int, seconds: float, fec: bool, password: str) -> float:
+    """CPU seconds spent per second of audio for one link pair."""
+    pair = LinkPair(samplerate, blocksize, fec, password)
+    blocks = max(1, int(seconds * samplerate / blocksize))
+    for _ in range(50):
+        pair.run_block()
+
+    started = time.thread_time()
+    for _ in range(blocks):
+        pair.run_block()
+    elapsed = time.thread_time() - started
+    pair.close()
+    return elapsed / (blocks * blocksize / samplerate)
+
+
+def realtime_worker(cpu, links, samplerate, blocksize, seconds, fec, password, results):
+    if cpu is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, [cpu])
+
+    pairs = [LinkPair(samplerate, blocksize, fec, password) for _ in range(links)]
+    period = blocksize / samplerate
+    blocks = int(seconds / period)
+    late = 0
+
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for i in range(blocks):
+        for pair in pairs:
+            pair.run_block()
+
+        deadline = started + (i + 1) * period
+        remaining = deadline - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+        else:
+            late += 1
+
+    wall = time.perf_counter() - started
+    results.put((cpu, links, (time.process_time() - cpu_started) / wall, late, blocks))
+    for pair in pairs:
+        pair.close()
+
+
+def realtime_sweep(processes: int, links_per_process: int, samplerate: int, blocksize: int, seconds: float,
+                   fec: bool, password: str):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else [None]
+
+    workers = [context.Process(target=realtime_worker,
+                               args=(cpus[i % len(cpus)], links_per_process, samplerate, blocksize, seconds,
+                                     fec, password, results))
+               for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    reports = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure links per core for hosted MPX links')
+    parser.add_argument('--samplerate', type=int, default=192000)
+    parser.add_argument('--blocksize', type=int, default=1024)
+    parser.add_argument('--seconds', type=float, default=10.0, help='audio seconds per measurement')
+    parser.add_argument('--fec', action='store_true')
+    parser.add_argument('--password', default='', help='enable encryption with this password')
+    parser.add_argument('--processes', default='1,2,4', help='comma-separated worker counts for the sweep')
+    parser.add_argument('--links-per-process', type=int,
+                        help='links per worker in the sweep (default: 70%% of the measured capacity)')
+    args = parser.parse_args()
+
+    cost = measure_cost(args.samplerate, args.blocksize, args.seconds, args.fec, args.password)
+    capacity = 1.0 / cost
+    print(f"{args.samplerate} Hz stereo, block {args.blocksize}: {cost * 100:.2f}% of a core per link "
+          f"(sender + receiver path) -> {capacity:.1f} links per core at 100% load")
+
+    links = args.links_per_process or max(1, int(capacity * 0.7))
+    available = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    print(f"real-time sweep: {links} links per worker, {args.seconds:.0f} s, {available} CPUs available")
+    print(f"{'workers':>8} {'links':>6} {'links/core':>11} {'cpu/worker':>11} {'late blocks':>12}")
+
+    for processes in [int(value) for value in args.processes.split(',') if value]:
+        reports = realtime_sweep(processes, links, args.samplerate, args.blocksize, args.seconds,
+                                 args.fec, args.password)
+        total_links = sum(report[1] for report in reports)
+        cores = min(processes, available)
+        load = sum(report[2] for report in reports) / len(reports)
+        late = sum(report[3] for report in reports)
+        blocks = sum(report[4] for report in reports)
+        print(f"{processes:>8} {total_links:>6} {total_links / cores:>11.1f} {load * 100:>10.0f}% "
+              f"{late / blocks * 100:>11.2f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Startup benchmark for the PRO apps.
+
+Reports the slowest imports from `python -X importtime` and the time from process
+launch until the main window is mapped (time-to-window). Time-to-window needs a
+display; on a headless box run it under xvfb-run.
+
+    python benchmarks/startup_benchmark.py --app sender --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APPS = {
+    'sender': ('mpx_sender_pro', 'MPXSenderPro'),
+    'receiver': ('mpx_receiver_pro', 'MPXReceiverPro'),
+}
+
+WINDOW_PROBE = """
+import sys, time, tkinter as tk
+from {module} import {cls}
+root = tk.Tk()
+app = {cls}(root)
+def mapped(event):
+    if event.widget is root:
+        print(time.time(), flush=True)
+        root.after(0, app.on_closing)
+root.bind('<Map>', mapped)
+root.mainloop()
+"""
+
+
+def import_times(module: str):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Nesting depth is encoded as two spaces per level after the separator
+        entries.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def time_to_window(module: str, cls: str) -> float:
+    started = time.time()
+    result = subprocess.run([sys.executable, '-c', WINDOW_PROBE.format(module=module, cls=cls)],
+                            cwd=ROOT, capture_output=True, text=True, timeout=60)
+    if result.returncode != 0 or not result.stdout.strip():
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'window never mapped')
+    return (float(result.stdout.split()[0]) - started) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure PRO app import cost and time-to-window')
+    parser.add_argument('--app', choices=sorted(APPS), default='sender')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='number of slowest direct imports to list')
+    args = parser.parse_args()
+
+    module, cls = APPS[args.app]
+
+    entries = import_times(module)
+    total = next((cumulative for name, _, cumulative in entries if name == module), 0)
+    direct = [entry for entry in entries if entry[0].startswith('  ') and not entry[0].startswith('    ')]
+    print(f"import {module}: {total / 1000.0:.1f} ms cumulative")
+    for name, _, cumulative in sorted(direct, key=lambda entry: entry[2], reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000.0:>8.1f} ms  {name.strip()}")
+
+    deferred = [name for name in ('numpy', 'sounddevice', 'supabase', 'cryptography')
+                if any(entry[0].strip() == name for entry in entries)]
+    print(f"heavy modules loaded at import: {', '.join(deferred) if deferred else 'none'}")
+
+    if not os.environ.get('DISPLAY') and sys.platform.startswith('linux'):
+        print("time-to-window: skipped (no DISPLAY)")
+        return
+
+    samples = []
+    for _ in range(args.runs):
+        try:
+            samples.append(time_to_window(module, cls))
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            print(f"time-to-window: failed ({e})")
+            return
+
+    print(f"time-to-window over {len(samples)} runs: median {statistics.median(samples):.1f} ms, "
+          f"min {min(samples):.1f} ms, max {max(samples):.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+from __future__ import annotations
+import csv
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from lazy_import import lazy_import
+from audio_recorder import WavWriter
+
+np = lazy_import('numpy')
+
+# Packet ring record; a NumPy dtype spec, left as plain data so importing this module does not load NumPy
+PACKET_FIELDS = [
+    ('time_ns', 'i8'),      # send or arrival time, monotonic
+    ('sequence', 'i8'),
+    ('capture_ts', 'i8'),
+    ('size', 'i4'),
+    ('generation', 'i2'),
+    ('dropped', 'i2'),      # sender: policed; receiver: no usable format announcement
+    ('frame', 'i8')         # audio frame position in the ring when the packet was seen
+]
+
+
+class BlackBox:
+    """
+    Retroactive recorder: keeps the last `seconds` of processed audio and the
+    metadata of the packets sent or received in fixed-size rings.
+
+    write() and add_packet() are called from the audio and network paths and
+    only copy into preallocated arrays; nothing is locked, the dump path
+    detects and trims anything overwritten while it copied.
+
+    trigger() schedules a dump of `pre_seconds` (by default all the ring can
+    hold) before and `post_seconds` after the trigger to `dump_dir`:
+    <name>_<time>_<reason>.wav, .packets.csv and .json with the trigger reasons.
+    Triggers arriving while a dump is pending join it.
+    """
+
+    def __init__(self, samplerate: int, channels: int, seconds: float = 60.0, pre_seconds: Optional[float] = None,
+                 post_seconds: float = 10.0, dump_dir: str = 'blackbox', name: str = 'link',
+                 packet_capacity: Optional[int] = None):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.capacity = max(1, int(seconds * samplerate))
+        # The ring must still hold the pre-trigger window when the post-trigger window is complete
+        self.post_frames = min(self.capacity, int(post_seconds * samplerate))
+        self.pre_frames = self.capacity - self.post_frames
+        if pre_seconds is not None:
+            self.pre_frames = min(self.pre_frames, int(pre_seconds * samplerate))
+        self.dump_dir = dump_dir
+        self.name = name
+
+        self.audio = np.zeros((self.capacity, channels), dtype=np.int16)
+        self.frames_written = 0
+        # Room for one packet per 64 frames, more than any practical packet size produces
+        self.packets = np.zeros(packet_capacity or max(1024, self.capacity // 64), dtype=PACKET_FIELDS)
+        self.packets_written = 0
+
+        self.lock = threading.Lock()
+        self.pending: Optional[Dict] = None
+        self.dumps: List[str] = []
+        self.stop_event = threading.Event()
+
+    def write(self, block: np.ndarray):
+        if block.ndim == 1:
+            block = block.reshape(-1, 1)
+        if block.shape[1] != self.channels:
+            block = (np.repeat(block[:, :1], self.channels, axis=1) if block.shape[1] < self.channels
+                     else block[:, :self.channels])
+
+        count = len(block)
+        if count > self.capacity:
+            block = block[-self.capacity:]
+            self.frames_written += count - self.capacity
+            count = self.capacity
+
+        start = self.frames_written % self.capacity
+        first = min(count, self.capacity - start)
+        self.audio[start:start + first] = block[:first]
+        if first < count:
+            self.audio[:count - first] = block[first:]
+        self.frames_written += count
+
+    def add_packet(self, time_ns: int, sequence: int, capture_ts: Optional[int], size: int,
+                   generation: int = 0, dropped: bool = False):
+        self.packets[self.packets_written % len(self.packets)] = (
+            time_ns, sequence, capture_ts or 0, size, generation, dropped, self.frames_written)
+        self.packets_written += 1
+
+    def trigger(self, reason: str, details: Optional[Dict] = None) -> bool:
+        """Schedule a dump around now; returns False if it joined one already pending."""
+        event = {'timestamp': datetime.now().isoformat(), 'reason': reason, 'details': details or {}}
+        with self.lock:
+            if self.pending is not None:
+                self.pending['triggers'].append(event)
+                return False
+            self.pending = {'frame': self.frames_written, 'triggers': [event]}
+            # A stop() that flushed an earlier dump must not cut this one's post-trigger window short
+            self.stop_event.clear()
+
+        threading.Thread(target=self._dump_when_ready, daemon=True).start()
+        return True
+
+    def stop(self):
+        """Write out a pending dump now instead of waiting for its post-trigger window."""
+        self.stop_event.set()
+
+    def _dump_when_ready(self):
+        end = self.pending['frame'] + self.post_frames
+        # Audio may stop flowing (that is often why we were triggered): give up waiting after twice the window
+        deadline = time.monotonic() + 2 * self.post_frames / self.samplerate + 1.0
+        while self.frames_written < end and time.monotonic() < deadline:
+            if self.stop_event.wait(0.1):
+                break
+
+        with self.lock:
+            pending, self.pending = self.pending, None
+        try:
+            path = self.dump(pending)
+        except OSError:
+            return
+        if path is not None:
+            self.dumps.append(path)
+
+    def snapshot(self, start: int, end: int):
+        """Copy audio frames [start, end) and the packets seen in that range still held by the rings."""
+        written = self.frames_written
+        end = min(end, written)
+        start = max(start, written - self.capacity)
+        if end <= start:
+            return start, np.zeros((0, self.channels), dtype=np.int16), self.packets[:0]
+
+        indices = np.arange(start, end) % self.capacity
+        audio = self.audio[indices]
+        # Anything the audio path overwrote while we copied is no longer the frame we wanted
+        overwritten = self.frames_written - self.capacity - start
+        if overwritten > 0:
+            audio = audio[overwritten:]
+            start += overwritten
+
+        packets_written = self.packets_written
+        held = min(packets_written, len(self.packets))
+        packets = np.roll(self.packets, -(packets_written % len(self.packets)))[-held:] if held else self.packets[:0]
+        packets = packets[(packets['frame'] >= start) & (packets['frame'] < end)]
+        return start, audio, packets
+
+    def dump(self, pending: Optional[Dict] = None) -> Optional[str]:
+        """Write the window around `pending` (or the whole ring, on demand); returns the .wav path."""
+        if pending is None:
+            pending = {'frame': self.frames_written, 'triggers': [
+                {'timestamp': datetime.now().isoformat(), 'reason': 'manual', 'details': {}}]}
+            start, end = pending['frame'] - self.capacity, pending['frame']
+        else:
+            start, end = pending['frame'] - self.pre_frames, pending['frame'] + self.post_frames
+
+        start, audio, packets = self.snapshot(start, end)
+        if not len(audio):
+            return None
+
+        os.makedirs(self.dump_dir, exist_ok=True)
+        reason = re.sub(r'[^a-z0-9]+', '_', pending['triggers'][0]['reason'].lower()).strip('_')
+        base = os.path.join(self.dump_dir,
+                            f"{self.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{reason or 'dump'}")
+
+        writer = WavWriter(base + '.wav', self.channels, self.samplerate, preallocate_bytes=0)
+        writer.write(audio.tobytes())
+        path = writer.close()
+
+        with open(base + '.packets.csv', 'w', newline='') as f:
+            out = csv.writer(f)
+            out.writerow([name for name, _ in PACKET_FIELDS])
+            out.writerows(packets.tolist())
+
+        with open(base + '.json', 'w') as f:
+            json.dump({
+                'link': self.name,
+                'samplerate': self.samplerate,
+                'channels': self.channels,
+                'trigger_offset_s': (pending['frame'] - start) / self.samplerate,
+                'duration_s': len(audio) / self.samplerate,
+                'packets': len(packets),
+                'triggers': pending['triggers']
+            }, f, indent=2, default=str)
+        return path
@@ -0,0 +1,49 @@
+import threading
+from collections import deque
+from typing import Optional
+
+
+class ClockSync:
+    """
+    NTP-style offset estimator between the local and the remote monotonic clock.
+
+    Each ping/pong exchange yields an (rtt, offset) sample; the sample with the
+    smallest round trip is the least disturbed by queueing, so its offset wins.
+    """
+
+    def __init__(self, window: int = 16):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.offset_ns: Optional[int] = None
+        self.rtt_ns: Optional[int] = None
+
+    def add_sample(self, t1_ns: int, t2_ns: int, t3_ns: int, t4_ns: int) -> Optional[int]:
+        rtt = (t4_ns - t1_ns) - (t3_ns - t2_ns)
+        if rtt < 0:
+            return None
+
+        offset = ((t2_ns - t1_ns) + (t3_ns - t4_ns)) // 2
+
+        with self.lock:
+            self.samples.append((rtt, offset))
+            best_rtt, best_offset = min(self.samples)
+            self.rtt_ns = best_rtt
+            self.offset_ns = best_offset
+
+        return rtt
+
+    @property
+    def synchronized(self) -> bool:
+        return self.offset_ns is not None
+
+    def to_local(self, remote_ns: int) -> Optional[int]:
+        offset = self.offset_ns
+        if offset is None:
+            return None
+        return remote_ns - offset
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.offset_ns = None
+            self.rtt_ns = None
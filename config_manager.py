@@ -1,6 +1,136 @@
+import ctypes
+import ctypes.util
 import json
 import os
-from typing import Dict, List, Optional
+import select
+import shutil
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class ConfigError(ValueError):
+    pass
+
+
+class ConfigField:
+    """Type and range of one config.json setting; validate() returns the value or raises ConfigError."""
+
+    def __init__(self, kind: type, default, choices: Optional[Tuple] = None, minimum: Optional[float] = None,
+                 maximum: Optional[float] = None):
+        self.kind = kind
+        self.default = default
+        self.choices = choices
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def validate(self, name: str, value):
+        # JSON has no int/float distinction for whole numbers and bool is an int subclass
+        if self.kind is float and isinstance(value, int) and not isinstance(value, bool):
+            value = float(value)
+        if not isinstance(value, self.kind) or (self.kind is not bool and isinstance(value, bool)):
+            raise ConfigError(f"{name}: expected {self.kind.__name__}, got {value!r}")
+        if self.choices is not None and value not in self.choices:
+            raise ConfigError(f"{name}: must be one of {', '.join(map(str, self.choices))}, got {value!r}")
+        if self.minimum is not None and value < self.minimum:
+            raise ConfigError(f"{name}: must be at least {self.minimum}, got {value!r}")
+        if self.maximum is not None and value > self.maximum:
+            raise ConfigError(f"{name}: must be at most {self.maximum}, got {value!r}")
+        return value
+
+
+CONFIG_SCHEMA: Dict[str, ConfigField] = {
+    'host': ConfigField(str, '127.0.0.1'),
+    'port': ConfigField(int, 5000, minimum=1, maximum=65535),
+    'protocol': ConfigField(str, 'TCP', choices=('TCP', 'UDP')),
+    'samplerate': ConfigField(int, 192000, minimum=8000, maximum=768000),
+    'blocksize': ConfigField(int, 1024, minimum=16, maximum=65536),
+    'device': ConfigField(str, ''),
+    'agc_enabled': ConfigField(bool, False),
+    'limiter_enabled': ConfigField(bool, False),
+    'encryption_enabled': ConfigField(bool, False),
+    'password': ConfigField(str, ''),
+    'shared_secret': ConfigField(str, ''),
+    'fec_enabled': ConfigField(bool, False),
+    'auto_reconnect': ConfigField(bool, True),
+    'reconnect_interval': ConfigField(float, 2.0, minimum=0.1, maximum=3600),
+    # kbit/s of audio payload the sender may emit; 0 = unlimited
+    'bandwidth_limit': ConfigField(int, 0, minimum=0),
+    'theme': ConfigField(str, 'light'),
+    'system_tray': ConfigField(bool, True),
+    'metrics_enabled': ConfigField(bool, False),
+    'metrics_bind': ConfigField(str, '127.0.0.1'),
+    'metrics_port': ConfigField(int, 9464, minimum=1, maximum=65535),
+    'history_dir': ConfigField(str, 'history'),
+    'telemetry_spool': ConfigField(str, 'telemetry_spool.db'),
+    'telemetry_batch_size': ConfigField(int, 50, minimum=1),
+    'telemetry_batch_interval': ConfigField(float, 5.0, minimum=0.1),
+    'preset_db': ConfigField(str, 'presets.db'),
+    'record_dir': ConfigField(str, 'recordings'),
+    # Recordings roll over to a new file every this many minutes; 0 = one file per recording
+    'record_segment_minutes': ConfigField(float, 60.0, minimum=0),
+    'record_compress': ConfigField(bool, True),
+    'record_compress_nice': ConfigField(int, 19, minimum=0, maximum=19),
+    # Comma-separated CPUs the compression worker may use; empty = any
+    'record_compress_cpus': ConfigField(str, ''),
+    # Retention of finished recordings; 0 = keep
+    'record_max_age_days': ConfigField(float, 0.0, minimum=0),
+    'record_max_gb': ConfigField(float, 0.0, minimum=0)
+}
+
+
+def validate_config(data: Dict, base: Dict) -> Tuple[Dict, List[str]]:
+    """
+    Merge `data` over `base`, validating known keys against CONFIG_SCHEMA.
+    Invalid values keep the base value and are reported; unknown keys are kept as is.
+    """
+    if not isinstance(data, dict):
+        return dict(base), [f"expected an object, got {type(data).__name__}"]
+
+    config = dict(base)
+    errors = []
+    for key, value in data.items():
+        field = CONFIG_SCHEMA.get(key)
+        if field is None:
+            config[key] = value
+            continue
+        try:
+            config[key] = field.validate(key, value)
+        except ConfigError as e:
+            errors.append(str(e))
+    return config, errors
+
+
+def diff_config(old: Dict, new: Dict) -> Dict[str, Tuple]:
+    """{key: (old value, new value)} for every key whose value differs; missing values are None."""
+    return {key: (old.get(key), new.get(key)) for key in set(old) | set(new) if old.get(key) != new.get(key)}
+
+
+def atomic_write_json(path: str, data, indent: int = 2):
+    """
+    Write JSON so readers see either the old or the new file, never a partial one:
+    temp file in the same directory, fsync, rename over `path`, fsync the directory.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
 
 
 class ConfigPreset:
@@ -20,32 +150,44 @@ class ConfigPreset:
 
 
 class ConfigManager:
+    """
+    config.json with schema validation, atomic saves and change notification.
+
+    Subscribers get a diff {key: (old, new)} whenever the config changes, whether
+    through set()/update() or because the file was edited externally and picked up
+    by start_watching(). Validation problems are kept in `errors` instead of
+    silently resetting to defaults; an unreadable file is copied to
+    <config_file>.invalid before anything overwrites it.
+    """
+
     def __init__(self, config_file: str = "config.json"):
         self.config_file = config_file
         self.presets: Dict[str, ConfigPreset] = {}
         self.current_config: Dict = self._default_config()
+        self.errors: List[str] = []
+        self.lock = threading.RLock()
+        self.subscribers: List[Callable[[Dict[str, Tuple]], None]] = []
+        self.watcher: Optional[ConfigWatcher] = None
         self.load()
 
     def _default_config(self) -> Dict:
-        return {
-            'host': '127.0.0.1',
-            'port': 5000,
-            'protocol': 'TCP',
-            'samplerate': 192000,
-            'blocksize': 1024,
-            'device': '',
-            'agc_enabled': False,
-            'limiter_enabled': False,
-            'encryption_enabled': False,
-            'password': '',
-            'shared_secret': '',
-            'fec_enabled': False,
-            'auto_reconnect': True,
-            'reconnect_interval': 2,
-            'bandwidth_limit': 0,
-            'theme': 'light',
-            'system_tray': True
-        }
+        return {name: field.default for name, field in CONFIG_SCHEMA.items()}
+
+    def subscribe(self, callback: Callable[[Dict[str, Tuple]], None]):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Dict[str, Tuple]], None]):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def _notify(self, changes: Dict[str, Tuple]):
+        if not changes:
+            return
+        for callback in list(self.subscribers):
+            try:
+                callback(changes)
+            except Exception:
+                pass
 
     def save_preset(self, name: str, config: Dict = None):
         if config is None:
@@ -55,10 +197,12 @@ class ConfigManager:
         self.save()
 
     def load_preset(self, name: str) -> Optional[Dict]:
-        if name in self.presets:
-            self.current_config = self.presets[name].config.copy()
-            return self.current_config
-        return None
+        if name not in self.presets:
+            return None
+
+        config, self.errors = validate_config(self.presets[name].config, self._default_config())
+        self._replace(config)
+        return self.current_config
 
     def delete_preset(self, name: str):
         if name in self.presets:
@@ -69,37 +213,221 @@ class ConfigManager:
         return list(self.presets.keys())
 
     def save(self):
-        data = {
-            'current': self.current_config,
-            'presets': {name: preset.to_dict() for name, preset in self.presets.items()}
-        }
+        with self.lock:
+            data = {
+                'current': self.current_config,
+                'presets': {name: preset.to_dict() for name, preset in self.presets.items()}
+            }
+            atomic_write_json(self.config_file, data)
+
+    def _read(self, base: Dict) -> Tuple[Dict, Dict[str, ConfigPreset], List[str]]:
+        """Parse the file; invalid values fall back to the value in `base`."""
+        with open(self.config_file, 'r') as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ConfigError(f"{self.config_file}: expected an object")
 
-        with open(self.config_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        config, errors = validate_config(data.get('current', {}), base)
+        presets = {}
+        for name, preset_data in data.get('presets', {}).items():
+            try:
+                presets[name] = ConfigPreset.from_dict(preset_data)
+            except (KeyError, TypeError):
+                errors.append(f"preset {name!r}: malformed")
+        return config, presets, errors
 
     def load(self):
         if not os.path.exists(self.config_file):
             return
 
         try:
-            with open(self.config_file, 'r') as f:
-                data = json.load(f)
+            config, presets, errors = self._read(self._default_config())
+        except (OSError, ValueError) as e:
+            self.errors = [f"{self.config_file}: {e}"]
+            # Keep the broken file for inspection before a later save() replaces it
+            try:
+                shutil.copyfile(self.config_file, self.config_file + '.invalid')
+            except OSError:
+                pass
+            return
 
-            self.current_config = data.get('current', self._default_config())
+        with self.lock:
+            self.current_config = config
+            self.presets = presets
+            self.errors = errors
 
-            presets_data = data.get('presets', {})
-            self.presets = {
-                name: ConfigPreset.from_dict(preset_data)
-                for name, preset_data in presets_data.items()
-            }
-        except Exception:
-            pass
+    def reload(self) -> Dict[str, Tuple]:
+        """Re-read the file after an external change; returns (and notifies) the diff."""
+        if not os.path.exists(self.config_file):
+            return {}
+
+        try:
+            # An invalid external edit keeps the running value rather than reverting it to the default
+            with self.lock:
+                base = dict(self.current_config)
+            config, presets, errors = self._read(base)
+        except (OSError, ValueError) as e:
+            # Possibly caught mid-write by a non-atomic editor; the next event brings the final version
+            self.errors = [f"{self.config_file}: {e}"]
+            return {}
+
+        with self.lock:
+            self.presets = presets
+            self.errors = errors
+        return self._replace(config)
+
+    def _replace(self, config: Dict) -> Dict[str, Tuple]:
+        with self.lock:
+            changes = diff_config(self.current_config, config)
+            self.current_config = config
+        self._notify(changes)
+        return changes
 
     def get(self, key: str, default=None):
         return self.current_config.get(key, default)
 
     def set(self, key: str, value):
-        self.current_config[key] = value
+        field = CONFIG_SCHEMA.get(key)
+        if field is not None:
+            value = field.validate(key, value)
+        self.update({key: value})
+
+    def update(self, values: Dict) -> Dict[str, Tuple]:
+        config, errors = validate_config(values, self.current_config)
+        if errors:
+            raise ConfigError('; '.join(errors))
+        return self._replace(config)
 
     def reset_to_defaults(self):
-        self.current_config = self._default_config()
+        self._replace(self._default_config())
+
+    def start_watching(self, poll_interval: float = 0.5):
+        if self.watcher is None:
+            self.watcher = ConfigWatcher(self.config_file, self.reload, poll_interval=poll_interval)
+            self.watcher.start()
+
+    def stop_watching(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+
+class _Inotify:
+    """Minimal inotify(7) binding over ctypes; raises OSError or AttributeError where unavailable."""
+
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        # Watch the directory: an atomic rename replaces the file's inode
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def read(self, timeout: float) -> List[str]:
+        """Names touched in the directory, waiting up to `timeout` seconds for the first event."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+
+        names = []
+        offset = 0
+        while offset + self.EVENT.size <= len(data):
+            _, _, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            names.append(os.fsdecode(data[offset:offset + length].rstrip(b'\0')))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ConfigWatcher:
+    """
+    Calls `on_change()` from a background thread when the file at `path` changes.
+
+    Uses inotify on Linux and falls back to polling the file's mtime/size/inode
+    every `poll_interval` seconds elsewhere. Bursts of events (editors writing in
+    several steps) are collapsed by waiting `debounce` seconds before reading the
+    file, so a change is picked up well within a second either way.
+    """
+
+    def __init__(self, path: str, on_change: Callable[[], None], poll_interval: float = 0.5,
+                 debounce: float = 0.05):
+        self.path = os.path.abspath(path)
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.mode = None
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _worker(self):
+        directory, name = os.path.split(self.path)
+        try:
+            inotify = _Inotify(directory)
+            self.mode = 'inotify'
+        except (OSError, AttributeError):
+            inotify = None
+            self.mode = 'poll'
+
+        last = self._signature()
+        try:
+            while not self.stop_event.is_set():
+                if inotify is not None:
+                    if name not in inotify.read(self.poll_interval):
+                        continue
+                    time.sleep(self.debounce)
+                    while inotify.read(0):
+                        pass
+                elif self.stop_event.wait(self.poll_interval):
+                    break
+
+                signature = self._signature()
+                if signature == last:
+                    continue
+                last = signature
+
+                try:
+                    self.on_change()
+                except Exception:
+                    pass
+        finally:
+            if inotify is not None:
+                inotify.close()
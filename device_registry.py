@@ -0,0 +1,408 @@
+import multiprocessing
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from lazy_import import lazy_import
+
+sd = lazy_import('sounddevice')
+
+
+class AudioDevice:
+    def __init__(self, index: int, name: str, hostapi: str, max_input_channels: int,
+                 max_output_channels: int, default_samplerate: float):
+        self.index = index
+        self.name = name
+        self.hostapi = hostapi
+        self.max_input_channels = max_input_channels
+        self.max_output_channels = max_output_channels
+        self.default_samplerate = default_samplerate
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        # Indices shift when devices come and go; name + host API identifies a device across replugs
+        return self.name, self.hostapi
+
+    @property
+    def label(self) -> str:
+        return f"{self.index}: {self.name}"
+
+    def supports(self, kind: str) -> bool:
+        channels = self.max_input_channels if kind == 'input' else self.max_output_channels
+        return channels > 0
+
+    def to_dict(self) -> Dict:
+        return {
+            'index': self.index,
+            'name': self.name,
+            'hostapi': self.hostapi,
+            'max_input_channels': self.max_input_channels,
+            'max_output_channels': self.max_output_channels,
+            'default_samplerate': self.default_samplerate
+        }
+
+
+class DeviceRegistry:
+    """
+    Cached PortAudio device list.
+
+    The list is queried once and reused until rescan(). PortAudio only sees
+    hot-plugged devices after it is re-initialised, which also kills every open
+    stream, so rescan() must only run while this process has no stream open;
+    DeviceWatcher takes care of that.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._devices: Optional[List[AudioDevice]] = None
+
+    def devices(self, refresh: bool = False) -> List[AudioDevice]:
+        with self.lock:
+            if refresh or self._devices is None:
+                self._devices = self._query()
+            return list(self._devices)
+
+    def rescan(self) -> Tuple[List[AudioDevice], List[AudioDevice]]:
+        """Re-initialise PortAudio and return the (added, removed) devices."""
+        with self.lock:
+            before = {device.key: device for device in self._devices or []}
+            sd._terminate()
+            sd._initialize()
+            self._devices = self._query()
+            after = {device.key: device for device in self._devices}
+
+        added = [device for key, device in after.items() if key not in before]
+        removed = [device for key, device in before.items() if key not in after]
+        return added, removed
+
+    def _query(self) -> List[AudioDevice]:
+        hostapis = [hostapi['name'] for hostapi in sd.query_hostapis()]
+        return [
+            AudioDevice(index, info['name'], hostapis[info['hostapi']], info['max_input_channels'],
+                        info['max_output_channels'], info['default_samplerate'])
+            for index, info in enumerate(sd.query_devices())
+        ]
+
+    def labels(self, kind: str) -> List[str]:
+        return [device.label for device in self.devices() if device.supports(kind)]
+
+    def resolve(self, label: str, kind: str) -> AudioDevice:
+        """Map a combobox label ("index: name") to the cached device."""
+        index = int(label.split(':')[0])
+        for device in self.devices():
+            if device.index == index and device.supports(kind):
+                return device
+        raise ValueError(f"Audio device not found: {label}")
+
+    def lookup(self, spec: Optional[str], kind: str) -> AudioDevice:
+        """
+        Resolve a device given as a label, an index or (part of) a name; an empty
+        spec picks the first device of the right kind.
+        """
+        candidates = [device for device in self.devices() if device.supports(kind)]
+        if not spec:
+            if not candidates:
+                raise ValueError(f"No {kind} audio devices found")
+            return candidates[0]
+
+        try:
+            return self.resolve(str(spec), kind)
+        except ValueError:
+            pass
+
+        spec = str(spec).lower()
+        for device in candidates:
+            if device.name.lower() == spec:
+                return device
+        for device in candidates:
+            if spec in device.name.lower():
+                return device
+        raise ValueError(f"Audio device not found: {spec}")
+
+    def find(self, key: Tuple[str, str], kind: str) -> Optional[AudioDevice]:
+        for device in self.devices():
+            if device.key == key and device.supports(kind):
+                return device
+        return None
+
+
+def list_device_keys() -> List[Tuple[str, str]]:
+    """Runs in the probe process: the (name, host API) of every device a fresh PortAudio sees."""
+    hostapis = [hostapi['name'] for hostapi in sd.query_hostapis()]
+    return [(info['name'], hostapis[info['hostapi']]) for info in sd.query_devices()]
+
+
+def probe_device_keys(timeout: float = 10.0) -> Optional[Set[Tuple[str, str]]]:
+    """
+    Enumerate devices in a short-lived spawned process, which sees hot-plugged
+    devices without re-initialising PortAudio (and killing the streams) in this
+    one. None if the probe failed.
+    """
+    context = multiprocessing.get_context('spawn')
+    try:
+        with context.Pool(1) as pool:
+            return set(pool.apply_async(list_device_keys).get(timeout))
+    except Exception:
+        return None
+
+
+class _Attachment:
+    def __init__(self, device: AudioDevice, kind: str, open_stream: Callable,
+                 heartbeat: Optional[Callable[[], Optional[int]]]):
+        self.device = device
+        self.kind = kind
+        self.open_stream = open_stream
+        self.heartbeat = heartbeat
+        self.stream = None
+        self.opened_ns = 0
+        self.lost_at: Optional[float] = None
+        # Closed only because a rescan for another stream was about to kill it
+        self.suspended = False
+        self.recoveries = 0
+
+
+class DeviceWatcher:
+    """
+    Keeps audio streams alive across device dropouts.
+
+    Each attached stream is checked every `interval` seconds. If it is no longer
+    active, or its callback has not run for `stall_timeout` seconds, it is closed
+    and `open_stream` is called again for the device with the same name and host
+    API, from the cached device list on every check (enough after a stall) and
+    after rescanning PortAudio once the device is back. Attempts continue for up
+    to `recover_timeout` seconds; the caller's network session is left alone, so
+    the far end only sees a gap. With no stream attached, devices are probed
+    every `scan_interval` seconds or on request_scan(); PortAudio is only
+    rescanned when the probe shows a change, and additions/removals are reported
+    to `on_devices_changed`.
+
+    Several streams can be attached under different keys (one per link). A rescan
+    re-initialises PortAudio for the whole process and kills every open stream,
+    so while other streams are healthy the lost device is looked for with
+    probe_device_keys() every `probe_interval` seconds instead, and PortAudio is
+    rescanned only once the probe reports it back. The healthy streams are then
+    closed and reopened around that single rescan; they see a short gap but no
+    events. With no healthy stream open, the rescan runs on every check.
+
+    `on_event(event, device, details)` is called with 'lost', 'recovered' and
+    'failed'; `details['link']` holds the key. Both callbacks run on the watcher
+    thread.
+    """
+
+    def __init__(self, registry: DeviceRegistry, interval: float = 0.5, stall_timeout: float = 1.0,
+                 recover_timeout: float = 15.0, scan_interval: float = 10.0, probe_interval: float = 2.0,
+                 on_devices_changed: Optional[Callable[[List[AudioDevice], List[AudioDevice]], None]] = None,
+                 on_event: Optional[Callable[[str, AudioDevice, Dict], None]] = None):
+        self.registry = registry
+        self.interval = interval
+        self.stall_timeout = stall_timeout
+        self.recover_timeout = recover_timeout
+        self.scan_interval = scan_interval
+        self.probe_interval = probe_interval
+        self.on_devices_changed = on_devices_changed
+        self.on_event = on_event
+
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        self.attachments: Dict[str, _Attachment] = {}
+        # Next device probe while a stream is lost and others are still playing
+        self.next_probe: Optional[float] = None
+        self.scan_requested = False
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def request_scan(self):
+        """Look for added or removed devices now rather than at the next `scan_interval`."""
+        self.scan_requested = True
+        self.wakeup.set()
+
+    def attach(self, device: AudioDevice, kind: str, open_stream: Callable,
+               heartbeat: Optional[Callable[[], Optional[int]]] = None, key: str = 'default'):
+        """
+        Open a stream with open_stream(device) and supervise it under `key`.
+        `heartbeat` returns the time.perf_counter_ns() of the last callback, or None.
+        """
+        with self.lock:
+            attachment = _Attachment(device, kind, open_stream, heartbeat)
+            self._open(attachment, device)
+            self.attachments[key] = attachment
+        return attachment.stream
+
+    def detach(self, key: str = 'default'):
+        """Stop supervising; the caller closes its stream."""
+        with self.lock:
+            self.attachments.pop(key, None)
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return {key: {
+                'device': attachment.device.to_dict(),
+                'recovering': attachment.lost_at is not None,
+                'recoveries': attachment.recoveries
+            } for key, attachment in self.attachments.items()}
+
+    def _worker(self):
+        last_scan = time.monotonic()
+
+        while self.running:
+            with self.lock:
+                attached = bool(self.attachments)
+
+            if attached:
+                self._check()
+            elif self.scan_requested or time.monotonic() - last_scan >= self.scan_interval:
+                self.scan_requested = False
+                self._scan()
+                last_scan = time.monotonic()
+
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+    def _healthy(self, attachment: _Attachment) -> bool:
+        try:
+            if not attachment.stream.active:
+                return False
+        except Exception:
+            return False
+
+        last = attachment.opened_ns
+        if attachment.heartbeat is not None:
+            beat = attachment.heartbeat()
+            if beat is not None and beat > last:
+                last = beat
+        return time.perf_counter_ns() - last < self.stall_timeout * 1e9
+
+    def _check(self):
+        events = []
+        with self.lock:
+            now = time.monotonic()
+            for key, attachment in self.attachments.items():
+                if attachment.lost_at is None and not self._healthy(attachment):
+                    self._close(attachment.stream)
+                    attachment.stream = None
+                    attachment.lost_at = now
+                    events.append(('lost', key, attachment.device, {}))
+
+            lost = {key: attachment for key, attachment in self.attachments.items() if attachment.lost_at is not None}
+            healthy = len(lost) < len(self.attachments)
+
+        for event in events:
+            self._emit(*event)
+        if not lost:
+            self.next_probe = None
+            return
+
+        rescan = not healthy
+        if healthy:
+            # Outside the lock: the probe takes a moment and the healthy streams keep being watched meanwhile
+            now = time.monotonic()
+            if self.next_probe is None:
+                self.next_probe = now + self.probe_interval
+            elif now >= self.next_probe:
+                present = probe_device_keys()
+                self.next_probe = time.monotonic() + self.probe_interval
+                rescan = present is not None and any(attachment.device.key in present
+                                                     for attachment in lost.values())
+
+        events = []
+        with self.lock:
+            if rescan:
+                # Safe to re-initialise PortAudio: every stream is closed and attach() waits on this lock
+                for attachment in self.attachments.values():
+                    if attachment.lost_at is None:
+                        self._close(attachment.stream)
+                        attachment.stream = None
+                        attachment.suspended = True
+
+                try:
+                    self.registry.rescan()
+                except Exception:
+                    pass
+
+            for key, attachment in list(self.attachments.items()):
+                if attachment.lost_at is None and not attachment.suspended:
+                    continue
+                # Without a rescan this retries the cached device, which is enough after a stall
+                replacement = self.registry.find(attachment.device.key, attachment.kind)
+
+                error = 'device not present'
+                if replacement is not None:
+                    try:
+                        self._open(attachment, replacement)
+                    except Exception as e:
+                        error = str(e)
+                    else:
+                        error = None
+
+                if attachment.suspended:
+                    attachment.suspended = False
+                    if error is not None:
+                        attachment.lost_at = time.monotonic()
+                        events.append(('lost', key, attachment.device, {'error': error}))
+                    continue
+
+                if error is None:
+                    gap = time.monotonic() - attachment.lost_at
+                    attachment.device = replacement
+                    attachment.lost_at = None
+                    attachment.recoveries += 1
+                    events.append(('recovered', key, replacement, {'gap_ms': gap * 1000.0,
+                                                                   'index': replacement.index}))
+                    continue
+
+                elapsed = time.monotonic() - attachment.lost_at
+                if elapsed >= self.recover_timeout:
+                    del self.attachments[key]
+                    events.append(('failed', key, attachment.device, {'error': error, 'elapsed_s': elapsed}))
+
+        for event in events:
+            self._emit(*event)
+
+    def _scan(self):
+        # Re-initialising PortAudio holds registry.lock, blocking devices() and lookup(); only do it on a change
+        present = probe_device_keys()
+        if present is None or present == {device.key for device in self.registry.devices()}:
+            return
+
+        with self.lock:
+            if self.attachments:
+                return
+            try:
+                added, removed = self.registry.rescan()
+            except Exception:
+                return
+        if (added or removed) and self.on_devices_changed is not None:
+            try:
+                self.on_devices_changed(added, removed)
+            except Exception:
+                pass
+
+    def _open(self, attachment: _Attachment, device: AudioDevice):
+        attachment.stream = attachment.open_stream(device)
+        attachment.opened_ns = time.perf_counter_ns()
+
+    def _close(self, stream):
+        if stream is None:
+            return
+        try:
+            stream.abort()
+            stream.close()
+        except Exception:
+            pass
+
+    def _emit(self, event: str, key: str, device: AudioDevice, details: Dict):
+        if self.on_event is not None:
+            try:
+                self.on_event(event, device, {**details, 'link': key})
+            except Exception:
+                pass
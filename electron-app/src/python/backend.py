@@ -1,37 +1,43 @@
+import os
 import sys
 import json
-import sounddevice as sd
-import numpy as np
-import socket
 import threading
-import struct
-import time
 import subprocess
 import re
-from collections import deque
+
+# The link engine lives at the repository root in a checkout and next to this file in packaged builds
+_here = os.path.dirname(os.path.abspath(__file__))
+for _path in (_here, os.path.abspath(os.path.join(_here, '..', '..', '..'))):
+    if os.path.exists(os.path.join(_path, 'link_engine.py')) and _path not in sys.path:
+        sys.path.insert(0, _path)
+
+from device_registry import DeviceRegistry
+from link_engine import LinkConfig, MPX_COMPOSITE, STEREO, create_engine
+
+STATS_FIELDS = ('uptime', 'packets_sent', 'packets_received', 'packets_lost', 'packet_loss_rate', 'bitrate',
+                'jitter', 'avg_latency', 'latency_p99', 'avg_glass_to_glass', 'buffer_fill', 'left_db', 'right_db')
+
 
 class AudioBackend:
     def __init__(self):
-        self.is_running = False
-        self.stream = None
-        self.socket_obj = None
-        self.client_socket = None
+        self.engine = None
+        self.devices = DeviceRegistry()
         self.mode = 'sender'
-        self.channel_mode = 'stereo'
-        self.audio_buffer = deque(maxlen=100)
-        self.buffer_lock = threading.Lock()
-        self.sequence_number = 0
-        self.expected_sequence = 0
+        self.stats_stop = threading.Event()
 
         self.config = {
             'sample_rate': 48000,
             'buffer_size': 512,
-            'channels': 2,
+            'protocol': 'TCP',
             'remote_host': '127.0.0.1',
             'remote_port': 5000,
             'local_port': 5000
         }
 
+    @property
+    def is_running(self):
+        return self.engine is not None and self.engine.is_running
+
     def log(self, message):
         print(json.dumps({'type': 'log', 'message': message}), flush=True)
 
@@ -42,16 +48,13 @@ class AudioBackend:
         print(json.dumps({'type': 'stats', 'data': stats}), flush=True)
 
     def get_audio_devices(self):
-        devices = sd.query_devices()
-        device_list = []
-        for idx, dev in enumerate(devices):
-            device_list.append({
-                'id': idx,
-                'name': dev['name'],
-                'channels': dev['max_input_channels'] if self.mode == 'sender' else dev['max_output_channels'],
-                'sample_rate': dev['default_samplerate']
-            })
-        return device_list
+        kind = 'input' if self.mode == 'sender' else 'output'
+        return [{
+            'id': device.index,
+            'name': device.name,
+            'channels': device.max_input_channels if kind == 'input' else device.max_output_channels,
+            'sample_rate': device.default_samplerate
+        } for device in self.devices.devices() if device.supports(kind)]
 
     def get_network_info(self):
         try:
@@ -178,91 +181,38 @@ class AudioBackend:
         return sum([bin(int(x)).count('1') for x in netmask.split('.')])
 
 
-    def audio_callback_sender(self, indata, frames, time_info, status):
-        if status:
-            self.log(f'Audio status: {status}')
-
-        try:
-            audio_data = indata.copy()
-
-            if self.channel_mode == 'mono':
-                audio_data = np.mean(audio_data, axis=1, keepdims=True)
-            elif self.channel_mode == 'stereo' and audio_data.shape[1] > 2:
-                audio_data = audio_data[:, :2]
-
-            packet_data = struct.pack('!I', self.sequence_number)
-            packet_data += audio_data.tobytes()
-
-            if self.client_socket:
-                try:
-                    self.client_socket.sendall(packet_data)
-                    self.sequence_number += 1
-                except Exception as e:
-                    self.error(f'Send error: {e}')
-
-        except Exception as e:
-            self.error(f'Callback error: {e}')
-
-    def audio_callback_receiver(self, outdata, frames, time_info, status):
-        if status:
-            self.log(f'Audio status: {status}')
-
-        try:
-            with self.buffer_lock:
-                if len(self.audio_buffer) > 0:
-                    audio_data = self.audio_buffer.popleft()
-                    outdata[:] = audio_data[:frames]
-                else:
-                    outdata.fill(0)
-        except Exception as e:
-            self.error(f'Callback error: {e}')
-            outdata.fill(0)
-
-    def receive_thread(self):
-        self.log('Receiver thread started')
-
-        try:
-            self.socket_obj = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket_obj.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.socket_obj.bind(('0.0.0.0', self.config['local_port']))
-            self.socket_obj.listen(1)
-
-            self.log(f"Listening on port {self.config['local_port']}")
-
-            conn, addr = self.socket_obj.accept()
-            self.log(f'Connected from {addr}')
-
-            expected_size = self.config['buffer_size'] * self.config['channels'] * 4 + 4
+    def build_link_config(self, config):
+        channel_mode = config.get('channelMode', 'stereo')
+        if channel_mode not in ('mono', 'stereo'):
+            raise ValueError(f'Unsupported channel mode: {channel_mode}')
 
-            while self.is_running:
-                try:
-                    packet = conn.recv(expected_size)
-                    if not packet:
-                        break
-
-                    if len(packet) < 4:
-                        continue
-
-                    sequence = struct.unpack('!I', packet[:4])[0]
-                    audio_bytes = packet[4:]
-
-                    audio_data = np.frombuffer(audio_bytes, dtype=np.float32)
-                    audio_data = audio_data.reshape(-1, self.config['channels'])
-
-                    with self.buffer_lock:
-                        self.audio_buffer.append(audio_data)
-
-                except Exception as e:
-                    self.error(f'Receive error: {e}')
-                    break
-
-            conn.close()
-
-        except Exception as e:
-            self.error(f'Socket error: {e}')
-        finally:
-            if self.socket_obj:
-                self.socket_obj.close()
+        protocol = self.config['protocol']
+        if self.mode == 'sender':
+            # TCP senders listen for the receiver; UDP senders push to it
+            host, port = ((self.config['remote_host'], self.config['remote_port']) if protocol == 'UDP'
+                          else ('0.0.0.0', self.config['local_port']))
+            device = config.get('inputDevice')
+        else:
+            host, port = ((self.config['remote_host'], self.config['remote_port']) if protocol == 'TCP'
+                          else ('0.0.0.0', self.config['local_port']))
+            device = config.get('outputDevice')
+
+        return LinkConfig(
+            mode=self.mode,
+            host=host,
+            port=int(port),
+            protocol=protocol,
+            samplerate=int(self.config['sample_rate']),
+            blocksize=int(self.config['buffer_size']),
+            device='' if device is None else str(device),
+            channel_mode=MPX_COMPOSITE if channel_mode == 'mono' else STEREO
+        )
+
+    def stats_thread(self, engine):
+        while not self.stats_stop.wait(1.0):
+            stats = engine.last_stats
+            if stats is not None:
+                self.send_stats({key: stats[key] for key in STATS_FIELDS if key in stats})
 
     def start_stream(self, config):
         if self.is_running:
@@ -271,68 +221,26 @@ class AudioBackend:
 
         self.config.update(config)
         self.mode = config.get('mode', 'sender')
-        self.channel_mode = config.get('channelMode', 'stereo')
-
-        if self.channel_mode == 'mono':
-            self.config['channels'] = 1
-        elif self.channel_mode == 'stereo':
-            self.config['channels'] = 2
-        else:
-            self.config['channels'] = 8
-
-        self.is_running = True
 
         try:
-            if self.mode == 'sender':
-                self.socket_obj = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.socket_obj.connect((self.config['remote_host'], self.config['remote_port']))
-                self.client_socket = self.socket_obj
-
-                self.stream = sd.InputStream(
-                    device=config.get('inputDevice'),
-                    channels=self.config['channels'],
-                    samplerate=self.config['sample_rate'],
-                    blocksize=self.config['buffer_size'],
-                    callback=self.audio_callback_sender
-                )
-
-                self.stream.start()
-                self.log('Sender started')
-
-            else:
-                receive_thread = threading.Thread(target=self.receive_thread, daemon=True)
-                receive_thread.start()
-
-                self.stream = sd.OutputStream(
-                    device=config.get('outputDevice'),
-                    channels=self.config['channels'],
-                    samplerate=self.config['sample_rate'],
-                    blocksize=self.config['buffer_size'],
-                    callback=self.audio_callback_receiver
-                )
-
-                self.stream.start()
-                self.log('Receiver started')
-
+            self.engine = create_engine(self.build_link_config(config), devices=self.devices, history_dir=None,
+                                        on_status=self.log)
+            self.engine.start()
         except Exception as e:
             self.error(f'Start error: {e}')
             self.stop_stream()
+            return
 
-    def stop_stream(self):
-        self.is_running = False
-
-        if self.stream:
-            self.stream.stop()
-            self.stream.close()
-            self.stream = None
+        self.stats_stop.clear()
+        threading.Thread(target=self.stats_thread, args=(self.engine,), daemon=True).start()
+        self.log('Sender started' if self.mode == 'sender' else 'Receiver started')
 
-        if self.client_socket:
-            self.client_socket.close()
-            self.client_socket = None
+    def stop_stream(self):
+        self.stats_stop.set()
 
-        if self.socket_obj:
-            self.socket_obj.close()
-            self.socket_obj = None
+        if self.engine is not None:
+            self.engine.stop()
+            self.engine = None
 
         self.log('Stream stopped')
 
@@ -1,9 +1,32 @@
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import os
 import hashlib
+from functools import lru_cache
+
+
+def _cipher(key: bytes, iv: bytes):
+    # cryptography is imported on first use so the apps start without it
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.backends import default_backend
+
+    return Cipher(algorithms.AES(key), modes.CFB(iv), backend=default_backend())
+
+
+@lru_cache(maxsize=8)
+def _derive_key(password: str) -> bytes:
+    # PBKDF2 costs ~100 ms; caching it keeps password toggles on a running link cheap
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+    salt = b'mpx_audio_salt_v1'
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=100000,
+        backend=default_backend()
+    )
+    return kdf.derive(password.encode())
 
 
 class AudioEncryption:
@@ -16,15 +39,7 @@ class AudioEncryption:
             self.set_password(password)
 
     def set_password(self, password: str):
-        salt = b'mpx_audio_salt_v1'
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-            backend=default_backend()
-        )
-        self.key = kdf.derive(password.encode())
+        self.key = _derive_key(password)
         self.enabled = True
 
     def encrypt(self, data: bytes) -> bytes:
@@ -32,12 +47,7 @@ class AudioEncryption:
             return data
 
         iv = os.urandom(16)
-        cipher = Cipher(
-            algorithms.AES(self.key),
-            modes.CFB(iv),
-            backend=default_backend()
-        )
-        encryptor = cipher.encryptor()
+        encryptor = _cipher(self.key, iv).encryptor()
         encrypted = encryptor.update(data) + encryptor.finalize()
 
         return iv + encrypted
@@ -49,12 +59,7 @@ class AudioEncryption:
         iv = data[:16]
         encrypted = data[16:]
 
-        cipher = Cipher(
-            algorithms.AES(self.key),
-            modes.CFB(iv),
-            backend=default_backend()
-        )
-        decryptor = cipher.decryptor()
+        decryptor = _cipher(self.key, iv).decryptor()
         decrypted = decryptor.update(encrypted) + decryptor.finalize()
 
         return decrypted
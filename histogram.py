@@ -0,0 +1,129 @@
+from __future__ import annotations
+import math
+from typing import Dict, Iterable, Optional
+from lazy_import import lazy_import
+
+np = lazy_import('numpy')
+
+
+DEFAULT_PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+class LogHistogram:
+    """
+    HDR-style log-bucketed histogram with fixed memory and O(1) recording.
+
+    Values are quantized to `unit` and stored in power-of-two buckets, each split
+    into 2**(significant_bits - 1) linear sub-buckets, which bounds the relative
+    error of any reported value to about 2**-(significant_bits - 1).
+    """
+
+    def __init__(self, unit: float = 0.001, highest: float = 60000.0, significant_bits: int = 7):
+        self.unit = unit
+        self.highest = highest
+        self.significant_bits = significant_bits
+        self.sub_bucket_count = 1 << significant_bits
+        self.sub_bucket_half = self.sub_bucket_count >> 1
+        self.max_value = max(int(highest / unit), self.sub_bucket_count)
+
+        bucket_count = max(self.max_value.bit_length() - significant_bits, 0) + 1
+        self.counts = np.zeros((bucket_count + 1) * self.sub_bucket_half, dtype=np.int64)
+        self.total = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, raw: int) -> int:
+        bucket = raw.bit_length() - self.significant_bits
+        if bucket <= 0:
+            return raw
+        return bucket * self.sub_bucket_half + (raw >> bucket)
+
+    def _lower_bounds(self) -> np.ndarray:
+        idx = np.arange(len(self.counts))
+        bucket = np.maximum(idx // self.sub_bucket_half - 1, 0)
+        sub = idx - bucket * self.sub_bucket_half
+        return (sub << bucket).astype(np.float64)
+
+    def _widths(self) -> np.ndarray:
+        idx = np.arange(len(self.counts))
+        bucket = np.maximum(idx // self.sub_bucket_half - 1, 0)
+        return (1 << bucket).astype(np.float64)
+
+    def record(self, value: float):
+        raw = int(value / self.unit)
+        if raw < 0:
+            raw = 0
+        elif raw > self.max_value:
+            raw = self.max_value
+
+        self.counts[self._index(raw)] += 1
+        self.total += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def mean(self) -> float:
+        return self.sum / self.total if self.total else 0.0
+
+    def percentiles(self, percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> Dict[float, float]:
+        percentiles = tuple(percentiles)
+        if self.total == 0:
+            return {p: 0.0 for p in percentiles}
+
+        cumulative = np.cumsum(self.counts)
+        targets = np.ceil(np.array(percentiles) / 100.0 * self.total).clip(1, self.total)
+        indices = np.searchsorted(cumulative, targets)
+        values = (self._lower_bounds()[indices] + self._widths()[indices] / 2.0) * self.unit
+        values = np.clip(values, self.min, self.max)
+
+        return {p: float(v) for p, v in zip(percentiles, values)}
+
+    def percentile(self, percentile: float) -> float:
+        return self.percentiles((percentile,))[percentile]
+
+    def merge(self, other: 'LogHistogram'):
+        self.counts += other.counts
+        self.total += other.total
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def copy(self) -> 'LogHistogram':
+        clone = LogHistogram(self.unit, self.highest, self.significant_bits)
+        clone.merge(self)
+        return clone
+
+    def subtract(self, earlier: 'LogHistogram') -> 'LogHistogram':
+        """Counts recorded since `earlier` was copied from this histogram (min/max stay cumulative)."""
+        delta = self.copy()
+        delta.counts -= earlier.counts
+        delta.total -= earlier.total
+        delta.sum -= earlier.sum
+        return delta
+
+    def reset(self):
+        self.counts.fill(0)
+        self.total = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def summary(self, percentiles: Optional[Iterable[float]] = None) -> Dict:
+        values = self.percentiles(percentiles or DEFAULT_PERCENTILES)
+        summary = {
+            'count': self.total,
+            'mean': self.mean(),
+            'min': self.min if self.total else 0.0,
+            'max': self.max if self.total else 0.0
+        }
+        for p, v in values.items():
+            summary[percentile_key(p)] = v
+        return summary
+
+
+def percentile_key(percentile: float) -> str:
+    """50.0 -> 'p50', 99.9 -> 'p999'."""
+    return 'p' + f"{percentile:g}".replace('.', '')
@@ -60,6 +60,7 @@ apt-get install -y \
     python3-pip \
     python3-numpy \
     python3-sounddevice \
+    flac \
     portaudio19-dev \
     curl \
     wget \
@@ -0,0 +1,39 @@
+import importlib.util
+import sys
+import threading
+from types import ModuleType
+
+
+_lock = threading.Lock()
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Return module `name` without executing it; the real import runs on first
+    attribute access.
+
+    Used for NumPy and sounddevice (which initialises PortAudio on import) so the
+    GUI modules can be imported before the window is shown.
+    """
+    with _lock:
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+
+        spec = importlib.util.find_spec(name)
+        if spec is None:
+            raise ImportError(f"No module named '{name}'", name=name)
+
+        loader = importlib.util.LazyLoader(spec.loader)
+        spec.loader = loader
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        loader.exec_module(module)
+        return module
+
+
+def preload(*names: str):
+    """Finish importing lazily imported modules, e.g. from a background thread before first use."""
+    for name in names:
+        module = sys.modules.get(name) or importlib.import_module(name)
+        getattr(module, '__file__', None)
@@ -0,0 +1,1509 @@
+import json
+import os
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+from lazy_import import lazy_import
+from monitoring import StreamMonitor
+from audio_watchdog import AudioWatchdog
+from audio_processing import AudioProcessor, FFTAnalyzer, PeakHolder, crossfade, fade
+from encryption import AudioEncryption, AuthenticationManager, FECEncoder
+from logging_manager import SessionLogger, AlertSystem
+from audio_recorder import AudioRecorder
+from black_box import BlackBox
+from packet_capture import PacketCapture
+from device_registry import DeviceRegistry, DeviceWatcher
+from timeseries import TimeSeriesStore
+from clock_sync import ClockSync
+from protocol import (PACKET_AUDIO, PACKET_FORMAT, PACKET_PING, PACKET_PONG, TCP_HEADER, StreamFormat,
+                      capture_timestamp_ns, monotonic_ns, playout_timestamp_ns, pack_tcp_frame, pack_udp_frame,
+                      unpack_udp_frame, split_packet_type, pack_ping, unpack_ping, pack_pong, unpack_pong)
+
+np = lazy_import('numpy')
+sd = lazy_import('sounddevice')
+
+STEREO = 'Stereo (L/R)'
+MPX_COMPOSITE = 'MPX Composite'
+CHANNEL_MODES = (STEREO, MPX_COMPOSITE)
+PROTOCOLS = ('TCP', 'UDP')
+
+
+@dataclass
+class LinkConfig:
+    """
+    Settings for one link. The GUIs build it from their widgets, the CLI from
+    arguments or a JSON file; an empty password or shared_secret disables
+    encryption or authentication.
+    """
+    mode: str = 'sender'
+    host: str = '0.0.0.0'
+    port: int = 5000
+    protocol: str = 'TCP'
+    samplerate: int = 192000
+    blocksize: int = 1024
+    device: str = ''
+    channel_mode: str = STEREO
+    agc: bool = False
+    limiter: bool = False
+    password: str = ''
+    shared_secret: str = ''
+    fec: bool = False
+    auto_reconnect: bool = True
+    reconnect_interval: float = 2.0
+    # Sender: kbit/s of audio payload allowed on the wire, 0 = unlimited; packets over the limit are dropped
+    bandwidth_limit: int = 0
+    # Seconds of processed audio and packet metadata kept in memory and dumped on alerts; 0 disables
+    black_box_seconds: float = 60.0
+    black_box_post_seconds: float = 10.0
+    trace: bool = False
+    trace_sample_every: int = 64
+    # Identifies the link in metrics, history and logs; defaults to "<mode>-<port>"
+    name: str = ''
+
+    @property
+    def is_mpx_mode(self) -> bool:
+        return self.channel_mode == MPX_COMPOSITE
+
+    @property
+    def channels(self) -> int:
+        return 1 if self.is_mpx_mode else 2
+
+    def validate(self):
+        if self.mode not in ('sender', 'receiver'):
+            raise ValueError(f"Unknown link mode: {self.mode}")
+        if self.protocol not in PROTOCOLS:
+            raise ValueError(f"Unknown protocol: {self.protocol}")
+        if self.channel_mode not in CHANNEL_MODES:
+            raise ValueError(f"Unknown channel mode: {self.channel_mode}")
+        if not 0 < self.port < 65536:
+            raise ValueError(f"Invalid port: {self.port}")
+        if self.samplerate <= 0 or self.blocksize <= 0:
+            raise ValueError("Sample rate and block size must be positive")
+        if self.reconnect_interval <= 0:
+            raise ValueError(f"Invalid reconnect interval: {self.reconnect_interval}")
+        if self.bandwidth_limit < 0:
+            raise ValueError(f"Invalid bandwidth limit: {self.bandwidth_limit}")
+        if self.black_box_seconds < 0 or self.black_box_post_seconds < 0:
+            raise ValueError("Black box durations must not be negative")
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'LinkConfig':
+        names = {field.name for field in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in names})
+
+    @classmethod
+    def from_file(cls, path: str) -> 'LinkConfig':
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+
+class RateLimiter:
+    """Token bucket policing bytes per second, with `burst` seconds of headroom."""
+
+    def __init__(self, kbps: int, burst: float = 0.2):
+        self.rate = kbps * 1000 / 8
+        self.capacity = max(self.rate * burst, 65536)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def allow(self, size: int) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < size:
+            return False
+        self.tokens -= size
+        return True
+
+
+class LinkPipeline:
+    """Format, cipher and FEC of one format generation; the audio path swaps it whole at a block boundary."""
+
+    def __init__(self, stream_format: StreamFormat, encryption: AudioEncryption, fec: FECEncoder):
+        self.format = stream_format
+        self.encryption = encryption
+        self.fec = fec
+
+
+class LinkEngine(ABC):
+    """
+    GUI-independent base for one audio link.
+
+    start() resolves the config into plain attributes, so the audio callbacks and
+    network threads never read widgets or config objects. A housekeeping thread
+    collects stats every `stats_interval` seconds (history, callback alerts,
+    telemetry, metrics) and keeps the latest snapshot in `last_stats`.
+
+    With stats_interval=None no thread is started and the owner calls
+    collect_stats() itself, as LinkSupervisor does for all of its links.
+
+    Services that outlive a link (alerts, logger, recorder, device registry and
+    watcher, telemetry uploader, metrics exporter) can be passed in and shared;
+    anything not given is created here. `on_status(message)` is called from
+    worker threads.
+
+    reconfigure() changes a running link without reopening the audio stream:
+    processing changes are crossfaded, format changes (`format_fields`) are staged
+    and switched by the audio path at the next block boundary. Fields in
+    `restart_fields` still need stop()/start().
+
+    While running, a BlackBox keeps the last `black_box_seconds` of processed
+    audio and packet metadata; a warning or error alert for this link dumps it
+    to `black_box_dir` with the post-trigger window, as does dump_black_box().
+    start_capture() records the wire frames sent (sender) or received (receiver)
+    to a PacketCapture file that mpx_replay.py can feed back into a receiver.
+    """
+
+    kind = 'sender'
+    device_kind = 'input'
+    restart_fields = ('mode', 'host', 'port', 'device', 'samplerate', 'name', 'black_box_seconds',
+                      'black_box_post_seconds')
+    format_fields = ('password', 'fec', 'channel_mode', 'blocksize', 'protocol')
+
+    def __init__(self, config: LinkConfig, devices: Optional[DeviceRegistry] = None,
+                 device_watcher: Optional[DeviceWatcher] = None, alerts: Optional[AlertSystem] = None,
+                 logger: Optional[SessionLogger] = None, recorder: Optional[AudioRecorder] = None,
+                 supabase=None, telemetry=None, metrics=None, history_dir: Optional[str] = 'history',
+                 black_box_dir: str = 'blackbox', stats_interval: Optional[float] = 1.0,
+                 on_status: Optional[Callable[[str], None]] = None):
+        self.config = config
+        self.devices = devices or DeviceRegistry()
+        self.owns_watcher = device_watcher is None
+        self.device_watcher = device_watcher or DeviceWatcher(self.devices, on_event=self.handle_device_event)
+        self.alerts = alerts or AlertSystem()
+        self.logger = logger or SessionLogger()
+        self.recorder = recorder or AudioRecorder()
+        self.supabase = supabase
+        self.telemetry = telemetry
+        self.metrics = metrics
+        self.history_dir = history_dir
+        self.black_box_dir = black_box_dir
+        self.stats_interval = stats_interval
+        self.on_status = on_status
+
+        self.monitor = StreamMonitor()
+        self.audio_processor = AudioProcessor(config.samplerate)
+        self.fft_analyzer = FFTAnalyzer()
+        self.peak_holder = PeakHolder()
+        self.watchdog = AudioWatchdog()
+        self.encryption = AudioEncryption()
+        self.auth = AuthenticationManager()
+        self.fec = FECEncoder(redundancy=0)
+        self.pipeline: Optional[LinkPipeline] = None
+        self.target_pipeline: Optional[LinkPipeline] = None
+        self.target_processor = self.audio_processor
+
+        self.is_running = False
+        self.protocol = config.protocol
+        self.transport_switched = False
+        self.is_mpx_mode = config.is_mpx_mode
+        self.encrypt_enabled = False
+        self.fec_enabled = False
+        self.stream = None
+        self.socket_obj = None
+        self.device = None
+        self.session_id = None
+        self.status = 'Idle'
+
+        self.vu_levels = [0.0, 0.0]
+        self.peak_levels = [0.0, 0.0]
+        self.vu_lock = threading.Lock()
+        self.last_vu_update = time.time()
+
+        self.black_box: Optional[BlackBox] = None
+        self.packet_capture: Optional[PacketCapture] = None
+
+        self.history = None
+        self.last_stats: Optional[Dict] = None
+        self.last_history: Optional[Dict] = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        config = self.config
+        config.validate()
+        self.device = self.devices.lookup(config.device, self.device_kind)
+        self.apply_config()
+
+        self.is_running = True
+        self.stop_event.clear()
+        self.monitor.start()
+        self.watchdog.reset()
+        self.open_history()
+        if config.black_box_seconds > 0:
+            self.black_box = BlackBox(config.samplerate, config.channels, config.black_box_seconds,
+                                      post_seconds=config.black_box_post_seconds, dump_dir=self.black_box_dir,
+                                      name=self.link_name())
+            self.alerts.register_callback(self.handle_alert)
+
+        self.session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.logger.start_session(self.kind, {
+            'host': config.host,
+            'port': config.port,
+            'protocol': config.protocol,
+            'samplerate': config.samplerate,
+            'blocksize': config.blocksize
+        })
+
+        if self.owns_watcher:
+            self.device_watcher.start()
+
+        self.start_link()
+        if self.stats_interval:
+            threading.Thread(target=self.stats_worker, daemon=True).start()
+
+    def apply_config(self):
+        """Resolve the config into the plain attributes the audio and network paths read."""
+        config = self.config
+        if config.shared_secret:
+            self.auth = AuthenticationManager(config.shared_secret)
+        self.protocol = config.protocol
+        self.transport_switched = False
+        self.use_pipeline(self.build_pipeline(config, 0))
+        self.target_pipeline = self.pipeline
+
+        self.audio_processor = AudioProcessor(config.samplerate)
+        self.target_processor = self.audio_processor
+        self.set_processing(config.agc, config.limiter)
+        self.configure_tracing(config.trace, config.trace_sample_every)
+        self.monitor.callback.configure(config.blocksize, config.samplerate)
+
+    def build_pipeline(self, config: LinkConfig, generation: int) -> LinkPipeline:
+        stream_format = StreamFormat(generation, config.channels, config.samplerate, config.blocksize,
+                                     encrypted=bool(config.password), fec=config.fec, protocol=config.protocol)
+        return LinkPipeline(stream_format, AudioEncryption(config.password or None),
+                            FECEncoder(redundancy=2 if config.fec else 0))
+
+    def use_pipeline(self, pipeline: LinkPipeline):
+        self.pipeline = pipeline
+        self.encryption = pipeline.encryption
+        self.fec = pipeline.fec
+        self.encrypt_enabled = pipeline.encryption.enabled
+        self.fec_enabled = pipeline.fec.enabled
+        self.is_mpx_mode = pipeline.format.channels == 1
+
+    def reconfigure(self, config: LinkConfig) -> List[str]:
+        """Apply `config` to the running link; returns the names of the fields that changed."""
+        config.validate()
+        changed = [field.name for field in fields(LinkConfig)
+                   if getattr(config, field.name) != getattr(self.config, field.name)]
+        blocked = [name for name in changed if name in self.restart_fields]
+        if blocked:
+            raise ValueError(f"Changing {', '.join(blocked)} requires restarting the link")
+
+        if not self.is_running or not changed:
+            self.config = config
+            return changed
+
+        if any(name in self.format_fields for name in changed):
+            self.stage_pipeline(config)
+        self.config = config
+
+        if 'agc' in changed or 'limiter' in changed:
+            self.set_processing(config.agc, config.limiter)
+        if 'trace' in changed or 'trace_sample_every' in changed:
+            self.configure_tracing(config.trace, config.trace_sample_every)
+        if 'shared_secret' in changed:
+            self.auth = AuthenticationManager(config.shared_secret or None)
+        self.apply_link_changes(config, changed)
+
+        self.logger.log_event('reconfigure', {'changed': [name for name in changed
+                                                          if name not in ('password', 'shared_secret')]})
+        return changed
+
+    @abstractmethod
+    def stage_pipeline(self, config: LinkConfig):
+        pass
+
+    def apply_link_changes(self, config: LinkConfig, changed: List[str]):
+        pass
+
+    def start_network(self):
+        if self.protocol == "TCP":
+            threading.Thread(target=self.tcp_thread, daemon=True).start()
+        else:
+            threading.Thread(target=self.udp_thread, daemon=True).start()
+
+    def switch_transport(self, protocol: str):
+        """Move the link to the other protocol; the audio stream and buffers keep running."""
+        self.protocol = protocol
+        self.transport_switched = True
+        self.close_transport()
+        self.logger.log_event('protocol_switch', {'protocol': protocol})
+        if self.is_running:
+            self.start_network()
+
+    @abstractmethod
+    def tcp_thread(self):
+        pass
+
+    @abstractmethod
+    def udp_thread(self):
+        pass
+
+    @abstractmethod
+    def close_transport(self):
+        pass
+
+    @abstractmethod
+    def start_link(self):
+        pass
+
+    @abstractmethod
+    def close_link(self):
+        pass
+
+    def stop(self) -> Dict:
+        if not self.is_running:
+            return self.last_stats or {}
+
+        self.is_running = False
+        self.stop_event.set()
+        self.device_watcher.detach(self.link_name())
+
+        if self.stream is not None:
+            try:
+                self.stream.stop()
+                self.stream.close()
+            except Exception:
+                pass
+            self.stream = None
+
+        self.close_link()
+
+        if self.recorder.is_recording:
+            self.recorder.stop_recording()
+        if self.black_box is not None:
+            self.alerts.unregister_callback(self.handle_alert)
+            self.black_box.stop()
+            self.black_box = None
+        self.stop_capture()
+
+        stats = self.monitor.get_stats()
+        self.logger.end_session(stats)
+
+        if self.supabase is not None and self.supabase.enabled and self.session_id:
+            self.supabase.log_session({
+                'session_id': self.session_id,
+                'type': self.kind,
+                'start_time': datetime.now().isoformat(),
+                'end_time': datetime.now().isoformat(),
+                'config': {
+                    'host': self.config.host,
+                    'port': self.config.port,
+                    'protocol': self.config.protocol,
+                    'samplerate': self.config.samplerate,
+                    'blocksize': self.config.blocksize
+                },
+                'final_stats': stats
+            })
+
+        if self.metrics is not None:
+            self.metrics.remove_link(self.link_name())
+
+        self.close_history()
+
+        if self.owns_watcher:
+            self.device_watcher.stop()
+
+        self.set_status("Stopped")
+        return stats
+
+    def set_processing(self, agc: Optional[bool] = None, limiter: Optional[bool] = None):
+        # While running, the change goes to a copy that process_block() crossfades to
+        processor = self.target_processor.clone() if self.is_running else self.target_processor
+        if agc is not None:
+            processor.agc_enabled = agc
+        if limiter is not None:
+            processor.limiter_enabled = limiter
+        self.target_processor = processor
+
+    def process_block(self, block):
+        target = self.target_processor
+        if target is self.audio_processor:
+            return target.process(block)
+
+        previous = self.audio_processor.process(block)
+        self.audio_processor = target
+        return crossfade(previous, target.process(block))
+
+    def configure_tracing(self, enabled: bool, sample_every: Optional[int] = None):
+        self.monitor.pipeline.configure(enabled, sample_every)
+
+    def link_name(self) -> str:
+        return self.config.name or f"{self.kind}-{self.config.port}"
+
+    def set_status(self, message: str):
+        self.status = message
+        if self.on_status is not None:
+            self.on_status(message)
+
+    def get_levels(self) -> Tuple[list, list]:
+        with self.vu_lock:
+            return list(self.vu_levels), list(self.peak_levels)
+
+    def open_stream(self, stream_class, callback, device):
+        # Called by the device watcher, which reopens the stream on the same device after a dropout
+        stream = stream_class(
+            device=device.index,
+            channels=self.stream_channels(),
+            samplerate=self.config.samplerate,
+            blocksize=self.config.blocksize,
+            dtype=np.int16,
+            callback=callback
+        )
+        stream.start()
+        self.stream = stream
+        return stream
+
+    def stream_channels(self) -> int:
+        return self.config.channels
+
+    def attach_stream(self, stream_class, callback):
+        self.device_watcher.attach(self.device, self.device_kind, partial(self.open_stream, stream_class, callback),
+                                   lambda: self.monitor.callback.last_start_ns, key=self.link_name())
+
+    def start_capture(self, path: str) -> str:
+        """Record wire frames to `path` until stop_capture() or stop()."""
+        self.stop_capture()
+        # Payloads stay encrypted in the capture; the password itself is not stored
+        config = {key: value for key, value in self.config.to_dict().items()
+                  if key not in ('password', 'shared_secret')}
+        self.packet_capture = PacketCapture(path, {
+            'link': self.link_name(),
+            'kind': self.kind,
+            'started': datetime.now().isoformat(),
+            'encrypted': bool(self.config.password),
+            'config': config
+        })
+        self.logger.log_event('capture_started', {'path': path})
+        return path
+
+    def stop_capture(self) -> Optional[Dict]:
+        capture, self.packet_capture = self.packet_capture, None
+        if capture is None:
+            return None
+        stats = capture.close()
+        self.logger.log_event('capture_stopped', stats)
+        return stats
+
+    def handle_alert(self, alert: Dict):
+        black_box = self.black_box
+        if black_box is None or alert['severity'] not in ('warning', 'error', 'critical'):
+            return
+        # Alerts without a link come from this process's audio callbacks or shared services
+        if alert['details'].get('link', self.link_name()) != self.link_name():
+            return
+        if black_box.trigger(alert['message'], alert['details']):
+            self.logger.log_event('black_box_triggered', {'reason': alert['message']})
+
+    def dump_black_box(self) -> Optional[str]:
+        """Write the whole black box ring now; returns the .wav path, or None if nothing is held."""
+        black_box = self.black_box
+        if black_box is None:
+            return None
+        path = black_box.dump()
+        if path is not None:
+            self.logger.log_event('black_box_dump', {'path': path})
+        return path
+
+    def handle_device_event(self, event, device, details):
+        details = {**details, 'device': device.name, 'hostapi': device.hostapi}
+        self.logger.log_event(f"device_{event}", details)
+
+        if event == 'lost':
+            self.set_status(f"Audio device lost: {device.name}, reopening...")
+            self.alerts.raise_alert('warning', 'Audio device lost', details)
+        elif event == 'recovered':
+            self.device = device
+            self.set_status(f"Audio device recovered after {details['gap_ms']:.0f} ms")
+            self.alerts.raise_alert('info', 'Audio device recovered', details)
+        else:
+            self.set_status(f"Audio device unavailable: {device.name}")
+            self.alerts.raise_alert('error', 'Audio device could not be reopened', details)
+
+    def update_vu_from_audio(self, audio_data, samplerate: int, watch: bool = True):
+        self.watchdog.process(audio_data, samplerate, judge=watch)
+
+        current_time = time.time()
+        if current_time - self.last_vu_update >= 0.1:
+            # RMS over everything metered since the previous update, not just the last block
+            levels = self.watchdog.meter.read()[0]
+            # Mono (MPX composite) shows on both meters
+            left_db, right_db = levels[0], levels[1] if len(levels) > 1 else levels[0]
+            peak_left, peak_right = self.peak_holder.update(left_db, right_db)
+            with self.vu_lock:
+                self.vu_levels = [left_db, right_db]
+                self.peak_levels = [peak_left, peak_right]
+
+            self.last_vu_update = current_time
+
+    def stats_worker(self):
+        while not self.stop_event.wait(self.stats_interval):
+            try:
+                self.collect_stats()
+            except Exception:
+                pass
+
+    def collect_stats(self) -> Dict:
+        stats = self.monitor.get_stats()
+        self.add_link_stats(stats)
+
+        with self.vu_lock:
+            stats['left_db'], stats['right_db'] = self.vu_levels
+
+        self.last_history = self.record_history(stats)
+        self.monitor.callback.check_alerts(self.alerts, self.link_name())
+        self.watchdog.check_alerts(self.alerts, self.link_name())
+        stats['watchdog'] = self.watchdog.get_stats()
+
+        if self.telemetry is not None and self.supabase is not None:
+            self.telemetry.submit(self.supabase.build_statistics_row(self.session_id, stats))
+            stats['telemetry'] = self.telemetry.get_stats()
+        if self.recorder.is_recording or self.recorder.compressor is not None:
+            stats['recorder'] = self.recorder.get_stats()
+        stats['alerts'] = self.alerts.get_stats()
+
+        if self.metrics is not None:
+            self.metrics.publish(self.link_name(), stats)
+
+        self.last_stats = stats
+        return stats
+
+    def add_link_stats(self, stats: Dict):
+        pass
+
+    def open_history(self):
+        if self.history_dir is None:
+            self.history = TimeSeriesStore()
+            return
+
+        try:
+            self.history = TimeSeriesStore(os.path.join(self.history_dir, self.link_name()))
+        except (OSError, ValueError) as e:
+            self.history = TimeSeriesStore()
+            self.alerts.raise_alert('warning', 'Statistics history not persisted',
+                                    {'link': self.link_name(), 'error': str(e)})
+
+    def close_history(self):
+        if self.history is not None:
+            self.history.close()
+            self.history = None
+
+    def record_history(self, stats: Dict) -> Optional[Dict]:
+        if self.history is None:
+            return None
+
+        now = time.time()
+        self.history.append(now, {
+            'bitrate': stats['bitrate'],
+            'loss': stats['packet_loss_rate'],
+            'jitter': stats['jitter'],
+            'latency': stats['avg_latency'],
+            'buffer_fill': stats.get('buffer_fill'),
+            'left_db': stats['left_db'],
+            'right_db': stats['right_db']
+        })
+        return self.history.summary(3600, now)
+
+    def recv_exact(self, conn, n):
+        data = bytearray()
+        while len(data) < n:
+            if not self.is_running:
+                return None
+            try:
+                packet = conn.recv(n - len(data))
+                if not packet:
+                    return None
+                data.extend(packet)
+            except Exception:
+                return None
+        return bytes(data)
+
+
+class SenderEngine(LinkEngine):
+    """
+    Captures from an input device and serves the stream (TCP listener or UDP to host:port).
+
+    The capture stream runs for the whole session and is opened with up to two
+    channels, so switching between stereo and MPX only changes which channels are
+    sent. Packets are re-blocked when the configured blocksize differs from the
+    device block, and every format change is announced with a PACKET_FORMAT frame
+    ahead of the first packet that uses it (repeated on UDP).
+
+    The audio callback only queues the packed frames; send_worker() writes them
+    to the socket, so a stalled TCP connection never blocks the callback (which
+    the device watcher would take for a device loss). At most
+    `max_send_queue` blocks wait; beyond that the oldest is dropped and counted.
+    """
+
+    kind = 'sender'
+    device_kind = 'input'
+    max_send_queue = 64
+    # PACKET_FORMAT copies sent on the old transport before a protocol switch closes it
+    switch_announcements = 3
+
+    def __init__(self, config: LinkConfig, **kwargs):
+        super().__init__(config, **kwargs)
+        self.client_socket = None
+        self.sequence_number = 0
+        self.pending_pongs = deque(maxlen=16)
+        self.transport: Optional[Tuple[Callable, Callable]] = None
+        self.announce = 0
+        self.capture_channels = config.channels
+        self.reblock_buffer = None
+        self.udp_host = None
+        self.peer_host = None
+        self.rate_limiter: Optional[RateLimiter] = None
+        self.packets_policed = 0
+        self.reported_policed = 0
+        self.policing = False
+        self.send_errors = 0
+        self.last_send_error: Optional[str] = None
+        self.send_queue = deque()
+        self.send_event = threading.Event()
+        self.send_thread: Optional[threading.Thread] = None
+        self.send_queue_drops = 0
+
+    def apply_config(self):
+        super().apply_config()
+        self.set_bandwidth_limit(self.config.bandwidth_limit)
+
+    def set_bandwidth_limit(self, kbps: int):
+        self.rate_limiter = RateLimiter(kbps) if kbps else None
+
+    def apply_link_changes(self, config: LinkConfig, changed: List[str]):
+        if 'bandwidth_limit' in changed:
+            self.set_bandwidth_limit(config.bandwidth_limit)
+
+    def add_link_stats(self, stats: Dict):
+        policed = self.packets_policed
+        stats['packets_policed'] = policed
+        stats['send_errors'] = self.send_errors
+        stats['last_send_error'] = self.last_send_error
+        stats['send_queue_depth'] = len(self.send_queue)
+        stats['send_queue_drops'] = self.send_queue_drops
+        dropping = policed > self.reported_policed
+        if dropping and not self.policing:
+            self.alerts.raise_alert('warning', 'Bandwidth limit exceeded, packets dropped', {
+                'link': self.link_name(),
+                'dropped': policed - self.reported_policed,
+                'limit_kbps': self.config.bandwidth_limit
+            })
+        self.policing = dropping
+        self.reported_policed = policed
+
+    def start_link(self):
+        self.sequence_number = 0
+        self.packets_policed = 0
+        self.reported_policed = 0
+        self.policing = False
+        self.send_errors = 0
+        self.last_send_error = None
+        self.send_queue.clear()
+        self.send_queue_drops = 0
+        self.pending_pongs.clear()
+        self.transport = None
+        self.reblock_buffer = None
+        self.capture_channels = max(self.config.channels, min(2, self.device.max_input_channels))
+        self.udp_host = self.config.host if self.protocol == 'UDP' else None
+        self.peer_host = None
+
+        self.send_thread = threading.Thread(target=self.send_worker, daemon=True)
+        self.send_thread.start()
+        self.start_network()
+        self.start_audio_stream()
+
+    def stream_channels(self) -> int:
+        return self.capture_channels
+
+    def stage_pipeline(self, config: LinkConfig):
+        if config.channels > self.capture_channels:
+            raise ValueError(f"{self.device.name} has only {self.capture_channels} input channel(s)")
+        self.target_pipeline = self.build_pipeline(config, self.target_pipeline.format.generation + 1)
+
+    def close_link(self):
+        self.close_transport()
+        self.send_thread = None
+        self.send_event.set()
+        self.send_queue.clear()
+
+    def close_transport(self):
+        self.drop_client()
+
+        if self.socket_obj is not None:
+            try:
+                self.socket_obj.close()
+            except Exception:
+                pass
+            self.socket_obj = None
+
+    def drop_client(self, conn=None, reason: Optional[str] = None):
+        """Close the TCP client (only if it is still `conn`); tcp_thread() keeps accepting the next one."""
+        client = self.client_socket
+        if client is None or (conn is not None and client is not conn):
+            return
+        self.client_socket = None
+        self.transport = None
+        try:
+            client.close()
+        except Exception:
+            pass
+
+        if reason is not None:
+            self.logger.log_event('disconnected', {'reason': reason})
+            if self.is_running and self.protocol == 'TCP':
+                self.set_status("Waiting for connection...")
+
+    def send_failed(self, transport, error: Exception):
+        self.send_errors += 1
+        self.last_send_error = str(error)
+        # A UDP send fails while nobody listens and recovers by itself; a TCP client is gone for good
+        if transport is self.transport and self.client_socket is not None:
+            self.drop_client(self.client_socket, f"send failed: {error}")
+
+    def queue_send(self, transport, pack_frame, frames):
+        """Called from the audio callback: hand the frames of one block to send_worker()."""
+        if len(self.send_queue) >= self.max_send_queue:
+            try:
+                dropped = self.send_queue.popleft()
+            except IndexError:
+                dropped = None
+            if dropped is not None and dropped[3] is not None:
+                # Never a pending protocol switch
+                self.send_queue.appendleft(dropped)
+            elif dropped is not None:
+                self.send_queue_drops += 1
+                # The dropped block may have carried a format announcement
+                self.announce = max(self.announce, 1)
+        self.send_queue.append((transport, pack_frame, frames, None))
+        self.send_event.set()
+
+    def send_worker(self):
+        thread = threading.current_thread()
+        while self.is_running and self.send_thread is thread:
+            self.send_event.wait(0.5)
+            self.send_event.clear()
+            while self.send_queue and self.send_thread is thread:
+                try:
+                    transport, pack_frame, frames, protocol = self.send_queue.popleft()
+                except IndexError:
+                    break
+                if protocol is not None:
+                    self.announce_switch(transport, frames, protocol)
+                    continue
+                if transport is not self.transport:
+                    continue
+                # Pongs are stamped here rather than in the callback so queueing time is not counted as network
+                if self.pending_pongs:
+                    frames.extend(self.build_pongs(pack_frame))
+                try:
+                    transport[1](frames)
+                except Exception as e:
+                    self.send_failed(transport, e)
+
+    def announce_switch(self, transport, frames, protocol: str):
+        """Runs on the send worker: repeat the announcement on the old transport, then move to `protocol`."""
+        send = transport[1]
+        for attempt in range(self.switch_announcements):
+            if attempt:
+                # Spaced out, so one burst of loss on UDP does not take every copy
+                time.sleep(0.02)
+            try:
+                send(frames)
+            except Exception:
+                break
+        self.switch_transport(protocol)
+
+    def tcp_transport(self, conn):
+        def send(frames):
+            conn.sendall(b''.join(frames))
+        return pack_tcp_frame, send
+
+    def udp_transport(self, sock):
+        def send(frames):
+            for frame in frames:
+                sock.send(frame)
+        return pack_udp_frame, send
+
+    def tcp_thread(self):
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket_obj = sock
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('0.0.0.0', self.config.port))
+            sock.listen(1)
+            sock.settimeout(1.0)
+
+            self.set_status("Waiting for connection...")
+
+            while self.is_running and self.socket_obj is sock:
+                try:
+                    conn, addr = sock.accept()
+                except socket.timeout:
+                    continue
+                except Exception as e:
+                    if self.is_running and self.socket_obj is sock:
+                        self.set_status(f"Connection error: {str(e)}")
+                    break
+
+                # A reconnecting receiver replaces the previous client, whose connection may be half-open
+                self.drop_client()
+                self.client_socket = conn
+                self.peer_host = addr[0]
+                self.set_status(f"Connected: {addr[0]}:{addr[1]}")
+                self.logger.log_event('connection', {'remote': f"{addr[0]}:{addr[1]}"})
+                threading.Thread(target=self.tcp_control_thread, args=(conn,), daemon=True).start()
+                self.announce = 1
+                self.transport = self.tcp_transport(conn)
+
+        except Exception as e:
+            if self.is_running:
+                self.set_status(f"TCP Error: {str(e)}")
+                self.alerts.raise_alert('error', 'TCP connection failed', {'link': self.link_name(), 'error': str(e)})
+
+    def udp_thread(self):
+        # After a switch from TCP the destination is the receiver that was connected
+        host, port = self.udp_host or self.peer_host or self.config.host, self.config.port
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket_obj = sock
+            sock.connect((host, port))
+            sock.settimeout(1.0)
+            self.set_status(f"Sending to {host}:{port} (UDP)")
+            threading.Thread(target=self.udp_control_thread, args=(sock,), daemon=True).start()
+            self.announce = 3
+            self.transport = self.udp_transport(sock)
+
+        except Exception as e:
+            if self.is_running:
+                self.set_status(f"UDP Error: {str(e)}")
+                self.alerts.raise_alert('error', 'UDP connection failed', {'link': self.link_name(), 'error': str(e)})
+
+    def tcp_control_thread(self, conn):
+        while self.is_running:
+            header = self.recv_exact(conn, TCP_HEADER.size)
+            if not header:
+                break
+
+            packet_type, _, _, length = TCP_HEADER.unpack(header)
+            payload = self.recv_exact(conn, length)
+            if payload is None:
+                break
+
+            if packet_type == PACKET_PING:
+                self.handle_ping(payload, monotonic_ns())
+
+        if self.is_running:
+            self.drop_client(conn, 'connection closed by receiver')
+
+    def udp_control_thread(self, sock):
+        while self.is_running and self.socket_obj is sock:
+            try:
+                data = sock.recv(2048)
+            except socket.timeout:
+                continue
+            except Exception:
+                if not self.is_running or self.socket_obj is not sock:
+                    break
+                continue
+
+            t2 = monotonic_ns()
+            frame = unpack_udp_frame(data)
+            if frame and frame[0] == PACKET_PING:
+                self.handle_ping(frame[3], t2)
+
+    def handle_ping(self, payload, t2):
+        try:
+            t1, one_way_ms, glass_to_glass_ms = unpack_ping(payload)
+        except Exception:
+            return
+
+        self.pending_pongs.append((t1, t2))
+
+        if one_way_ms > 0:
+            self.monitor.record_latency(one_way_ms, 'network')
+        if glass_to_glass_ms > 0:
+            self.monitor.record_latency(glass_to_glass_ms, 'glass_to_glass')
+
+    def build_pongs(self, pack_frame):
+        frames = []
+        while self.pending_pongs:
+            t1, t2 = self.pending_pongs.popleft()
+            t3 = monotonic_ns()
+            frames.append(pack_frame(PACKET_PONG, 0, t3, pack_pong(t1, t2, t3)))
+        return frames
+
+    def start_audio_stream(self):
+        try:
+            self.attach_stream(sd.InputStream, self.audio_callback)
+        except Exception as e:
+            if self.is_running:
+                self.set_status(f"Audio Error: {str(e)}")
+                self.alerts.raise_alert('error', 'Audio stream failed', {'link': self.link_name(), 'error': str(e)})
+
+    def switch_pipeline(self, pipeline: LinkPipeline):
+        # Runs in the audio callback, between two blocks
+        previous = self.pipeline
+        self.use_pipeline(pipeline)
+        self.reblock_buffer = None
+        self.announce = 1 if self.protocol == 'TCP' else 3
+
+        if pipeline.format.protocol != previous.format.protocol:
+            # Announce on the old transport so the receiver follows; the send worker moves over afterwards
+            transport, self.transport = self.transport, None
+            if transport is None:
+                threading.Thread(target=self.switch_transport, args=(pipeline.format.protocol,), daemon=True).start()
+                return
+            pack_frame = transport[0]
+            self.send_queue.append((transport, pack_frame,
+                                    [pack_frame(PACKET_FORMAT, 0, monotonic_ns(), pipeline.format.pack())],
+                                    pipeline.format.protocol))
+            self.send_event.set()
+
+    def packetize(self, block, size):
+        """Split a device block into `size`-frame packets as (frame offset, samples); keeps the remainder."""
+        leftover = self.reblock_buffer
+        if leftover is None and len(block) == size:
+            return [(0, block)]
+
+        start = 0
+        if leftover is not None:
+            start = -len(leftover)
+            block = np.concatenate((leftover, block))
+
+        count = len(block) // size
+        # Copied: the block may be the device's buffer, which is reused after the callback
+        rest = block[count * size:]
+        self.reblock_buffer = rest.copy() if len(rest) else None
+        return [(start + i * size, block[i * size:(i + 1) * size]) for i in range(count)]
+
+    def audio_callback(self, indata, frames, time_info, status):
+        if not self.is_running:
+            return
+
+        callback_start = self.monitor.callback.begin(status)
+        try:
+            target = self.target_pipeline
+            if target is not self.pipeline:
+                self.switch_pipeline(target)
+
+            transport = self.transport
+            if transport is not None:
+                self.send_block(indata, time_info, transport)
+        except Exception:
+            pass
+
+        self.monitor.callback.end(callback_start)
+
+    def send_block(self, indata, time_info, transport):
+        pack_frame = transport[0]
+        capture = self.packet_capture
+        if capture is not None:
+            pack_frame = capture.wrap(pack_frame)
+        trace = self.monitor.pipeline.begin()
+        capture_ts = capture_timestamp_ns(time_info)
+        pipeline = self.pipeline
+        stream_format = pipeline.format
+
+        if indata.shape[1] != stream_format.channels:
+            indata = indata[:, :stream_format.channels]
+        processed = self.process_block(indata)
+        trace.mark('process')
+
+        black_box = self.black_box
+        if black_box is not None:
+            black_box.write(processed)
+        if self.recorder.is_recording:
+            self.recorder.write_audio(processed, stream_format.samplerate)
+            trace.mark('record')
+
+        frames_out = []
+        if self.announce:
+            self.announce -= 1
+            frames_out.append(pack_frame(PACKET_FORMAT, 0, capture_ts, stream_format.pack()))
+
+        sizes = []
+        ns_per_frame = 1e9 / stream_format.samplerate
+        sent_ns = monotonic_ns()
+        for offset, block in self.packetize(processed, stream_format.blocksize):
+            audio_bytes = block.tobytes()
+
+            if pipeline.fec.enabled:
+                audio_bytes = pipeline.fec.encode(audio_bytes)
+                trace.mark('fec')
+
+            if pipeline.encryption.enabled:
+                audio_bytes = pipeline.encryption.encrypt(audio_bytes)
+                trace.mark('encrypt')
+
+            packet_ts = capture_ts + int(offset * ns_per_frame)
+            rate_limiter = self.rate_limiter
+            if rate_limiter is not None and not rate_limiter.allow(len(audio_bytes)):
+                # Dropped, not delayed: the sequence gap shows up as loss on the receiver
+                if black_box is not None:
+                    black_box.add_packet(sent_ns, self.sequence_number, packet_ts, len(audio_bytes),
+                                         stream_format.generation, dropped=True)
+                self.sequence_number += 1
+                self.packets_policed += 1
+                continue
+
+            frames_out.append(pack_frame(stream_format.audio_type, self.sequence_number, packet_ts, audio_bytes))
+            if black_box is not None:
+                black_box.add_packet(sent_ns, self.sequence_number, packet_ts, len(audio_bytes),
+                                     stream_format.generation)
+            self.sequence_number += 1
+            sizes.append(len(audio_bytes))
+
+        self.queue_send(transport, pack_frame, frames_out)
+        trace.mark('send')
+
+        for size in sizes:
+            self.monitor.record_packet_sent(size)
+        self.update_vu_from_audio(processed, stream_format.samplerate)
+        self.fft_analyzer.add_samples(processed)
+        trace.mark('metering')
+        trace.commit()
+
+
+class ReceiverEngine(LinkEngine):
+    """
+    Receives the stream (TCP client with auto-reconnect, or UDP listener) and plays it out.
+
+    Each audio packet is decoded with the format its sender announced for that
+    generation; until an announcement arrives the receiver's own config is used.
+    Channel mode, FEC, encryption and packet size follow the sender without touching
+    the output stream, and a change of protocol is followed as well. The output
+    stream's channel count is fixed, so mono and stereo are mapped onto it.
+    """
+
+    kind = 'receiver'
+    device_kind = 'output'
+    restart_fields = LinkEngine.restart_fields + ('channel_mode',)
+    format_fields = ('password', 'protocol')
+    loss_burst_rate = 0.01
+    # With no packets for this long after some have arrived, try the other protocol (0 = never)
+    transport_fallback_seconds = 5.0
+
+    def __init__(self, config: LinkConfig, **kwargs):
+        super().__init__(config, **kwargs)
+        self.reconnect_enabled = False
+        self.audio_buffer = deque(maxlen=100)
+        self.buffer_lock = threading.Lock()
+        self.clock_sync = ClockSync()
+        self.udp_peer = None
+        self.last_one_way_ms = 0.0
+        self.last_glass_to_glass_ms = 0.0
+
+        self.fec_decoder = FECEncoder(redundancy=2)
+        self.formats: Dict[int, StreamFormat] = {}
+        self.last_generation = None
+        self.format_drops = 0
+        self.output_channels = config.channels
+        self.fade_frames = 0
+        self.playout_chunk = None
+        self.playout_offset = 0
+        self.tcp_host = None
+        self.bind_host = '0.0.0.0'
+        self.last_packet_at: Optional[float] = None
+
+    def start_link(self):
+        self.reconnect_enabled = self.config.auto_reconnect
+        self.clock_sync.reset()
+        self.udp_peer = None
+        self.last_one_way_ms = 0.0
+        self.last_glass_to_glass_ms = 0.0
+        self.tcp_host = self.config.host if self.protocol == 'TCP' else None
+        self.bind_host = self.config.host if self.protocol == 'UDP' else '0.0.0.0'
+        self.last_packet_at = None
+
+        # The network session and jitter buffer keep running while the watcher reopens a dropped device
+        self.attach_stream(sd.OutputStream, self.audio_output_callback)
+        self.start_network()
+        if self.transport_fallback_seconds:
+            threading.Thread(target=self.transport_fallback_thread, daemon=True).start()
+
+    def transport_fallback_thread(self):
+        """
+        A protocol switch is announced on the old transport only; if every copy of
+        that announcement was lost, the sender has moved on while this side still
+        waits. Once a link has carried packets and then stays silent, alternate
+        between the two protocols until packets arrive again.
+        """
+        timeout = self.transport_fallback_seconds
+        last_switch = time.monotonic()
+        while not self.stop_event.wait(1.0):
+            last_packet = self.last_packet_at
+            now = time.monotonic()
+            if last_packet is None or now - last_packet < timeout or now - last_switch < timeout:
+                continue
+            protocol = 'UDP' if self.protocol == 'TCP' else 'TCP'
+            self.logger.log_event('transport_fallback', {'protocol': protocol, 'silent_s': now - last_packet})
+            self.set_status(f"No packets for {now - last_packet:.0f} s, trying {protocol}...")
+            last_switch = now
+            self.switch_transport(protocol)
+
+    def apply_config(self):
+        super().apply_config()
+        self.formats = {0: self.pipeline.format}
+        self.last_generation = None
+        self.format_drops = 0
+        self.output_channels = self.config.channels
+        self.fade_frames = max(1, self.config.samplerate // 500)
+        self.playout_chunk = None
+        self.reported_loss = (0, 0)
+        self.loss_burst = False
+        self.playout_underruns = 0
+
+    def stop(self) -> Dict:
+        self.reconnect_enabled = False
+        return super().stop()
+
+    def apply_link_changes(self, config: LinkConfig, changed: List[str]):
+        if 'auto_reconnect' in changed:
+            self.reconnect_enabled = config.auto_reconnect
+
+    def stage_pipeline(self, config: LinkConfig):
+        # Formats come from the sender; only the local key and transport are ours to change
+        if config.password != self.config.password:
+            encryption = AudioEncryption(config.password or None)
+            self.encryption = encryption
+            self.encrypt_enabled = encryption.enabled
+        if config.protocol != self.protocol:
+            threading.Thread(target=self.switch_transport, args=(config.protocol,), daemon=True).start()
+
+    def close_link(self):
+        self.close_transport()
+        with self.buffer_lock:
+            self.audio_buffer.clear()
+            self.playout_chunk = None
+
+    def close_transport(self):
+        if self.socket_obj is not None:
+            try:
+                self.socket_obj.close()
+            except Exception:
+                pass
+            self.socket_obj = None
+
+    def get_buffer_fill(self) -> float:
+        with self.buffer_lock:
+            return len(self.audio_buffer) / self.audio_buffer.maxlen * 100
+
+    def add_link_stats(self, stats: Dict):
+        stats['buffer_fill'] = self.get_buffer_fill()
+        stats['clock_offset_ms'] = (self.clock_sync.offset_ns / 1e6
+                                    if self.clock_sync.offset_ns is not None else None)
+        stats['format_drops'] = self.format_drops
+        stats['playout_underruns'] = self.playout_underruns
+
+        # Alert when a stats interval loses more than loss_burst_rate of its packets, once per burst
+        lost, expected = stats['packets_lost'], stats['packets_expected']
+        new_lost, new_expected = lost - self.reported_loss[0], expected - self.reported_loss[1]
+        burst = new_lost > 0 and new_lost >= new_expected * self.loss_burst_rate
+        if burst and not self.loss_burst:
+            self.alerts.raise_alert('warning', 'Packet loss burst', {
+                'link': self.link_name(),
+                'lost': new_lost,
+                'expected': new_expected
+            })
+        self.loss_burst = burst
+        self.reported_loss = (lost, expected)
+
+    def handle_packet(self, packet_type, sequence, capture_ts, arrival_ts, payload):
+        self.last_packet_at = time.monotonic()
+        capture = self.packet_capture
+        if capture is not None:
+            capture.write(arrival_ts, packet_type, sequence, capture_ts, payload)
+
+        kind, generation = split_packet_type(packet_type)
+        if kind == PACKET_AUDIO:
+            self.handle_audio_packet(sequence, capture_ts, arrival_ts, payload, generation)
+        elif kind == PACKET_PONG:
+            self.handle_pong(payload, arrival_ts)
+        elif kind == PACKET_FORMAT:
+            self.handle_format(payload)
+
+    def tcp_thread(self):
+        port = self.config.port
+        attempts = 0
+        while self.is_running and self.reconnect_enabled and self.protocol == 'TCP':
+            attempts += 1
+            # After a switch from UDP the sender is wherever the datagrams came from
+            host = self.tcp_host or (self.udp_peer[0] if self.udp_peer else self.config.host)
+            sock = None
+            try:
+                self.set_status(f"Connecting to {host}:{port}...")
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.socket_obj = sock
+                sock.settimeout(5.0)
+                sock.connect((host, port))
+                sock.settimeout(None)
+                self.set_status(f"Connected to {host}:{port}")
+                self.logger.log_event('connection', {'remote': f"{host}:{port}"})
+                attempts = 0
+                self.transport_switched = False
+
+                threading.Thread(target=self.clock_sync_thread,
+                                 args=(sock, lambda frame: sock.sendall(frame), pack_tcp_frame),
+                                 daemon=True).start()
+
+                while self.is_running and self.socket_obj is sock:
+                    header = self.recv_exact(sock, TCP_HEADER.size)
+                    if not header:
+                        break
+
+                    packet_type, sequence, capture_ts, length = TCP_HEADER.unpack(header)
+                    payload = self.recv_exact(sock, length)
+                    if not payload:
+                        break
+
+                    self.handle_packet(packet_type, sequence, capture_ts, monotonic_ns(), payload)
+
+            except Exception as e:
+                if self.is_running and self.socket_obj is sock and (not self.transport_switched or attempts >= 10):
+                    self.set_status(f"Connection lost: {str(e)}")
+                    self.alerts.raise_alert('warning', 'Connection lost', {'link': self.link_name(), 'error': str(e)})
+                    self.logger.log_event('connection_lost', {'link': self.link_name(), 'error': str(e)})
+
+            finally:
+                if sock is not None:
+                    try:
+                        sock.close()
+                    except Exception:
+                        pass
+                if self.socket_obj is sock:
+                    self.socket_obj = None
+
+                if self.is_running and self.reconnect_enabled and self.protocol == 'TCP':
+                    if self.transport_switched and attempts < 10:
+                        # Just switched from UDP: the sender may still be opening its listener
+                        time.sleep(0.2)
+                    else:
+                        interval = self.config.reconnect_interval
+                        self.set_status(f"Reconnecting in {interval:g} seconds...")
+                        self.stop_event.wait(interval)
+
+    def udp_thread(self):
+        host, port = self.bind_host, self.config.port
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket_obj = sock
+            sock.bind((host, port))
+            sock.settimeout(1.0)
+            self.set_status(f"Listening on {host}:{port} (UDP)")
+
+            threading.Thread(target=self.clock_sync_thread,
+                             args=(sock, self.send_udp_control, pack_udp_frame),
+                             daemon=True).start()
+
+            while self.is_running and self.socket_obj is sock:
+                try:
+                    data, addr = sock.recvfrom(65536)
+                    arrival_ts = monotonic_ns()
+
+                    frame = unpack_udp_frame(data)
+                    if frame is None:
+                        continue
+
+                    packet_type, sequence, capture_ts, payload = frame
+                    self.udp_peer = addr
+                    self.handle_packet(packet_type, sequence, capture_ts, arrival_ts, payload)
+
+                except socket.timeout:
+                    continue
+                except Exception:
+                    if not self.is_running or self.socket_obj is not sock:
+                        break
+
+        except Exception as e:
+            if self.is_running:
+                self.set_status(f"UDP Error: {str(e)}")
+                self.alerts.raise_alert('error', 'UDP connection failed', {'link': self.link_name(), 'error': str(e)})
+
+    def handle_format(self, payload):
+        try:
+            stream_format = StreamFormat.unpack(payload)
+        except Exception:
+            return
+
+        known = self.formats.get(stream_format.generation)
+        self.formats[stream_format.generation] = stream_format
+        if known is not None and known.pack() == stream_format.pack():
+            return
+
+        self.set_status(f"Stream format: {stream_format.describe()}")
+        self.logger.log_event('stream_format', {'generation': stream_format.generation,
+                                                'format': stream_format.describe()})
+        if stream_format.encrypted and not self.encryption.enabled:
+            self.alerts.raise_alert('warning', 'Stream is encrypted but no password is set',
+                                    {'link': self.link_name()})
+        if stream_format.protocol != self.protocol:
+            threading.Thread(target=self.switch_transport, args=(stream_format.protocol,), daemon=True).start()
+
+    def handle_audio_packet(self, sequence, capture_ts, arrival_ts, audio_data, generation=0):
+        stream_format = self.formats.get(generation)
+        undecodable = stream_format is None or (stream_format.encrypted and not self.encryption.enabled)
+        black_box = self.black_box
+        if black_box is not None:
+            black_box.add_packet(arrival_ts, sequence, capture_ts, len(audio_data), generation, dropped=undecodable)
+        if undecodable:
+            # Announcement not seen yet (UDP) or no key for it
+            self.format_drops += 1
+            return
+
+        trace = self.monitor.pipeline.begin()
+
+        if stream_format.encrypted:
+            audio_data = self.encryption.decrypt(audio_data)
+            trace.mark('decrypt')
+
+        if stream_format.fec:
+            audio_data, valid = self.fec_decoder.decode(audio_data)
+            trace.mark('fec')
+            if not valid:
+                return
+
+        audio_array = np.frombuffer(audio_data, dtype=np.int16).reshape(-1, stream_format.channels)
+        if stream_format.channels != self.output_channels:
+            audio_array = self.map_channels(audio_array)
+
+        local_capture_ts = self.record_network_latency(capture_ts, arrival_ts)
+        if local_capture_ts is not None:
+            trace.add('network', arrival_ts - local_capture_ts)
+
+        with self.buffer_lock:
+            if generation != self.last_generation:
+                if self.last_generation is not None:
+                    audio_array = self.smooth_format_change(audio_array)
+                self.last_generation = generation
+            self.audio_buffer.append((local_capture_ts, time.perf_counter_ns(), audio_array))
+        trace.mark('decode')
+
+        self.monitor.record_packet_received(len(audio_data), sequence, capture_ts, arrival_ts)
+        self.fft_analyzer.add_samples(audio_array)
+
+        if self.recorder.is_recording:
+            self.recorder.write_audio(audio_array, stream_format.samplerate)
+        trace.mark('metering')
+        trace.commit()
+
+    def map_channels(self, audio_array):
+        if self.output_channels == 1:
+            return audio_array[:, :1]
+        return np.repeat(audio_array[:, :1], self.output_channels, axis=1)
+
+    def smooth_format_change(self, audio_array):
+        # Called with buffer_lock held: fade out the last queued block of the old format and fade in the new one
+        if self.audio_buffer:
+            capture_ts, enqueued_ns, previous = self.audio_buffer[-1]
+            self.audio_buffer[-1] = (capture_ts, enqueued_ns, fade(previous, False, self.fade_frames))
+        return fade(audio_array, True, self.fade_frames)
+
+    def clock_sync_thread(self, sock, send, pack_frame):
+        pings_sent = 0
+        while self.is_running and self.socket_obj is sock:
+            t1 = monotonic_ns()
+            payload = pack_ping(t1, self.last_one_way_ms, self.last_glass_to_glass_ms)
+            try:
+                send(pack_frame(PACKET_PING, 0, t1, payload))
+                pings_sent += 1
+            except Exception:
+                if self.socket_obj is not sock:
+                    break
+
+            time.sleep(0.2 if pings_sent < 8 else 1.0)
+
+    def send_udp_control(self, frame):
+        if self.udp_peer is not None:
+            self.socket_obj.sendto(frame, self.udp_peer)
+
+    def handle_pong(self, payload, t4):
+        try:
+            t1, t2, t3 = unpack_pong(payload)
+        except Exception:
+            return
+
+        rtt_ns = self.clock_sync.add_sample(t1, t2, t3, t4)
+        if rtt_ns is not None:
+            self.monitor.record_latency(rtt_ns / 1e6, 'rtt')
+
+    def record_network_latency(self, capture_ts, arrival_ts):
+        local_capture_ts = self.clock_sync.to_local(capture_ts)
+        if local_capture_ts is None:
+            return None
+
+        one_way_ms = (arrival_ts - local_capture_ts) / 1e6
+        if one_way_ms >= 0:
+            self.last_one_way_ms = one_way_ms
+            self.monitor.record_latency(one_way_ms, 'network')
+        return local_capture_ts
+
+    def audio_output_callback(self, outdata, frames, time_info, status):
+        if not self.is_running:
+            outdata.fill(0)
+            return
+
+        callback_start = self.monitor.callback.begin(status)
+        trace = self.monitor.pipeline.begin()
+        written = 0
+
+        # Packets need not match the device block: play from the current chunk, then pull the next ones
+        with self.buffer_lock:
+            buffer_fill = len(self.audio_buffer) / self.audio_buffer.maxlen * 100
+
+            while written < frames:
+                if self.playout_chunk is None:
+                    if not self.audio_buffer:
+                        break
+                    capture_ts, enqueued_ns, self.playout_chunk = self.audio_buffer.popleft()
+                    self.playout_offset = 0
+                    trace.add('queue_wait', callback_start - enqueued_ns)
+
+                    if capture_ts is not None:
+                        playout_ts = playout_timestamp_ns(time_info) + written * 1e9 / self.config.samplerate
+                        glass_to_glass_ms = (playout_ts - capture_ts) / 1e6
+                        if glass_to_glass_ms >= 0:
+                            self.last_glass_to_glass_ms = glass_to_glass_ms
+                            self.monitor.record_latency(glass_to_glass_ms, 'glass_to_glass')
+
+                chunk, offset = self.playout_chunk, self.playout_offset
+                count = min(frames - written, len(chunk) - offset)
+                outdata[written:written + count] = chunk[offset:offset + count]
+                written += count
+                if offset + count >= len(chunk):
+                    self.playout_chunk = None
+                else:
+                    self.playout_offset = offset + count
+
+        if written:
+            outdata[:written] = self.process_block(outdata[:written])
+            trace.mark('playout')
+        if written < frames and self.last_generation is not None:
+            # Ran dry after the stream had started: the listener hears a gap
+            self.playout_underruns += 1
+        outdata[written:].fill(0)
+
+        black_box = self.black_box
+        if black_box is not None:
+            black_box.write(outdata)
+        # Meter and watch what is played, so a link that drops out reads as silence
+        self.update_vu_from_audio(outdata, self.config.samplerate, watch=self.last_generation is not None)
+        trace.commit()
+        self.monitor.record_buffer_fill(buffer_fill)
+        self.monitor.callback.end(callback_start)
+
+
+ENGINES = {'sender': SenderEngine, 'receiver': ReceiverEngine}
+
+
+def create_engine(config: LinkConfig, **kwargs) -> LinkEngine:
+    return ENGINES[config.mode](config, **kwargs)
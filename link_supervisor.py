@@ -0,0 +1,323 @@
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from typing import Callable, Dict, List, Optional
+from device_registry import DeviceRegistry, DeviceWatcher
+from link_engine import LinkConfig, LinkEngine, create_engine
+from logging_manager import SessionLogger, AlertSystem
+
+
+def load_site_config(path: str) -> Dict:
+    """
+    Read a site file: {"links": [LinkConfig fields, ...], ...supervisor options}.
+    Link names must be unique; unnamed links are called "<mode>-<port>".
+    """
+    with open(path, 'r') as f:
+        site = json.load(f)
+
+    links = [LinkConfig.from_dict(link) for link in site.get('links', [])]
+    if not links:
+        raise ValueError(f"No links defined in {path}")
+
+    names = set()
+    for link in links:
+        link.validate()
+        link.name = link.name or f"{link.mode}-{link.port}"
+        if link.name in names:
+            raise ValueError(f"Duplicate link name: {link.name}")
+        names.add(link.name)
+
+    site['links'] = links
+    return site
+
+
+class LinkSupervisor:
+    """
+    Hosts several independent links in one process.
+
+    The links share one device registry and watcher, one housekeeping thread that
+    collects every link's stats each `stats_interval` seconds, and the alert system,
+    telemetry uploader and metrics exporter passed in. Each link keeps its own
+    network threads, monitor and session log (under log_dir/<link name>).
+
+    A link that fails to start is reported and skipped; the others keep running.
+    `on_stats(engine, stats)` is called from the housekeeping thread.
+    reconfigure() applies an edited site file to the running links.
+    """
+
+    def __init__(self, links: List[LinkConfig], alerts: Optional[AlertSystem] = None, supabase=None,
+                 telemetry=None, metrics=None, history_dir: Optional[str] = 'history', log_dir: str = 'logs',
+                 stats_interval: float = 1.0,
+                 on_stats: Optional[Callable[[LinkEngine, Dict], None]] = None,
+                 on_status: Optional[Callable[[str, str], None]] = None):
+        self.alerts = alerts or AlertSystem()
+        self.stats_interval = stats_interval
+        self.on_stats = on_stats
+        self.on_status = on_status
+
+        self.devices = DeviceRegistry()
+        self.device_watcher = DeviceWatcher(self.devices, on_event=self.handle_device_event)
+
+        self.engines: Dict[str, LinkEngine] = {}
+        for link in links:
+            name = link.name or f"{link.mode}-{link.port}"
+            if name in self.engines:
+                raise ValueError(f"Duplicate link name: {name}")
+            link.name = name
+            self.engines[name] = create_engine(
+                link,
+                devices=self.devices,
+                device_watcher=self.device_watcher,
+                alerts=self.alerts,
+                logger=SessionLogger(os.path.join(log_dir, name)),
+                supabase=supabase,
+                telemetry=telemetry,
+                metrics=metrics,
+                history_dir=history_dir,
+                stats_interval=None,
+                on_status=lambda message, name=name: self.set_status(name, message)
+            )
+
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> List[str]:
+        """Start every link; returns the names of those that are running."""
+        self.stop_event.clear()
+        self.device_watcher.start()
+
+        for name, engine in self.engines.items():
+            try:
+                engine.start()
+            except Exception as e:
+                engine.stop()
+                self.set_status(name, f"Failed to start: {e}")
+                self.alerts.raise_alert('error', 'Link failed to start', {'link': name, 'error': str(e)})
+
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+        return [name for name, engine in self.engines.items() if engine.is_running]
+
+    def stop(self) -> Dict[str, Dict]:
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(self.stats_interval + 1.0)
+            self.thread = None
+
+        final_stats = {name: engine.stop() for name, engine in self.engines.items()}
+        self.device_watcher.stop()
+        return final_stats
+
+    def get_stats(self) -> Dict[str, Optional[Dict]]:
+        return {name: engine.last_stats for name, engine in self.engines.items()}
+
+    def reconfigure(self, links: List[LinkConfig]):
+        """Reconfigure running links by name; outcomes are reported through on_status."""
+        for link in links:
+            engine = self.engines.get(link.name)
+            if engine is None:
+                self.set_status(link.name, "New link in site file; restart the host to add it")
+                continue
+            try:
+                changed = engine.reconfigure(link)
+            except ValueError as e:
+                self.set_status(link.name, f"Reconfiguration rejected: {e}")
+                continue
+            if changed:
+                self.set_status(link.name, f"Reconfigured: {', '.join(changed)}")
+
+    def set_status(self, name: str, message: str):
+        if self.on_status is not None:
+            self.on_status(name, message)
+
+    def handle_device_event(self, event, device, details):
+        engine = self.engines.get(details.get('link'))
+        if engine is not None:
+            engine.handle_device_event(event, device, details)
+
+    def _worker(self):
+        while not self.stop_event.wait(self.stats_interval):
+            for engine in list(self.engines.values()):
+                if not engine.is_running:
+                    continue
+                try:
+                    stats = engine.collect_stats()
+                except Exception:
+                    continue
+                if self.on_stats is not None:
+                    self.on_stats(engine, stats)
+
+
+def run_shard(links: List[Dict], cpus: Optional[List[int]], history_dir: Optional[str], log_dir: str,
+              stats_interval: float, events, commands, stop_event):
+    """
+    Process entry point for ShardedSupervisor: runs a LinkSupervisor, reports back
+    over `events` and takes ('reconfigure', [link dicts]) from `commands`.
+    """
+    # Ctrl-C reaches the whole process group; the parent stops workers through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+    alerts = AlertSystem()
+    alerts.register_callback(lambda alert: events.put(('alert', alert)))
+
+    supervisor = LinkSupervisor(
+        [LinkConfig.from_dict(link) for link in links],
+        alerts=alerts,
+        history_dir=history_dir,
+        log_dir=log_dir,
+        stats_interval=stats_interval,
+        on_stats=lambda engine, stats: events.put(('stats', engine.link_name(), engine.session_id, stats)),
+        on_status=lambda name, message: events.put(('status', name, message))
+    )
+    supervisor.start()
+    while not stop_event.is_set():
+        try:
+            command = commands.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        except (EOFError, OSError):
+            break
+        if command[0] == 'reconfigure':
+            supervisor.reconfigure([LinkConfig.from_dict(link) for link in command[1]])
+    supervisor.stop()
+    alerts.close()
+
+
+class ShardedSupervisor:
+    """
+    Spreads links over `workers` processes, each running a LinkSupervisor.
+
+    With `affinity` each worker is pinned to one CPU (round-robin over the CPUs this
+    process may use), so the audio and network threads of a shard stay on one core.
+    Workers send stats, alerts and status back over a queue; this process keeps the
+    single metrics endpoint and telemetry uploader and publishes on their behalf.
+    """
+
+    def __init__(self, links: List[LinkConfig], workers: int, affinity: bool = False,
+                 alerts: Optional[AlertSystem] = None, supabase=None, telemetry=None, metrics=None,
+                 history_dir: Optional[str] = 'history', log_dir: str = 'logs', stats_interval: float = 1.0,
+                 on_status: Optional[Callable[[str, str], None]] = None):
+        self.links = links
+        self.workers = max(1, min(workers, len(links)))
+        self.affinity = affinity
+        self.alerts = alerts or AlertSystem()
+        self.supabase = supabase
+        self.telemetry = telemetry
+        self.metrics = metrics
+        self.history_dir = history_dir
+        self.log_dir = log_dir
+        self.stats_interval = stats_interval
+        self.on_status = on_status
+
+        # Spawned rather than forked: the parent may already run threads and hold PortAudio state
+        self.context = multiprocessing.get_context('spawn')
+        self.events = self.context.Queue()
+        self.stop_event = self.context.Event()
+        self.processes: List[multiprocessing.Process] = []
+        self.commands = []
+        self.shard_of: Dict[str, int] = {}
+        self.last_stats: Dict[str, Dict] = {}
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+    def shards(self) -> List[List[LinkConfig]]:
+        shards = [[] for _ in range(self.workers)]
+        for i, link in enumerate(self.links):
+            shards[i % self.workers].append(link)
+        return shards
+
+    def cpu_sets(self) -> List[Optional[List[int]]]:
+        if not self.affinity or not hasattr(os, 'sched_getaffinity'):
+            return [None] * self.workers
+        cpus = sorted(os.sched_getaffinity(0))
+        return [[cpus[i % len(cpus)]] for i in range(self.workers)]
+
+    def start(self):
+        self.running = True
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._collector, daemon=True)
+        self.thread.start()
+
+        for index, (shard, cpus) in enumerate(zip(self.shards(), self.cpu_sets())):
+            commands = self.context.Queue()
+            process = self.context.Process(
+                target=run_shard,
+                args=([link.to_dict() for link in shard], cpus, self.history_dir, self.log_dir,
+                      self.stats_interval, self.events, commands, self.stop_event),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+            self.commands.append(commands)
+            self.shard_of.update({link.name: index for link in shard})
+
+    def stop(self, timeout: float = 10.0):
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        self.commands = []
+        self.shard_of = {}
+
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(2.0)
+            self.thread = None
+
+        if self.metrics is not None:
+            for name in self.last_stats:
+                self.metrics.remove_link(name)
+
+    def get_stats(self) -> Dict[str, Optional[Dict]]:
+        return {link.name: self.last_stats.get(link.name) for link in self.links}
+
+    def reconfigure(self, links: List[LinkConfig]):
+        """Forward changed link configs to the workers hosting them; outcomes arrive as status events."""
+        by_shard: Dict[int, List[Dict]] = {}
+        for link in links:
+            index = self.shard_of.get(link.name)
+            if index is None:
+                if self.on_status is not None:
+                    self.on_status(link.name, "New link in site file; restart the host to add it")
+                continue
+            by_shard.setdefault(index, []).append(link.to_dict())
+
+        for index, shard_links in by_shard.items():
+            self.commands[index].put(('reconfigure', shard_links))
+
+    def _collector(self):
+        while self.running:
+            try:
+                event = self.events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            try:
+                self._handle(event)
+            except Exception:
+                pass
+
+    def _handle(self, event):
+        kind = event[0]
+        if kind == 'stats':
+            _, name, session_id, stats = event
+            if self.telemetry is not None and self.supabase is not None:
+                self.telemetry.submit(self.supabase.build_statistics_row(session_id, stats))
+            if self.metrics is not None:
+                self.metrics.publish(name, stats)
+            self.last_stats[name] = stats
+        elif kind == 'alert':
+            alert = event[1]
+            self.alerts.raise_alert(alert['severity'], alert['message'], alert['details'])
+        elif kind == 'status' and self.on_status is not None:
+            self.on_status(event[1], event[2])
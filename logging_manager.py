@@ -1,163 +1,558 @@
+import collections
 import json
 import csv
+import gzip
 import os
+import queue
+import shutil
+import sqlite3
+import time
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional
 import threading
+from config_manager import atomic_write_json
+from session_catalog import LIVE_SUFFIX, SEGMENT_PATTERN, SessionCatalog, is_error_event
+
+
+_STOP = object()
 
 
 class SessionLogger:
-    def __init__(self, log_dir: str = "logs"):
+    """
+    Streams session events to append-only JSONL segments in `log_dir`.
+
+    log_event() only queues the event; a writer thread appends batches to
+    <session_id>.<n>.jsonl.live, flushes every `flush_interval` seconds and fsyncs per
+    `fsync_policy` ('always' after each batch, 'interval' every `fsync_interval`
+    seconds, 'never'). A segment is rotated once it reaches `max_segment_bytes` or
+    `max_segment_age` seconds; a closed segment is renamed to <session_id>.<n>.jsonl
+    and only then gzipped in the background. When the queue is
+    full, events are dropped and counted instead of blocking the caller.
+
+    end_session() drains the queue and writes a small <session_id>.json summary;
+    a session that crashed has segments but no summary and is still listed.
+    Sessions are also recorded in a SQLite catalog (log_dir/catalog.db) at start
+    and end, which get_sessions() queries instead of opening every file.
+    """
+
+    def __init__(self, log_dir: str = "logs", max_segment_bytes: int = 16 * 1024 * 1024,
+                 max_segment_age: float = 3600.0, flush_interval: float = 1.0, fsync_policy: str = 'interval',
+                 fsync_interval: float = 5.0, compress: bool = True, max_queue: int = 10000):
+        if fsync_policy not in ('always', 'interval', 'never'):
+            raise ValueError(f"Unknown fsync policy: {fsync_policy}")
+
         self.log_dir = log_dir
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.flush_interval = flush_interval
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.compress = compress
+
         self.current_session = None
-        self.session_events = []
         self.lock = threading.Lock()
-
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.thread: Optional[threading.Thread] = None
+
+        self.catalog: Optional[SessionCatalog] = None
+        self.catalog_backfilled = False
+
+        self.events_written = 0
+        self.events_dropped = 0
+        self.error_count = 0
+        self.segment_index = 0
+        self.segment_file = None
+        self.segment_path = None
+        self.segment_bytes = 0
+        self.segment_opened = 0.0
+        self.last_flush = 0.0
+        self.last_fsync = 0.0
 
     def start_session(self, session_type: str, config: Dict):
+        if self.current_session:
+            self.end_session()
+
+        start_time = datetime.now()
         with self.lock:
             self.current_session = {
-                'session_id': datetime.now().strftime("%Y%m%d_%H%M%S"),
+                # Milliseconds and a random suffix: sessions (or shard processes) may start in the same second
+                'session_id': f"{start_time.strftime('%Y%m%d_%H%M%S_%f')[:-3]}_{os.urandom(2).hex()}",
                 'type': session_type,
-                'start_time': datetime.now().isoformat(),
-                'config': config,
-                'events': []
+                'start_time': start_time.isoformat(),
+                'config': config
             }
-            self.session_events = []
+            self.events_written = 0
+            self.events_dropped = 0
+            self.error_count = 0
+            self.segment_index = 0
+
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._catalog_record(self.current_session, incomplete=True)
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.thread = threading.Thread(target=self._writer, args=(self.current_session['session_id'],),
+                                       daemon=True)
+        self.thread.start()
+        self._enqueue({'timestamp': start_time.isoformat(), 'type': 'session_start',
+                       'data': {'session_type': session_type, 'config': config}}, block=True)
 
     def log_event(self, event_type: str, data: Dict):
         if not self.current_session:
             return
 
-        with self.lock:
-            event = {
-                'timestamp': datetime.now().isoformat(),
-                'type': event_type,
-                'data': data
-            }
-            self.session_events.append(event)
+        if is_error_event(event_type, data):
+            with self.lock:
+                self.error_count += 1
+        self._enqueue({
+            'timestamp': datetime.now().isoformat(),
+            'type': event_type,
+            'data': data
+        })
+
+    def _enqueue(self, item, block: bool = False):
+        try:
+            if block:
+                self.queue.put(item, timeout=5.0)
+            else:
+                self.queue.put_nowait(item)
+        except queue.Full:
+            with self.lock:
+                self.events_dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until everything logged so far is written and synced to disk."""
+        if self.thread is None:
+            return True
+        done = threading.Event()
+        self._enqueue(done, block=True)
+        return done.wait(timeout)
 
     def end_session(self, stats: Dict = None):
         if not self.current_session:
             return
 
         with self.lock:
-            self.current_session['end_time'] = datetime.now().isoformat()
-            self.current_session['events'] = self.session_events
-            if stats:
-                self.current_session['final_stats'] = stats
-
-            self._save_session()
+            session = self.current_session
             self.current_session = None
-            self.session_events = []
 
-    def _save_session(self):
-        if not self.current_session:
+        end_time = datetime.now().isoformat()
+        self._enqueue({'timestamp': end_time, 'type': 'session_end', 'data': {'final_stats': stats}}, block=True)
+        self._enqueue(_STOP, block=True)
+        if self.thread is not None:
+            self.thread.join(10.0)
+            self.thread = None
+
+        summary = dict(session)
+        summary['end_time'] = end_time
+        if stats:
+            summary['final_stats'] = stats
+        summary['event_count'] = self.events_written
+        summary['events_dropped'] = self.events_dropped
+        summary['error_count'] = self.error_count
+        summary['segments'] = self.segment_index + 1
+        summary = json.loads(json.dumps(summary, default=str))
+
+        try:
+            atomic_write_json(os.path.join(self.log_dir, f"{session['session_id']}.json"), summary)
+        except OSError:
+            pass
+        self._catalog_record(summary, incomplete=False)
+
+    def get_catalog(self) -> Optional[SessionCatalog]:
+        if self.catalog is None:
+            try:
+                os.makedirs(self.log_dir, exist_ok=True)
+                self.catalog = SessionCatalog(os.path.join(self.log_dir, 'catalog.db'))
+            except (sqlite3.Error, OSError):
+                return None
+        return self.catalog
+
+    def _catalog_record(self, session: Dict, incomplete: bool):
+        # The catalog is an index over the files; failing to update it must not lose the session
+        catalog = self.get_catalog()
+        if catalog is None:
             return
+        try:
+            catalog.record(session, incomplete)
+        except sqlite3.Error:
+            pass
 
-        session_id = self.current_session['session_id']
-        json_path = os.path.join(self.log_dir, f"{session_id}.json")
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return {
+                'events_written': self.events_written,
+                'events_dropped': self.events_dropped,
+                'error_count': self.error_count,
+                'queue_depth': self.queue.qsize(),
+                'segment': self.segment_index
+            }
 
-        with open(json_path, 'w') as f:
-            json.dump(self.current_session, f, indent=2)
+    def _writer(self, session_id: str):
+        try:
+            while True:
+                try:
+                    batch = [self.queue.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    self._sync(force_flush=True)
+                    continue
+
+                while len(batch) < 1000:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                stop = False
+                for item in batch:
+                    if item is _STOP:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        self._sync(force_flush=True, force_fsync=True)
+                        item.set()
+                    else:
+                        self._write(session_id, item)
+
+                self._sync()
+                if stop:
+                    break
+        finally:
+            self._close_segment(compress=self.compress)
+
+    def _write(self, session_id: str, event: Dict):
+        if self.segment_file is not None and (self.segment_bytes >= self.max_segment_bytes or
+                                              time.monotonic() - self.segment_opened >= self.max_segment_age):
+            self._close_segment(compress=self.compress)
+            self.segment_index += 1
+
+        if self.segment_file is None:
+            self.segment_path = os.path.join(self.log_dir, f"{session_id}.{self.segment_index:04d}.jsonl")
+            # Written under a name of its own, so nothing compresses or replaces it while it is open
+            self.segment_file = open(self.segment_path + LIVE_SUFFIX, 'a', encoding='utf-8')
+            self.segment_bytes = self.segment_file.tell()
+            self.segment_opened = time.monotonic()
+
+        line = json.dumps(event, default=str) + '\n'
+        self.segment_file.write(line)
+        self.segment_bytes += len(line)
+        with self.lock:
+            self.events_written += 1
 
-    def export_to_csv(self, session_id: str = None):
-        if session_id:
-            json_path = os.path.join(self.log_dir, f"{session_id}.json")
-        else:
-            json_path = os.path.join(self.log_dir, f"{self.current_session['session_id']}.json")
+    def _sync(self, force_flush: bool = False, force_fsync: bool = False):
+        if self.segment_file is None:
+            return
+
+        now = time.monotonic()
+        always = self.fsync_policy == 'always'
+        if force_flush or always or now - self.last_flush >= self.flush_interval:
+            self.segment_file.flush()
+            self.last_flush = now
+
+            if force_fsync or always or (self.fsync_policy == 'interval' and
+                                         now - self.last_fsync >= self.fsync_interval):
+                os.fsync(self.segment_file.fileno())
+                self.last_fsync = now
 
-        if not os.path.exists(json_path):
-            return None
+    def _close_segment(self, compress: bool):
+        if self.segment_file is None:
+            return
+
+        self.segment_file.flush()
+        if self.fsync_policy != 'never':
+            os.fsync(self.segment_file.fileno())
+        self.segment_file.close()
+        self.segment_file = None
+        try:
+            os.replace(self.segment_path + LIVE_SUFFIX, self.segment_path)
+        except OSError:
+            return
 
-        with open(json_path, 'r') as f:
-            session_data = json.load(f)
+        if compress:
+            threading.Thread(target=compress_segment, args=(self.segment_path,), daemon=True).start()
 
-        csv_path = json_path.replace('.json', '.csv')
+    def segments(self, session_id: str) -> List[str]:
+        """Segment paths of a session in order (including the live one); a compressed copy wins over a plain one."""
+        found = {}
+        if not os.path.isdir(self.log_dir):
+            return []
+        for filename in os.listdir(self.log_dir):
+            match = SEGMENT_PATTERN.match(filename)
+            if match and match.group('session') == session_id:
+                index = int(match.group('index'))
+                if match.group('gz') or index not in found:
+                    found[index] = os.path.join(self.log_dir, filename)
+        return [found[index] for index in sorted(found)]
+
+    def iter_events(self, session_id: str) -> Iterator[Dict]:
+        """Stream a session's events from its segments; a torn last line (crash) is skipped."""
+        for path in self.segments(session_id):
+            opener = gzip.open if path.endswith('.gz') else open
+            try:
+                with opener(path, 'rt', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+            except (OSError, EOFError):
+                continue
+
+    def export_to_csv(self, session_id: str = None):
+        if session_id is None:
+            if not self.current_session:
+                return None
+            session_id = self.current_session['session_id']
+            self.flush()
+
+        events = self.iter_events(session_id)
+        if not self.segments(session_id):
+            # Sessions logged before segments existed keep their events in the summary
+            json_path = os.path.join(self.log_dir, f"{session_id}.json")
+            if not os.path.exists(json_path):
+                return None
+            with open(json_path, 'r') as f:
+                events = iter(json.load(f).get('events', []))
+
+        csv_path = os.path.join(self.log_dir, f"{session_id}.csv")
         with open(csv_path, 'w', newline='') as f:
             writer = csv.writer(f)
             writer.writerow(['Timestamp', 'Event Type', 'Data'])
 
-            for event in session_data.get('events', []):
+            for event in events:
                 writer.writerow([
                     event['timestamp'],
                     event['type'],
-                    json.dumps(event['data'])
+                    json.dumps(event['data'], default=str)
                 ])
 
         return csv_path
 
-    def get_sessions(self) -> List[Dict]:
-        sessions = []
-        for filename in os.listdir(self.log_dir):
-            if filename.endswith('.json'):
-                filepath = os.path.join(self.log_dir, filename)
-                with open(filepath, 'r') as f:
-                    sessions.append(json.load(f))
-
-        return sorted(sessions, key=lambda x: x['start_time'], reverse=True)
-
-
-class AudioRecorder:
-    def __init__(self, record_dir: str = "recordings"):
-        self.record_dir = record_dir
-        self.is_recording = False
-        self.current_file = None
+    def get_sessions(self, session_type: Optional[str] = None, since: Optional[str] = None,
+                     until: Optional[str] = None, host: Optional[str] = None, min_errors: Optional[int] = None,
+                     limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        """
+        Sessions newest first from the catalog, filtered by type, start time range
+        (ISO strings), host and minimum error count. The first call back-fills the
+        catalog from files written before it existed in a background thread, so
+        older sessions appear as it progresses.
+        """
+        catalog = self.get_catalog()
+        if catalog is None:
+            return []
+        if not self.catalog_backfilled:
+            self.catalog_backfilled = True
+            catalog.start_backfill(self.log_dir)
+        try:
+            return catalog.query(session_type, since, until, host, min_errors, limit, offset)
+        except sqlite3.Error:
+            return []
+
+
+def compress_segment(path: str):
+    """gzip a closed segment next to itself, then remove the original."""
+    tmp_path = path + '.gz.tmp'
+    try:
+        with open(path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, path + '.gz')
+        os.remove(path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class AlertSubscriber:
+    """
+    Delivers alerts to one callback from its own thread, so a slow callback
+    only delays itself. At most `max_pending` alerts wait; beyond that the
+    oldest is dropped and counted. A call running longer than `timeout` cannot
+    be interrupted, but is counted as a timeout while alerts queue behind it.
+    """
+
+    def __init__(self, callback, max_pending: int = 256, timeout: float = 1.0):
+        self.callback = callback
+        self.max_pending = max_pending
+        self.timeout = timeout
+
+        self.pending = collections.deque()
+        # Taking an alert and marking it in flight happen together, so idle() never falls between them
         self.lock = threading.Lock()
-
-        if not os.path.exists(record_dir):
-            os.makedirs(record_dir)
-
-    def start_recording(self, direction: str = "incoming"):
-        with self.lock:
-            if self.is_recording:
-                return
-
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{direction}_{timestamp}.raw"
-            self.current_file = open(os.path.join(self.record_dir, filename), 'wb')
-            self.is_recording = True
-
-    def write_audio(self, audio_data: bytes):
-        with self.lock:
-            if self.is_recording and self.current_file:
-                self.current_file.write(audio_data)
-
-    def stop_recording(self):
+        self.event = threading.Event()
+        self.busy_since: Optional[float] = None
+        self.timed_out = False
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.max_call_seconds = 0.0
+        self.last_error: Optional[str] = None
+
+        self.running = True
+        self.thread = threading.Thread(target=self._deliver, daemon=True)
+        self.thread.start()
+
+    @property
+    def name(self) -> str:
+        return getattr(self.callback, '__qualname__', repr(self.callback))
+
+    def put(self, alert: Dict):
+        if len(self.pending) >= self.max_pending:
+            try:
+                self.pending.popleft()
+                self.dropped += 1
+            except IndexError:
+                pass
+        self.pending.append(alert)
+        self.event.set()
+
+        busy_since = self.busy_since
+        if busy_since is not None and not self.timed_out and time.monotonic() - busy_since > self.timeout:
+            self.timed_out = True
+            self.timeouts += 1
+
+    def idle(self) -> bool:
         with self.lock:
-            if self.is_recording and self.current_file:
-                self.current_file.close()
-                self.current_file = None
-                self.is_recording = False
+            return not self.pending and self.busy_since is None
+
+    def close(self, timeout: float = 2.0):
+        self.running = False
+        self.event.set()
+        # A callback may unregister itself; its own thread exits after the call returns
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def get_stats(self) -> Dict:
+        return {
+            'callback': self.name,
+            'queue_depth': len(self.pending),
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'max_call_seconds': self.max_call_seconds,
+            'last_error': self.last_error
+        }
+
+    def _deliver(self):
+        while True:
+            self.event.wait()
+            self.event.clear()
+            while self.pending:
+                with self.lock:
+                    try:
+                        alert = self.pending.popleft()
+                    except IndexError:
+                        break
+                    started = time.monotonic()
+                    self.timed_out = False
+                    self.busy_since = started
+                try:
+                    self.callback(alert)
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = str(e)
+                elapsed = time.monotonic() - started
+                if elapsed > self.timeout and not self.timed_out:
+                    self.timeouts += 1
+                self.max_call_seconds = max(self.max_call_seconds, elapsed)
+                self.delivered += 1
+                self.busy_since = None
+            if not self.running:
+                break
 
 
 class AlertSystem:
-    def __init__(self):
-        self.alerts = []
-        self.callbacks = []
+    """
+    Keeps the last `max_alerts` alerts and hands new ones to the registered
+    callbacks, each through its own AlertSubscriber, so raise_alert() never
+    runs a callback and is safe from network and audio threads.
+
+    Alerts are keyed by (severity, message, details['link']) unless a key is
+    given. A repeat within `dedup_interval` seconds of the last alert of its key
+    is folded into that alert's 'count' instead of being raised again, and at
+    most `rate_limit` alerts per key are raised per `rate_window` seconds (the
+    rest are folded the same way), so a flapping link cannot flood the ring or
+    the callbacks.
+    """
+
+    MAX_KEYS = 4096
+
+    def __init__(self, max_alerts: int = 1000, dedup_interval: float = 5.0, rate_limit: int = 6,
+                 rate_window: float = 60.0, max_pending: int = 256, callback_timeout: float = 1.0):
+        self.alerts = collections.deque(maxlen=max_alerts)
+        self.dedup_interval = dedup_interval
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.max_pending = max_pending
+        self.callback_timeout = callback_timeout
+
+        self.subscribers: List[AlertSubscriber] = []
+        self.keys: Dict[tuple, Dict] = {}
         self.lock = threading.Lock()
+        self.raised = 0
+        self.deduplicated = 0
+        self.rate_limited = 0
 
     def register_callback(self, callback):
+        subscriber = AlertSubscriber(callback, self.max_pending, self.callback_timeout)
+        with self.lock:
+            self.subscribers.append(subscriber)
+
+    def unregister_callback(self, callback) -> bool:
+        """Stop delivering to `callback` and end its subscriber thread; False if it was not registered."""
         with self.lock:
-            self.callbacks.append(callback)
+            for subscriber in self.subscribers:
+                if subscriber.callback == callback:
+                    self.subscribers.remove(subscriber)
+                    break
+            else:
+                return False
+        subscriber.close(0.1)
+        return True
+
+    def raise_alert(self, severity: str, message: str, details: Dict = None, key=None) -> Optional[Dict]:
+        """Record and dispatch an alert; returns it, or None if it was folded into an earlier one."""
+        details = details or {}
+        key = key or (severity, message, details.get('link'))
+        timestamp = datetime.now().isoformat()
+        now = time.monotonic()
 
-    def raise_alert(self, severity: str, message: str, details: Dict = None):
         with self.lock:
+            self.raised += 1
+            state = self.keys.get(key)
+            if state is not None:
+                if now - state['window_start'] >= self.rate_window:
+                    state['window_start'], state['window_count'] = now, 0
+                if now - state['sent'] < self.dedup_interval or state['window_count'] >= self.rate_limit:
+                    if now - state['sent'] < self.dedup_interval:
+                        self.deduplicated += 1
+                    else:
+                        self.rate_limited += 1
+                    state['alert']['count'] += 1
+                    state['alert']['last_timestamp'] = timestamp
+                    return None
+            else:
+                if len(self.keys) >= self.MAX_KEYS:
+                    self._prune(now)
+                state = self.keys[key] = {'window_start': now, 'window_count': 0}
+
             alert = {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': timestamp,
                 'severity': severity,
                 'message': message,
-                'details': details or {}
+                'details': details,
+                'count': 1
             }
+            state['alert'] = alert
+            state['sent'] = now
+            state['window_count'] += 1
             self.alerts.append(alert)
 
-            for callback in self.callbacks:
-                try:
-                    callback(alert)
-                except Exception:
-                    pass
+            for subscriber in self.subscribers:
+                subscriber.put(alert)
+        return alert
+
+    def _prune(self, now: float):
+        horizon = max(self.dedup_interval, self.rate_window)
+        self.keys = {key: state for key, state in self.keys.items() if now - state['sent'] < horizon}
 
     def get_alerts(self, severity: str = None) -> List[Dict]:
         with self.lock:
@@ -168,3 +563,33 @@ class AlertSystem:
     def clear_alerts(self):
         with self.lock:
             self.alerts.clear()
+
+    def flush(self, timeout: float = 2.0) -> bool:
+        """Wait until every callback has seen every alert raised so far."""
+        deadline = time.monotonic() + timeout
+        while not all(subscriber.idle() for subscriber in self.subscribers):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: float = 2.0):
+        self.flush(timeout)
+        with self.lock:
+            subscribers, self.subscribers = self.subscribers, []
+        for subscriber in subscribers:
+            subscriber.close(0.1)
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            callbacks = [subscriber.get_stats() for subscriber in self.subscribers]
+            return {
+                'raised': self.raised,
+                'deduplicated': self.deduplicated,
+                'rate_limited': self.rate_limited,
+                'stored': len(self.alerts),
+                'dispatch_dropped': sum(c['dropped'] for c in callbacks),
+                'callback_timeouts': sum(c['timeouts'] for c in callbacks),
+                'callback_errors': sum(c['errors'] for c in callbacks),
+                'callbacks': callbacks
+            }
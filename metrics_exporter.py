@@ -0,0 +1,235 @@
+from __future__ import annotations
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# family name -> (type, help)
+FAMILIES = {
+    'mpx_uptime_seconds': ('gauge', 'Seconds since the link was started'),
+    'mpx_packets_sent': ('counter', 'Audio packets sent'),
+    'mpx_packets_received': ('counter', 'Audio packets received'),
+    'mpx_packets_lost': ('counter', 'Audio packets lost (expected minus received)'),
+    'mpx_packets_reordered': ('counter', 'Audio packets received out of order'),
+    'mpx_packets_duplicate': ('counter', 'Duplicate audio packets'),
+    'mpx_packets_late': ('counter', 'Audio packets older than the reorder window'),
+    'mpx_bytes_sent': ('counter', 'Payload bytes sent'),
+    'mpx_bytes_received': ('counter', 'Payload bytes received'),
+    'mpx_bitrate_bits_per_second': ('gauge', 'Average send bitrate'),
+    'mpx_jitter_seconds': ('gauge', 'RFC 3550 interarrival jitter'),
+    'mpx_latency_seconds': ('summary', 'Latency by kind (network, glass_to_glass, rtt)'),
+    'mpx_callback_duration_seconds': ('summary', 'Audio callback execution time'),
+    'mpx_callback_budget_seconds': ('gauge', 'Audio callback block period'),
+    'mpx_callback_overruns': ('counter', 'Audio callbacks that exceeded the block period'),
+    'mpx_callback_xruns': ('counter', 'PortAudio status flags reported to the audio callback'),
+    'mpx_buffer_fill_ratio': ('gauge', 'Receive jitter buffer fill level'),
+    'mpx_audio_level_dbfs': ('gauge', 'Audio RMS level per channel'),
+    'mpx_telemetry_queue_depth': ('gauge', 'Statistics rows waiting for upload'),
+    'mpx_telemetry_dropped_rows': ('counter', 'Statistics rows dropped because the queue or spool was unavailable'),
+    'mpx_telemetry_spooled_rows': ('gauge', 'Statistics rows spooled on disk awaiting upload'),
+    'mpx_telemetry_upload_latency_seconds': ('summary', 'Statistics batch upload latency'),
+    'mpx_recorder_queue_depth': ('gauge', 'Audio blocks waiting for the recording writer thread'),
+    'mpx_recorder_dropped_blocks': ('counter', 'Audio blocks dropped because the recording queue was full'),
+    'mpx_compression_queue_depth': ('gauge', 'Recording segments waiting for compression'),
+    'mpx_compression_segments': ('counter', 'Recording segments by compression outcome'),
+    'mpx_compression_ratio': ('gauge', 'Compressed size over original size of compressed segments'),
+    'mpx_audio_condition': ('gauge', 'Audio watchdog condition currently active (1) or not (0)'),
+    'mpx_audio_clipped_samples': ('counter', 'Samples at the rail seen by the audio watchdog'),
+    'mpx_audio_dc_offset': ('gauge', 'DC offset per channel as a fraction of full scale'),
+    'mpx_audio_correlation': ('gauge', 'Left/right correlation of the last block'),
+    'mpx_alerts': ('counter', 'Alerts by outcome (shared by the links of a process)'),
+    'mpx_alert_queue_depth': ('gauge', 'Alerts waiting for delivery to callbacks'),
+    'mpx_alert_dispatch_dropped': ('counter', 'Alerts dropped because a callback queue was full'),
+    'mpx_alert_callback_timeouts': ('counter', 'Alert callbacks that ran past their timeout'),
+}
+
+QUANTILES = (('0.5', 'p50'), ('0.9', 'p90'), ('0.99', 'p99'), ('0.999', 'p999'))
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _number(value) -> str:
+    return repr(float(value))
+
+
+def render_link(link: str, stats: Dict) -> Dict[str, List[str]]:
+    """Render one link's stats snapshot into OpenMetrics sample lines grouped by family."""
+    lines: Dict[str, List[str]] = {}
+    base = {'link': link}
+
+    def sample(family: str, value, suffix: str = '', **labels):
+        if value is None:
+            return
+        lines.setdefault(family, []).append(f"{family}{suffix}{_labels({**base, **labels})} {_number(value)}")
+
+    def summary(family: str, histogram: Optional[Dict], scale: float, **labels):
+        if not histogram:
+            return
+        for quantile, key in QUANTILES:
+            sample(family, histogram.get(key, 0) * scale, quantile=quantile, **labels)
+        sample(family, histogram.get('count', 0), '_count', **labels)
+        sample(family, histogram.get('mean', 0) * histogram.get('count', 0) * scale, '_sum', **labels)
+
+    sample('mpx_uptime_seconds', stats.get('uptime'))
+    for name in ('packets_sent', 'packets_received', 'packets_lost', 'packets_reordered',
+                 'packets_duplicate', 'packets_late', 'bytes_sent', 'bytes_received'):
+        sample(f"mpx_{name}", stats.get(name), '_total')
+    sample('mpx_bitrate_bits_per_second', stats.get('bitrate'))
+    sample('mpx_jitter_seconds', stats.get('jitter', 0) / 1000.0)
+
+    histograms = stats.get('histograms', {})
+    for kind in ('network', 'glass_to_glass', 'rtt'):
+        summary('mpx_latency_seconds', histograms.get(kind), 0.001, kind=kind)
+    summary('mpx_callback_duration_seconds', histograms.get('callback_duration'), 0.001)
+
+    callback = stats.get('callback')
+    if callback:
+        sample('mpx_callback_budget_seconds', callback.get('budget_ms', 0) / 1000.0)
+        sample('mpx_callback_overruns', callback.get('overruns'), '_total')
+        for flag, count in callback.get('xruns', {}).items():
+            sample('mpx_callback_xruns', count, '_total', flag=flag)
+
+    if 'buffer_fill' in stats:
+        sample('mpx_buffer_fill_ratio', stats['buffer_fill'] / 100.0)
+    for channel in ('left', 'right'):
+        sample('mpx_audio_level_dbfs', stats.get(f"{channel}_db"), channel=channel)
+
+    telemetry = stats.get('telemetry')
+    if telemetry:
+        sample('mpx_telemetry_queue_depth', telemetry.get('queue_depth'))
+        sample('mpx_telemetry_dropped_rows', telemetry.get('dropped'), '_total')
+        sample('mpx_telemetry_spooled_rows', telemetry.get('spooled'))
+        summary('mpx_telemetry_upload_latency_seconds', telemetry.get('upload_latency'), 0.001)
+
+    recorder = stats.get('recorder')
+    if recorder:
+        sample('mpx_recorder_queue_depth', recorder.get('queue_depth'))
+        sample('mpx_recorder_dropped_blocks', recorder.get('blocks_dropped'), '_total')
+        compression = recorder.get('compression')
+        if compression:
+            sample('mpx_compression_queue_depth', compression.get('queue_depth'))
+            for outcome in ('compressed', 'uncompressed', 'failed', 'deleted'):
+                sample('mpx_compression_segments', compression.get(outcome), '_total', outcome=outcome)
+            sample('mpx_compression_ratio', compression.get('ratio'))
+
+    watchdog = stats.get('watchdog')
+    if watchdog:
+        for condition, active in watchdog.get('conditions', {}).items():
+            sample('mpx_audio_condition', int(active), condition=condition)
+        sample('mpx_audio_clipped_samples', watchdog.get('clipped_samples'), '_total')
+        for channel, offset in enumerate(watchdog.get('dc_offset', []), 1):
+            sample('mpx_audio_dc_offset', offset, channel=str(channel))
+        sample('mpx_audio_correlation', watchdog.get('correlation'))
+
+    alerts = stats.get('alerts')
+    if alerts:
+        for outcome in ('raised', 'deduplicated', 'rate_limited'):
+            sample('mpx_alerts', alerts.get(outcome), '_total', outcome=outcome)
+        sample('mpx_alert_queue_depth', sum(c['queue_depth'] for c in alerts.get('callbacks', [])))
+        sample('mpx_alert_dispatch_dropped', alerts.get('dispatch_dropped'), '_total')
+        sample('mpx_alert_callback_timeouts', alerts.get('callback_timeouts'), '_total')
+
+    return lines
+
+
+class MetricsExporter:
+    """
+    Serves link statistics in OpenMetrics text format on a local HTTP endpoint.
+
+    Links publish() already aggregated stats snapshots (the GUI does so once a
+    second); a scrape only joins pre-rendered lines, so it never touches the
+    audio-path locks.
+    """
+
+    def __init__(self, bind: str = '127.0.0.1', port: int = 9464):
+        self.bind = bind
+        self.port = port
+        self.links: Dict[str, Dict[str, List[str]]] = {}
+        self.lock = threading.Lock()
+        self.cached_body: Optional[bytes] = None
+        self.version = 0
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> Tuple[str, int]:
+        if self.server is not None:
+            return self.server.server_address[:2]
+
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+
+                body = exporter.render()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.bind, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.server.server_address[:2]
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            self.thread = None
+
+    def publish(self, link: str, stats: Dict):
+        lines = render_link(link, stats)
+        with self.lock:
+            self.links[link] = lines
+            self.version += 1
+            self.cached_body = None
+
+    def remove_link(self, link: str):
+        with self.lock:
+            self.links.pop(link, None)
+            self.version += 1
+            self.cached_body = None
+
+    def render(self) -> bytes:
+        with self.lock:
+            if self.cached_body is not None:
+                return self.cached_body
+            links = list(self.links.values())
+            version = self.version
+
+        output = []
+        for family, (metric_type, help_text) in FAMILIES.items():
+            samples = [line for link_lines in links for line in link_lines.get(family, ())]
+            if not samples:
+                continue
+            output.append(f"# TYPE {family} {metric_type}")
+            output.append(f"# HELP {family} {help_text}")
+            output.extend(samples)
+        output.append('# EOF\n')
+        body = '\n'.join(output).encode('utf-8')
+
+        with self.lock:
+            if self.version == version:
+                self.cached_body = body
+        return body
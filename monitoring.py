@@ -2,20 +2,264 @@ import time
 import threading
 from collections import deque
 from typing import Dict, Optional
+from histogram import LogHistogram
+from pipeline_trace import PipelineTracer
+
+
+LATENCY_KINDS = ('network', 'glass_to_glass', 'rtt')
+
+# name -> (unit, highest value); latencies, jitter and durations in ms, buffer fill in percent
+HISTOGRAM_RANGES = {
+    'network': (0.001, 60000.0),
+    'glass_to_glass': (0.001, 60000.0),
+    'rtt': (0.001, 60000.0),
+    'jitter': (0.001, 10000.0),
+    'buffer_fill': (0.01, 100.0)
+}
+
+SEQ_MOD = 1 << 32
+SEQ_HALF = 1 << 31
+
+
+class ReceiveStatistics:
+    """
+    RFC 3550 style receive statistics over 32-bit packet sequence numbers.
+
+    Sequence numbers are extended with a wrap cycle count, and a bitmap window of
+    recently seen packets separates reordered packets (filling a gap) from
+    duplicates. Packets older than the window are counted as late.
+    """
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self.seen = bytearray(window)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.seen[:] = bytes(self.window)
+            self.base_sequence = None
+            self.highest_sequence = -1
+            self.received = 0
+            self.reordered = 0
+            self.duplicates = 0
+            self.late = 0
+            self.jitter_ns = 0.0
+            self.last_transit_ns = None
+
+    def update(self, sequence: int, capture_ts: Optional[int] = None, arrival_ts: Optional[int] = None):
+        with self.lock:
+            if self.base_sequence is None:
+                self.base_sequence = sequence
+                self.highest_sequence = sequence
+                self.seen[sequence % self.window] = 1
+                self.received = 1
+                self._update_jitter(capture_ts, arrival_ts)
+                return
+
+            delta = (sequence - self.highest_sequence) % SEQ_MOD
+            if delta >= SEQ_HALF:
+                delta -= SEQ_MOD
+            extended = self.highest_sequence + delta
+
+            if delta > 0:
+                self._clear(self.highest_sequence + 1, delta)
+                self.highest_sequence = extended
+            elif delta <= -self.window or extended < self.base_sequence:
+                self.late += 1
+                return
+            elif self.seen[extended % self.window]:
+                self.duplicates += 1
+                return
+            else:
+                self.reordered += 1
+
+            self.seen[extended % self.window] = 1
+            self.received += 1
+            self._update_jitter(capture_ts, arrival_ts)
+
+    def _clear(self, start: int, count: int):
+        if count >= self.window:
+            self.seen[:] = bytes(self.window)
+            return
+
+        first = start % self.window
+        end = first + count
+        if end <= self.window:
+            self.seen[first:end] = bytes(count)
+        else:
+            self.seen[first:] = bytes(self.window - first)
+            self.seen[:end - self.window] = bytes(end - self.window)
+
+    def _update_jitter(self, capture_ts: Optional[int], arrival_ts: Optional[int]):
+        if capture_ts is None or arrival_ts is None:
+            return
+
+        transit = arrival_ts - capture_ts
+        if self.last_transit_ns is not None:
+            d = abs(transit - self.last_transit_ns)
+            self.jitter_ns += (d - self.jitter_ns) / 16.0
+        self.last_transit_ns = transit
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            if self.base_sequence is None:
+                expected = 0
+            else:
+                expected = self.highest_sequence - self.base_sequence + 1
+            lost = max(expected - self.received, 0)
+
+            return {
+                'expected': expected,
+                'received': self.received,
+                'lost': lost,
+                'loss_rate': (lost / expected * 100) if expected > 0 else 0,
+                'reordered': self.reordered,
+                'duplicates': self.duplicates,
+                'late': self.late,
+                'jitter_ms': self.jitter_ns / 1e6,
+                'extended_sequence': self.highest_sequence,
+                'sequence_cycles': max(self.highest_sequence, 0) // SEQ_MOD
+            }
+
+
+CALLBACK_FLAGS = ('input_overflow', 'input_underflow', 'output_overflow', 'output_underflow', 'priming_output')
+
+
+class CallbackMonitor:
+    """
+    Instruments a sounddevice callback: status flags, execution time against the
+    block period (blocksize / samplerate) and the interval between invocations.
+
+    begin()/end() run on the audio thread and only update counters and histograms;
+    check_alerts() is polled from a housekeeping thread and raises AlertSystem alerts
+    for anything that happened since the previous poll.
+    """
+
+    def __init__(self, overrun_ratio: float = 1.0, late_ratio: float = 1.5):
+        self.overrun_ratio = overrun_ratio
+        self.late_ratio = late_ratio
+        self.lock = threading.Lock()
+        self.budget_ns = 0
+        self.duration = LogHistogram(0.001, 1000.0)
+        self.interval = LogHistogram(0.001, 1000.0)
+        self.reset()
+
+    def configure(self, blocksize: int, samplerate: int):
+        self.budget_ns = int(blocksize / samplerate * 1e9) if samplerate else 0
+
+    def reset(self):
+        with self.lock:
+            self.duration.reset()
+            self.interval.reset()
+            self.flags = {flag: 0 for flag in CALLBACK_FLAGS}
+            self.calls = 0
+            self.overruns = 0
+            self.late_calls = 0
+            self.max_duration_ns = 0
+            self.last_start_ns = None
+            self.reported = {'flags': dict(self.flags), 'overruns': 0, 'late_calls': 0}
+
+    def begin(self, status=None) -> int:
+        start_ns = time.perf_counter_ns()
+
+        if status:
+            for flag in CALLBACK_FLAGS:
+                if getattr(status, flag, False):
+                    self.flags[flag] += 1
+
+        last = self.last_start_ns
+        self.last_start_ns = start_ns
+        if last is not None:
+            gap_ns = start_ns - last
+            if self.budget_ns and gap_ns > self.budget_ns * self.late_ratio:
+                self.late_calls += 1
+            with self.lock:
+                self.interval.record(gap_ns / 1e6)
+
+        return start_ns
+
+    def end(self, start_ns: int):
+        duration_ns = time.perf_counter_ns() - start_ns
+        self.calls += 1
+        if duration_ns > self.max_duration_ns:
+            self.max_duration_ns = duration_ns
+        if self.budget_ns and duration_ns > self.budget_ns * self.overrun_ratio:
+            self.overruns += 1
+
+        with self.lock:
+            self.duration.record(duration_ns / 1e6)
+
+    def snapshot(self):
+        with self.lock:
+            return self.duration.copy(), self.interval.copy()
+
+    def get_stats(self) -> Dict:
+        duration, _ = self.snapshot()
+        budget_ms = self.budget_ns / 1e6
+        p99 = duration.percentile(99.0)
+
+        return {
+            'calls': self.calls,
+            'budget_ms': budget_ms,
+            'overruns': self.overruns,
+            'late_calls': self.late_calls,
+            'max_duration_ms': self.max_duration_ns / 1e6,
+            'load_p99': (p99 / budget_ms * 100) if budget_ms > 0 else 0,
+            'xruns': dict(self.flags)
+        }
+
+    def check_alerts(self, alerts, link: Optional[str] = None):
+        reported = self.reported
+        # Tag alerts with the link so they are told apart on a shared AlertSystem
+        context = {'link': link} if link is not None else {}
+
+        for flag, count in self.flags.items():
+            new = count - reported['flags'][flag]
+            if new > 0 and flag != 'priming_output':
+                alerts.raise_alert('warning', f"Audio {flag.replace('_', ' ')}",
+                                   {'new': new, 'total': count, **context})
+            reported['flags'][flag] = count
+
+        new_overruns = self.overruns - reported['overruns']
+        if new_overruns > 0:
+            alerts.raise_alert('warning', 'Audio callback exceeded its deadline', {
+                'new': new_overruns,
+                'total': self.overruns,
+                'budget_ms': self.budget_ns / 1e6,
+                'max_duration_ms': self.max_duration_ns / 1e6,
+                **context
+            })
+        reported['overruns'] = self.overruns
+
+        new_late = self.late_calls - reported['late_calls']
+        if new_late > 0:
+            alerts.raise_alert('warning', 'Audio callback invoked late', {
+                'new': new_late,
+                'total': self.late_calls,
+                'budget_ms': self.budget_ns / 1e6,
+                **context
+            })
+        reported['late_calls'] = self.late_calls
 
 
 class StreamMonitor:
     def __init__(self):
         self.packets_sent = 0
         self.packets_received = 0
-        self.packets_lost = 0
         self.bytes_sent = 0
         self.bytes_received = 0
-        self.latency_samples = deque(maxlen=100)
+        self.histograms = {
+            name: LogHistogram(unit, highest) for name, (unit, highest) in HISTOGRAM_RANGES.items()
+        }
+        self.interval_marks: Dict[str, LogHistogram] = {}
         self.quality_samples = deque(maxlen=100)
+        self.receive_stats = ReceiveStatistics()
+        self.pipeline = PipelineTracer()
+        self.callback = CallbackMonitor()
         self.start_time = None
         self.lock = threading.Lock()
-        self.last_sequence = -1
 
     def start(self):
         self.start_time = time.time()
@@ -25,65 +269,100 @@ class StreamMonitor:
             self.packets_sent += 1
             self.bytes_sent += size
 
-    def record_packet_received(self, size: int, sequence: Optional[int] = None):
+    def record_packet_received(self, size: int, sequence: Optional[int] = None,
+                               capture_ts: Optional[int] = None, arrival_ts: Optional[int] = None):
         with self.lock:
             self.packets_received += 1
             self.bytes_received += size
 
-            if sequence is not None and self.last_sequence >= 0:
-                expected = self.last_sequence + 1
-                if sequence > expected:
-                    self.packets_lost += (sequence - expected)
+        if sequence is not None:
+            self.receive_stats.update(sequence, capture_ts, arrival_ts)
+            if capture_ts is not None:
+                with self.lock:
+                    self.histograms['jitter'].record(self.receive_stats.jitter_ns / 1e6)
 
-            if sequence is not None:
-                self.last_sequence = sequence
+    def record_latency(self, latency_ms: float, kind: str = 'network'):
+        with self.lock:
+            self.histograms[kind].record(latency_ms)
 
-    def record_latency(self, latency_ms: float):
+    def record_buffer_fill(self, fill_percent: float):
         with self.lock:
-            self.latency_samples.append(latency_ms)
+            self.histograms['buffer_fill'].record(fill_percent)
 
     def record_quality(self, quality_percent: float):
         with self.lock:
             self.quality_samples.append(quality_percent)
 
+    def snapshot_histograms(self) -> Dict[str, LogHistogram]:
+        with self.lock:
+            return {name: histogram.copy() for name, histogram in self.histograms.items()}
+
+    def interval_snapshot(self) -> Dict[str, LogHistogram]:
+        """Histograms of the values recorded since the previous call; mergeable across links."""
+        current = self.snapshot_histograms()
+        interval = {}
+        for name, histogram in current.items():
+            mark = self.interval_marks.get(name)
+            interval[name] = histogram.subtract(mark) if mark is not None else histogram.copy()
+        self.interval_marks = current
+        return interval
+
     def get_stats(self) -> Dict:
+        receive = self.receive_stats.get_stats()
+        summaries = {name: histogram.summary() for name, histogram in self.snapshot_histograms().items()}
+        callback_duration, callback_interval = self.callback.snapshot()
+        summaries['callback_duration'] = callback_duration.summary()
+        summaries['callback_interval'] = callback_interval.summary()
+        network = summaries['network']
+
         with self.lock:
             uptime = time.time() - self.start_time if self.start_time else 0
 
-            avg_latency = sum(self.latency_samples) / len(self.latency_samples) if self.latency_samples else 0
-            max_latency = max(self.latency_samples) if self.latency_samples else 0
-            min_latency = min(self.latency_samples) if self.latency_samples else 0
-
             avg_quality = sum(self.quality_samples) / len(self.quality_samples) if self.quality_samples else 100
 
-            total_packets = self.packets_sent if self.packets_sent > 0 else self.packets_received
-            packet_loss_rate = (self.packets_lost / total_packets * 100) if total_packets > 0 else 0
-
-            bitrate = (self.bytes_sent * 8 / uptime) if uptime > 0 else 0
+            bitrate = ((self.bytes_sent + self.bytes_received) * 8 / uptime) if uptime > 0 else 0
 
             return {
                 'uptime': uptime,
                 'packets_sent': self.packets_sent,
                 'packets_received': self.packets_received,
-                'packets_lost': self.packets_lost,
-                'packet_loss_rate': packet_loss_rate,
+                'packets_lost': receive['lost'],
+                'packet_loss_rate': receive['loss_rate'],
+                'packets_expected': receive['expected'],
+                'packets_reordered': receive['reordered'],
+                'packets_duplicate': receive['duplicates'],
+                'packets_late': receive['late'],
+                'jitter': receive['jitter_ms'],
                 'bytes_sent': self.bytes_sent,
                 'bytes_received': self.bytes_received,
                 'bitrate': bitrate,
-                'avg_latency': avg_latency,
-                'max_latency': max_latency,
-                'min_latency': min_latency,
-                'avg_quality': avg_quality
+                'avg_latency': network['mean'],
+                'max_latency': network['max'],
+                'min_latency': network['min'],
+                'latency_p50': network['p50'],
+                'latency_p90': network['p90'],
+                'latency_p99': network['p99'],
+                'latency_p999': network['p999'],
+                'avg_glass_to_glass': summaries['glass_to_glass']['mean'],
+                'max_glass_to_glass': summaries['glass_to_glass']['max'],
+                'avg_rtt': summaries['rtt']['mean'],
+                'avg_quality': avg_quality,
+                'histograms': summaries,
+                'callback': self.callback.get_stats(),
+                'pipeline': self.pipeline.breakdown()
             }
 
     def reset(self):
         with self.lock:
             self.packets_sent = 0
             self.packets_received = 0
-            self.packets_lost = 0
             self.bytes_sent = 0
             self.bytes_received = 0
-            self.latency_samples.clear()
+            for histogram in self.histograms.values():
+                histogram.reset()
+            self.interval_marks = {}
             self.quality_samples.clear()
             self.start_time = None
-            self.last_sequence = -1
+        self.receive_stats.reset()
+        self.pipeline.reset()
+        self.callback.reset()
@@ -0,0 +1,396 @@
+"""
+Offline analysis of long recordings with bounded memory:
+
+    python mpx_analyze.py incoming_20250101_000000.wav --output day.timeline.npz
+    python mpx_analyze.py field.mpxcap --window 0.4 --output field.csv
+    python mpx_analyze.py dump.raw --samplerate 192000 --channels 1 --processes 8 --json
+
+Inputs are 16-bit WAV/RF64 (including *.wav.partial left by a crash), headerless
+raw int16 (--samplerate/--channels), or a packet capture, which is first decoded
+through the receiver (mpx_replay.replay) into a temporary WAV.
+
+The audio is memory-mapped and cut into chunks of whole windows that worker
+processes analyze independently; pages are released after each chunk, so memory
+stays at a few chunks whatever the file size. Per window the timeline holds RMS
+and peak dBFS, clipped samples, K-weighted loudness (LUFS) and the levels of the
+MPX bands (mono, pilot, stereo subcarrier, RDS). The summary adds integrated
+loudness, silence / clipping / pilot-loss events and an average spectrum.
+
+Loudness is K-weighted in the frequency domain over each window and gated over
+the timeline windows; --window 0.4 gives BS.1770's block length.
+"""
+import argparse
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from audio_processing import PILOT_FREQ, PILOT_TOLERANCE
+from audio_utils import amplitude_to_db
+from packet_capture import MAGIC as CAPTURE_MAGIC
+
+FLOOR_DB = -120.0
+BANDS = {
+    'mono_db': (30.0, 15000.0),
+    'pilot_db': (PILOT_FREQ - PILOT_TOLERANCE, PILOT_FREQ + PILOT_TOLERANCE),
+    'stereo_db': (23000.0, 53000.0),
+    'rds_db': (56000.0, 58000.0)
+}
+# BS.1770 channel weights: L, R, C, then surround channels
+CHANNEL_WEIGHTS = (1.0, 1.0, 1.0, 1.41, 1.41)
+
+
+def timeline_dtype(channels: int) -> np.dtype:
+    return np.dtype([
+        ('time_s', np.float64),
+        ('rms_db', np.float32, (channels,)),
+        ('peak_db', np.float32, (channels,)),
+        ('clips', np.uint32),
+        ('loudness', np.float32)
+    ] + [(name, np.float32) for name in BANDS])
+
+
+def open_wav(path: str) -> Tuple[int, int, int, int]:
+    """(data offset, frames, channels, samplerate) of a 16-bit PCM WAV or RF64 file."""
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff not in (b'RIFF', b'RF64') or wave != b'WAVE':
+            raise ValueError(f"{path} is not a WAV file")
+
+        fmt = None
+        ds64_size = None
+        position = 12
+        while position + 8 <= file_size:
+            f.seek(position)
+            chunk_id, chunk_size = struct.unpack('<4sI', f.read(8))
+            if chunk_id == b'ds64':
+                _, ds64_size, _ = struct.unpack('<QQQ', f.read(24))
+            elif chunk_id == b'fmt ':
+                fmt = struct.unpack('<HHIIHH', f.read(16))
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f"{path}: data chunk before fmt chunk")
+                tag, channels, samplerate, _, _, bits = fmt
+                if tag not in (1, 0xFFFE) or bits != 16:
+                    raise ValueError(f"{path}: only 16-bit PCM is supported")
+                size = ds64_size if chunk_size == 0xFFFFFFFF and ds64_size is not None else chunk_size
+                # A crashed recording's size is its last checkpoint; never read past the end of the file
+                size = min(size, file_size - position - 8)
+                return position + 8, size // (channels * 2), channels, samplerate
+            position += 8 + chunk_size + (chunk_size & 1)
+    raise ValueError(f"{path}: no data chunk")
+
+
+def decode_capture(path: str, directory: str, password: Optional[str] = None) -> str:
+    """Play a packet capture through the receiver into a WAV in `directory`."""
+    from mpx_replay import build_config, replay
+    from packet_capture import CaptureReader
+
+    reader = CaptureReader(path)
+    config = build_config(reader, argparse.Namespace(config=None, password=password, blocksize=None))
+    config.validate()
+    output = os.path.join(directory, os.path.basename(path) + '.wav')
+    replay(reader, config, output=output)
+    return output
+
+
+def k_weighting(freqs: np.ndarray, samplerate: int) -> np.ndarray:
+    """|H(f)|^2 of the BS.1770 K-weighting (high shelf then high pass), redesigned for `samplerate`."""
+    z = np.exp(-1j * 2 * np.pi * freqs / samplerate)
+
+    def biquad(b, a):
+        return (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+
+    # Bilinear-transform form whose 48 kHz coefficients are the ones tabulated in the recommendation
+    k = np.tan(np.pi * 1681.974450955533 / samplerate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    shelf = biquad((vh + vb * k / q + k * k, 2 * (k * k - vh), vh - vb * k / q + k * k),
+                   (1 + k / q + k * k, 2 * (k * k - 1), 1 - k / q + k * k))
+
+    k = np.tan(np.pi * 38.13547087602444 / samplerate)
+    q = 0.5003270373238773
+    highpass = biquad((1, -2, 1), (1 + k / q + k * k, 2 * (k * k - 1), 1 - k / q + k * k))
+    return np.abs(shelf * highpass) ** 2
+
+
+class WindowSpectrum:
+    """Bin-dependent constants for one window length, computed once per worker."""
+
+    def __init__(self, frames: int, samplerate: int, spectrum_bins: int):
+        freqs = np.fft.rfftfreq(frames, 1.0 / samplerate)
+        # One-sided power: every bin but DC (and Nyquist, for even lengths) stands for two
+        self.scale = np.full(len(freqs), 2.0 / frames ** 2)
+        self.scale[0] /= 2
+        if frames % 2 == 0:
+            self.scale[-1] /= 2
+        self.k_weight = k_weighting(freqs, samplerate)
+        self.bands = {name: (np.searchsorted(freqs, low), np.searchsorted(freqs, high, side='right'))
+                      for name, (low, high) in BANDS.items() if high < samplerate / 2}
+        self.groups = np.searchsorted(freqs, np.linspace(0, samplerate / 2, spectrum_bins + 1)[:-1])
+
+
+_source: Optional[Dict] = None
+
+
+def open_source(path: str, offset: int, frames: int, channels: int, samplerate: int, window_frames: int,
+                clip_level: float, spectrum_bins: int):
+    """Map the audio read-only; runs once in each worker process (and in-process for a single worker)."""
+    global _source
+    with open(path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mapping, 'madvise'):
+        mapping.madvise(mmap.MADV_SEQUENTIAL)
+    _source = {
+        'mmap': mapping,
+        'offset': offset,
+        'audio': np.frombuffer(mapping, dtype='<i2', count=frames * channels, offset=offset).reshape(-1, channels),
+        'samplerate': samplerate,
+        'window_frames': window_frames,
+        'clip': max(1, min(32767, int(clip_level * 32768))),
+        'spectrum_bins': spectrum_bins,
+        'spectra': {}
+    }
+
+
+def analyze_chunk(bounds: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Timeline rows, summed spectrum power and window count for frames [start, end)."""
+    start, end = bounds
+    source = _source
+    audio = source['audio']
+    samplerate = source['samplerate']
+    window_frames = source['window_frames']
+    channels = audio.shape[1]
+    weights = np.array([CHANNEL_WEIGHTS[min(i, len(CHANNEL_WEIGHTS) - 1)] for i in range(channels)])
+
+    rows = np.zeros(-(-(end - start) // window_frames), dtype=timeline_dtype(channels))
+    spectrum = np.zeros(source['spectrum_bins'])
+    full_windows = 0
+    for i, position in enumerate(range(start, end, window_frames)):
+        block = audio[position:min(position + window_frames, end)]
+        frames = len(block)
+        row = rows[i]
+        row['time_s'] = position / samplerate
+
+        peak = np.maximum(block.max(axis=0).astype(np.int32), -block.min(axis=0).astype(np.int32))
+        row['peak_db'] = amplitude_to_db(peak / 32768.0, FLOOR_DB)
+        # Clipping is consecutive samples at the rail; a lone peak sample of a loud sine is not
+        railed = (block >= source['clip']) | (block <= -source['clip'])
+        row['clips'] = np.count_nonzero(railed[1:] & railed[:-1])
+
+        spectra = source['spectra']
+        if frames not in spectra:
+            spectra[frames] = WindowSpectrum(frames, samplerate, source['spectrum_bins'])
+        constants = spectra[frames]
+
+        x = np.fft.rfft(block.T.astype(np.float32) / 32768.0, axis=1)
+        power = (x.real ** 2 + x.imag ** 2) * constants.scale        # (channels, bins), sums to mean square
+        row['rms_db'] = amplitude_to_db(np.sqrt(power.sum(axis=1)), FLOOR_DB)
+        weighted = (power @ constants.k_weight) @ weights
+        row['loudness'] = -0.691 + amplitude_to_db(np.sqrt(weighted), FLOOR_DB)
+
+        mono = power.mean(axis=0)
+        for name in BANDS:
+            if name in constants.bands:
+                low, high = constants.bands[name]
+                row[name] = amplitude_to_db(np.sqrt(mono[low:high].sum()), FLOOR_DB)
+            else:
+                row[name] = np.nan
+        if frames == window_frames:
+            spectrum += np.add.reduceat(mono, constants.groups)
+            full_windows += 1
+
+    # Done with these pages: let the kernel drop them rather than count them against us
+    if hasattr(source['mmap'], 'madvise'):
+        begin = source['offset'] + start * channels * 2
+        aligned = begin - begin % mmap.PAGESIZE
+        length = source['offset'] + end * channels * 2 - aligned
+        try:
+            source['mmap'].madvise(mmap.MADV_DONTNEED, aligned, length)
+        except (OSError, ValueError):
+            pass
+    return rows, spectrum, full_windows
+
+
+def find_runs(mask: np.ndarray, times: np.ndarray, window: float, min_seconds: float = 0.0) -> List[Dict]:
+    """Contiguous runs of True windows lasting at least `min_seconds`."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    runs = []
+    for first, last in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+        start_s = float(times[first])
+        end_s = float(times[last - 1]) + window
+        if end_s - start_s >= min_seconds:
+            runs.append({'start_s': round(start_s, 3), 'end_s': round(end_s, 3),
+                         'duration_s': round(end_s - start_s, 3)})
+    return runs
+
+
+def integrated_loudness(loudness: np.ndarray) -> Optional[float]:
+    """BS.1770 gating (-70 LUFS absolute, -10 LU relative) over the window loudness values."""
+    power = 10 ** ((loudness[loudness > -70.0] + 0.691) / 10)
+    if not len(power):
+        return None
+    relative = -0.691 + 10 * np.log10(power.mean()) - 10.0
+    gated = power[-0.691 + 10 * np.log10(power) > relative]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def summarize(timeline: np.ndarray, spectrum: np.ndarray, windows: int, samplerate: int, frames: int,
+              window: float, args) -> Dict:
+    times = timeline['time_s']
+    loudest = timeline['rms_db'].max(axis=1)
+    clipped = timeline['clips'] > 0
+    pilot = timeline['pilot_db']
+    has_pilot_band = len(pilot) and not np.isnan(pilot[0])
+    pilot_present = pilot >= args.pilot_db if has_pilot_band else np.zeros(len(timeline), dtype=bool)
+
+    with np.errstate(divide='ignore'):
+        band_means = {name: round(float(10 * np.log10(np.mean(10 ** (timeline[name] / 10)))), 2)
+                      for name in BANDS if len(timeline) and not np.isnan(timeline[name][0])}
+    lufs = integrated_loudness(timeline['loudness'])
+    return {
+        'samplerate': samplerate,
+        'channels': timeline['rms_db'].shape[1] if len(timeline) else 0,
+        'duration_s': frames / samplerate,
+        'windows': len(timeline),
+        'window_s': window,
+        'integrated_lufs': round(lufs, 2) if lufs is not None else None,
+        'peak_db': [round(float(v), 2) for v in timeline['peak_db'].max(axis=0)] if len(timeline) else [],
+        'clipped_samples': int(timeline['clips'].sum()),
+        'bands_db': band_means,
+        'pilot_present_fraction': round(float(pilot_present.mean()), 4) if len(timeline) else 0.0,
+        'silence': find_runs(loudest < args.silence_db, times, window, args.min_silence),
+        'clipping': find_runs(clipped, times, window),
+        # Pilot loss only means something in a recording that carries a pilot at all
+        'pilot_lost': find_runs(~pilot_present, times, window, args.min_silence) if pilot_present.any() else [],
+        'spectrum_db': (amplitude_to_db(np.sqrt(spectrum / windows), FLOOR_DB).round(2).tolist()
+                        if windows else [])
+    }
+
+
+def write_timeline(path: str, timeline: np.ndarray, summary: Dict):
+    if path.endswith('.csv'):
+        channels = timeline['rms_db'].shape[1]
+        columns = (['time_s'] + [f'rms_db_{c + 1}' for c in range(channels)] +
+                   [f'peak_db_{c + 1}' for c in range(channels)] + ['clips', 'loudness'] + list(BANDS))
+        flat = np.column_stack([timeline['time_s'], timeline['rms_db'], timeline['peak_db'], timeline['clips'],
+                                timeline['loudness']] + [timeline[name] for name in BANDS])
+        np.savetxt(path, flat, delimiter=',', header=','.join(columns), comments='', fmt='%.6g')
+    else:
+        np.savez_compressed(path, timeline=timeline, summary=json.dumps(summary))
+
+
+def analyze(path: str, offset: int, frames: int, channels: int, samplerate: int, window: float = 1.0,
+            chunk_seconds: float = 30.0, processes: int = 0, clip_level: float = 1.0,
+            spectrum_bins: int = 512, progress=None) -> Tuple[np.ndarray, np.ndarray, int]:
+    window_frames = max(1, int(window * samplerate))
+    chunk_frames = max(1, int(chunk_seconds * samplerate) // window_frames) * window_frames
+    chunks = [(start, min(start + chunk_frames, frames)) for start in range(0, frames, chunk_frames)]
+    processes = processes or os.cpu_count() or 1
+    initargs = (path, offset, frames, channels, samplerate, window_frames, clip_level, spectrum_bins)
+
+    timeline = []
+    spectrum = np.zeros(spectrum_bins)
+    windows = 0
+
+    def collect(results):
+        nonlocal spectrum, windows
+        for done, (rows, chunk_spectrum, chunk_windows) in enumerate(results, 1):
+            timeline.append(rows)
+            spectrum += chunk_spectrum
+            windows += chunk_windows
+            if progress is not None:
+                progress(done, len(chunks))
+
+    if processes == 1 or len(chunks) == 1:
+        open_source(*initargs)
+        collect(map(analyze_chunk, chunks))
+    else:
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(min(processes, len(chunks)), initializer=open_source, initargs=initargs) as pool:
+            collect(pool.imap(analyze_chunk, chunks))
+
+    rows = np.concatenate(timeline) if timeline else np.zeros(0, dtype=timeline_dtype(channels))
+    return rows, spectrum, windows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Analyze a long recording into a level/loudness timeline')
+    parser.add_argument('input', help='WAV/RF64 recording, raw int16 audio or packet capture')
+    parser.add_argument('--output', help='timeline file: .npz (default) or .csv')
+    parser.add_argument('--window', type=float, default=1.0, help='timeline resolution in seconds')
+    parser.add_argument('--chunk', type=float, default=30.0, help='seconds of audio per work unit')
+    parser.add_argument('--processes', type=int, default=0, help='worker processes (default: one per core)')
+    parser.add_argument('--samplerate', type=int, help='samplerate of raw input')
+    parser.add_argument('--channels', type=int, help='channel count of raw input')
+    parser.add_argument('--password', help='password of an encrypted packet capture')
+    parser.add_argument('--silence-db', type=float, default=-60.0, help='RMS below which a window is silent')
+    parser.add_argument('--min-silence', type=float, default=2.0, help='shortest silence / pilot loss reported (s)')
+    parser.add_argument('--clip-level', type=float, default=1.0, help='fraction of full scale counted as the rail')
+    parser.add_argument('--pilot-db', type=float, default=-40.0, help='pilot band level that counts as present')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args(argv)
+
+    temp_dir = None
+    try:
+        with open(args.input, 'rb') as f:
+            magic = f.read(len(CAPTURE_MAGIC))
+        path = args.input
+        if magic == CAPTURE_MAGIC:
+            temp_dir = tempfile.TemporaryDirectory(prefix='mpx_analyze_')
+            path = decode_capture(args.input, temp_dir.name, args.password)
+        if magic[:4] in (b'RIFF', b'RF64') or path != args.input:
+            offset, frames, channels, samplerate = open_wav(path)
+        elif args.samplerate and args.channels:
+            offset, channels, samplerate = 0, args.channels, args.samplerate
+            frames = os.path.getsize(path) // (channels * 2)
+        else:
+            raise ValueError("raw input needs --samplerate and --channels")
+        if not frames:
+            raise ValueError(f"{args.input} holds no audio")
+
+        def progress(done, total):
+            if not args.json and sys.stderr.isatty():
+                print(f"\r{done}/{total} chunks", end='' if done < total else '\n', file=sys.stderr)
+
+        started = time.monotonic()
+        timeline, spectrum, windows = analyze(path, offset, frames, channels, samplerate, args.window,
+                                              args.chunk, args.processes, args.clip_level, progress=progress)
+        elapsed = time.monotonic() - started
+    except (OSError, ValueError, struct.error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    summary = summarize(timeline, spectrum, windows, samplerate, frames, args.window, args)
+    summary['input'] = args.input
+    summary['analysis_seconds'] = round(elapsed, 2)
+    if args.output:
+        write_timeline(args.output, timeline, summary)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return 0
+    for key, value in summary.items():
+        if key == 'spectrum_db':
+            continue
+        if isinstance(value, list) and value and isinstance(value[0], dict):
+            print(f"{key:>24}: {len(value)}")
+            for run in value[:20]:
+                print(f"{'':>26}{run['start_s']:>10.1f} s  {run['duration_s']:.1f} s")
+        else:
+            print(f"{key:>24}: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
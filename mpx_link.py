@@ -0,0 +1,303 @@
+"""
+Headless MPX link: runs a sender or receiver without a GUI, e.g. on a server or
+as a systemd service.
+
+    python mpx_link.py send --port 5000 --device "USB Audio"
+    python mpx_link.py receive --host 10.0.0.2 --port 5000 --mpx
+    python mpx_link.py receive --config link.json --metrics-port 9464
+    python mpx_link.py devices
+    python mpx_link.py host --config site.json --workers 4 --affinity
+
+A --config file holds LinkConfig fields as JSON; options given on the command
+line override it. `host` runs every link of a site file (see
+link_supervisor.load_site_config), optionally sharded over worker processes.
+Config and site files are watched: edits are applied to the running links
+without a restart where the link allows it. SIGINT and SIGTERM stop the links
+cleanly.
+"""
+import argparse
+import json
+import signal
+import sys
+import threading
+import time
+from typing import Callable, Optional
+from device_registry import DeviceRegistry
+from link_engine import LinkConfig, MPX_COMPOSITE, PROTOCOLS, create_engine
+from config_manager import ConfigWatcher
+from link_supervisor import LinkSupervisor, ShardedSupervisor, load_site_config
+from logging_manager import AlertSystem
+from metrics_exporter import MetricsExporter
+from supabase_integration import SupabaseManager
+from telemetry import TelemetryUploader
+
+
+def log(message: str):
+    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}", flush=True)
+
+
+def format_stats(kind: str, stats) -> str:
+    if kind == 'receiver':
+        line = (f"rx {stats['packets_received']} pkts, loss {stats['packet_loss_rate']:.2f}%, "
+                f"jitter {stats['jitter']:.3f} ms, buffer {stats['buffer_fill']:.0f}%")
+    else:
+        line = f"tx {stats['packets_sent']} pkts"
+    return (f"{line}, {stats['bitrate'] / 1000000:.2f} Mbps, latency p99 {stats['latency_p99']:.2f} ms, "
+            f"L {stats['left_db']:.1f} dB R {stats['right_db']:.1f} dB")
+
+
+def build_config(args) -> LinkConfig:
+    data = {}
+    if args.config:
+        with open(args.config, 'r') as f:
+            data = json.load(f)
+    data['mode'] = 'sender' if args.command == 'send' else 'receiver'
+
+    overrides = {
+        'host': args.host,
+        'port': args.port,
+        'protocol': args.protocol,
+        'samplerate': args.samplerate,
+        'blocksize': args.blocksize,
+        'device': args.device,
+        'password': args.password,
+        'shared_secret': args.secret,
+        'trace_sample_every': args.trace_sample_every,
+        'reconnect_interval': args.reconnect_interval,
+        'bandwidth_limit': args.bandwidth_limit,
+        'black_box_seconds': args.black_box
+    }
+    data.update({key: value for key, value in overrides.items() if value is not None})
+
+    for flag in ('agc', 'limiter', 'fec', 'trace'):
+        if getattr(args, flag):
+            data[flag] = True
+    if args.mpx:
+        data['channel_mode'] = MPX_COMPOSITE
+    if args.no_reconnect:
+        data['auto_reconnect'] = False
+    if args.command == 'receive' and 'host' not in data:
+        data['host'] = '127.0.0.1'
+
+    return LinkConfig.from_dict(data)
+
+
+def list_devices():
+    registry = DeviceRegistry()
+    for device in registry.devices():
+        kinds = [kind for kind in ('input', 'output') if device.supports(kind)]
+        print(f"{device.label}  [{device.hostapi}] {'/'.join(kinds)}, "
+              f"{device.max_input_channels} in / {device.max_output_channels} out, "
+              f"{device.default_samplerate:.0f} Hz")
+
+
+def start_services(metrics_port: Optional[int], metrics_bind: str, telemetry_enabled: bool, telemetry_spool: str):
+    alerts = AlertSystem()
+    alerts.register_callback(lambda alert: log(f"[{alert['severity']}] {alert['message']} {alert['details']}"))
+
+    metrics = None
+    if metrics_port:
+        metrics = MetricsExporter(metrics_bind, metrics_port)
+        metrics.start()
+        log(f"Metrics on http://{metrics_bind}:{metrics_port}/metrics")
+
+    supabase = SupabaseManager(connect=False)
+    telemetry = None
+    if telemetry_enabled and supabase.connect():
+        telemetry = TelemetryUploader(supabase, spool_path=telemetry_spool)
+        telemetry.start()
+
+    return alerts, supabase, telemetry, metrics
+
+
+def stop_services(alerts, telemetry, metrics):
+    if telemetry is not None:
+        telemetry.stop()
+    if metrics is not None:
+        metrics.stop()
+    # Let the log callback print what the shutdown raised
+    alerts.close()
+
+
+def wait_for_signal(interval: float, report: Callable[[], None]):
+    stop_requested = threading.Event()
+
+    def request_stop(signum, frame):
+        stop_requested.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    while not stop_requested.wait(interval or None):
+        report()
+
+
+def run_link(args) -> int:
+    config = build_config(args)
+    alerts, supabase, telemetry, metrics = start_services(args.metrics_port, args.metrics_bind, args.telemetry,
+                                                          args.telemetry_spool)
+
+    engine = create_engine(config, alerts=alerts, supabase=supabase, telemetry=telemetry, metrics=metrics,
+                           history_dir=args.history_dir, on_status=lambda message: log(message))
+
+    try:
+        engine.start()
+    except Exception as e:
+        log(f"Failed to start {config.mode}: {e}")
+        stop_services(alerts, telemetry, metrics)
+        return 1
+
+    log(f"{config.mode} running on {config.host}:{config.port} ({config.protocol}, {config.samplerate} Hz, "
+        f"device {engine.device.label})")
+    if args.capture:
+        log(f"Capturing packets to {engine.start_capture(args.capture)}")
+
+    def report():
+        if engine.last_stats is not None:
+            log(format_stats(engine.kind, engine.last_stats))
+
+    def reload():
+        try:
+            changed = engine.reconfigure(build_config(args))
+        except (OSError, ValueError) as e:
+            log(f"Config change not applied: {e}")
+            return
+        if changed:
+            log(f"Config reloaded: {', '.join(changed)}")
+
+    watcher = None
+    if args.config:
+        watcher = ConfigWatcher(args.config, reload)
+        watcher.start()
+
+    wait_for_signal(args.stats_interval, report)
+
+    log("Stopping...")
+    if watcher is not None:
+        watcher.stop()
+    engine.stop()
+    stop_services(alerts, telemetry, metrics)
+    return 0
+
+
+def run_host(args) -> int:
+    site = load_site_config(args.config)
+    links = site['links']
+    receivers = {link.name for link in links if link.mode == 'receiver'}
+
+    def option(name, default):
+        value = getattr(args, name)
+        return site.get(name, default) if value is None else value
+
+    workers = option('workers', 0)
+    alerts, supabase, telemetry, metrics = start_services(option('metrics_port', None),
+                                                          option('metrics_bind', '127.0.0.1'),
+                                                          args.telemetry or site.get('telemetry', False),
+                                                          option('telemetry_spool', 'telemetry_spool.db'))
+    history_dir = option('history_dir', 'history')
+    log_dir = option('log_dir', 'logs')
+
+    def on_status(name, message):
+        log(f"{name}: {message}")
+
+    if workers > 1:
+        supervisor = ShardedSupervisor(links, workers, affinity=args.affinity or site.get('affinity', False),
+                                       alerts=alerts, supabase=supabase, telemetry=telemetry, metrics=metrics,
+                                       history_dir=history_dir, log_dir=log_dir, on_status=on_status)
+        supervisor.start()
+        log(f"Hosting {len(links)} links in {supervisor.workers} worker processes")
+    else:
+        supervisor = LinkSupervisor(links, alerts=alerts, supabase=supabase, telemetry=telemetry, metrics=metrics,
+                                    history_dir=history_dir, log_dir=log_dir, on_status=on_status)
+        running = supervisor.start()
+        log(f"Hosting {len(running)} of {len(links)} links")
+
+    def report():
+        for name, stats in supervisor.get_stats().items():
+            if stats is not None:
+                log(f"{name}: {format_stats('receiver' if name in receivers else 'sender', stats)}")
+
+    def reload():
+        try:
+            supervisor.reconfigure(load_site_config(args.config)['links'])
+        except (OSError, ValueError) as e:
+            log(f"Site file change not applied: {e}")
+
+    watcher = ConfigWatcher(args.config, reload)
+    watcher.start()
+
+    wait_for_signal(option('stats_interval', 10.0), report)
+
+    log("Stopping...")
+    watcher.stop()
+    supervisor.stop()
+    stop_services(alerts, telemetry, metrics)
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='mpx-link', description='Run an MPX audio link without a GUI')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('devices', help='list audio devices')
+
+    host = subparsers.add_parser('host', help='run every link of a site file in this process or a worker pool')
+    host.add_argument('--config', required=True, help='site JSON file with a "links" list')
+    host.add_argument('--workers', type=int, help='shard links over this many worker processes')
+    host.add_argument('--affinity', action='store_true', help='pin each worker process to one CPU')
+    host.add_argument('--metrics-port', type=int, help='serve OpenMetrics for all links on this port')
+    host.add_argument('--metrics-bind')
+    host.add_argument('--history-dir')
+    host.add_argument('--log-dir')
+    host.add_argument('--telemetry', action='store_true', help='upload statistics to Supabase if configured')
+    host.add_argument('--telemetry-spool')
+    host.add_argument('--stats-interval', type=float, help='seconds between stats lines (0 disables)')
+
+    for command, help_text in (('send', 'capture from an input device and send'),
+                               ('receive', 'receive and play out on an output device')):
+        sub = subparsers.add_parser(command, help=help_text)
+        sub.add_argument('--config', help='JSON file with LinkConfig fields')
+        sub.add_argument('--host', help='sender: UDP destination; receiver: address to connect to or bind')
+        sub.add_argument('--port', type=int)
+        sub.add_argument('--protocol', choices=PROTOCOLS)
+        sub.add_argument('--samplerate', type=int)
+        sub.add_argument('--blocksize', type=int)
+        sub.add_argument('--device', help='device label, index or name (default: first suitable device)')
+        sub.add_argument('--mpx', action='store_true', help='mono MPX composite instead of stereo')
+        sub.add_argument('--agc', action='store_true')
+        sub.add_argument('--limiter', action='store_true')
+        sub.add_argument('--fec', action='store_true')
+        sub.add_argument('--password', help='enable AES encryption with this password')
+        sub.add_argument('--secret', help='shared secret for authentication')
+        sub.add_argument('--no-reconnect', action='store_true', help='receiver: do not reconnect after a drop')
+        sub.add_argument('--reconnect-interval', type=float, help='receiver: seconds between reconnect attempts')
+        sub.add_argument('--bandwidth-limit', type=int, help='sender: kbit/s cap, packets over it are dropped')
+        sub.add_argument('--black-box', type=float, metavar='SECONDS',
+                         help='seconds of audio kept in memory and dumped on alerts (0 disables)')
+        sub.add_argument('--capture', metavar='FILE', help='record sent/received packets for mpx_replay.py')
+        sub.add_argument('--trace', action='store_true', help='enable pipeline tracing')
+        sub.add_argument('--trace-sample-every', type=int)
+        sub.add_argument('--metrics-port', type=int, help='serve OpenMetrics on this port')
+        sub.add_argument('--metrics-bind', default='127.0.0.1')
+        sub.add_argument('--history-dir', default='history')
+        sub.add_argument('--telemetry', action='store_true', help='upload statistics to Supabase if configured')
+        sub.add_argument('--telemetry-spool', default='telemetry_spool.db')
+        sub.add_argument('--stats-interval', type=float, default=10.0,
+                         help='seconds between stats lines (0 disables)')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'devices':
+        list_devices()
+        return 0
+
+    try:
+        if args.command == 'host':
+            return run_host(args)
+        return run_link(args)
+    except (OSError, ValueError) as e:
+        log(f"Error: {e}")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
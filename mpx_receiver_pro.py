@@ -1,21 +1,21 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-import sounddevice as sd
-import numpy as np
-import socket
+import multiprocessing
 import threading
-import struct
-import time
-from datetime import datetime
-from collections import deque
-from audio_utils import get_audio_devices, calculate_db_fs, normalize_db
-from monitoring import StreamMonitor
-from audio_processing import AudioProcessor, FFTAnalyzer, PeakHolder
-from encryption import AudioEncryption, AuthenticationManager, FECEncoder
-from logging_manager import SessionLogger, AudioRecorder, AlertSystem
-from config_manager import ConfigManager
+from audio_utils import get_audio_devices, normalize_db
+from device_registry import DeviceRegistry, DeviceWatcher
+from logging_manager import SessionLogger, AlertSystem
+from audio_recorder import AudioRecorder
+from segment_compressor import SegmentCompressor, parse_cpu_list
+from config_manager import ConfigError, ConfigManager
 from supabase_integration import SupabaseManager
 from modern_theme import ModernTheme
+from pipeline_trace import format_breakdown
+from metrics_exporter import MetricsExporter
+from telemetry import TelemetryUploader
+from preset_store import PresetStore, PresetSync
+from lazy_import import preload
+from link_engine import LinkConfig, ReceiverEngine
 
 
 class MPXReceiverPro:
@@ -27,41 +27,123 @@ class MPXReceiverPro:
         self.theme = ModernTheme('dark')
         self.theme.apply_to_root(self.root)
 
-        self.is_running = False
-        self.reconnect_enabled = False
-        self.stream = None
-        self.socket_obj = None
-        self.audio_buffer = deque(maxlen=100)
-        self.buffer_lock = threading.Lock()
-        self.vu_levels = [0.0, 0.0]
-        self.peak_levels = [0.0, 0.0]
-        self.vu_lock = threading.Lock()
-        self.last_vu_update = time.time()
-        self.expected_sequence = 0
-
-        self.monitor = StreamMonitor()
-        self.audio_processor = AudioProcessor()
-        self.fft_analyzer = FFTAnalyzer()
-        self.peak_holder = PeakHolder()
-        self.encryption = AudioEncryption()
-        self.auth = AuthenticationManager()
-        self.fec = FECEncoder()
+        # The link itself runs in a ReceiverEngine; this window only configures and displays it
+        self.engine = None
+        self.devices = DeviceRegistry()
+        self.device_watcher = DeviceWatcher(self.devices, on_devices_changed=self.on_devices_changed,
+                                            on_event=self.on_device_event)
         self.logger = SessionLogger()
-        self.recorder = AudioRecorder()
         self.alerts = AlertSystem()
         self.config = ConfigManager()
-        self.supabase = SupabaseManager()
+        self.recorder = self.create_recorder()
+        self.supabase = SupabaseManager(connect=False)
 
-        self.session_id = None
-        self.is_mpx_mode = False
+        self.preset_store = PresetStore(self.config.get('preset_db', 'presets.db'))
+        if self.preset_store.is_empty() and self.config.presets:
+            self.preset_store.import_legacy(
+                {name: preset.config for name, preset in self.config.presets.items()}, 'receiver'
+            )
+
+        self.preset_sync = None
+        self.telemetry = None
+        self.metrics = None
 
         self.setup_gui()
-        self.update_vu_meters()
-        self.update_stats_display()
         self.load_config()
+        self.config.subscribe(self.on_config_changed)
+        self.config.start_watching()
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
+        # Show the window first; heavy imports, device enumeration and Supabase follow
+        self.root.after_idle(self.start_background_init)
+
+    def create_recorder(self) -> AudioRecorder:
+        record_dir = self.config.get('record_dir', 'recordings')
+        compressor = None
+        if self.config.get('record_compress', True):
+            try:
+                cpus = parse_cpu_list(self.config.get('record_compress_cpus', ''))
+            except ValueError:
+                cpus = None
+            compressor = SegmentCompressor(record_dir, nice=self.config.get('record_compress_nice', 19), cpus=cpus,
+                                           max_age_days=self.config.get('record_max_age_days', 0.0),
+                                           max_total_bytes=int(self.config.get('record_max_gb', 0.0) * 1e9))
+        return AudioRecorder(record_dir, segment_seconds=self.config.get('record_segment_minutes', 60.0) * 60,
+                             compressor=compressor)
+
+    @property
+    def is_running(self):
+        return self.engine is not None and self.engine.is_running
+
+    def start_background_init(self):
+        threading.Thread(target=self.background_init, daemon=True).start()
+
+    def background_init(self):
+        try:
+            preload('numpy', 'sounddevice')
+            _, output_devices = get_audio_devices(self.devices)
+            error = None
+        except Exception as e:
+            output_devices, error = [], str(e)
+
+        if self.root.winfo_exists():
+            self.root.after(0, lambda: self.on_engine_ready(output_devices, error))
+
+        if self.supabase.connect() and self.root.winfo_exists():
+            self.root.after(0, self.on_supabase_ready)
+
+    def on_engine_ready(self, output_devices, error=None):
+        self.device_combo.config(values=output_devices)
+        if output_devices and not self.device_var.get():
+            self.device_var.set(output_devices[0])
+        self.device_watcher.start()
+
+        if self.config.get('metrics_enabled', False):
+            self.start_metrics_exporter()
+
+        self.start_button.config(state=tk.NORMAL)
+        if error:
+            self.update_status(f"Audio Error: {error}")
+            self.alerts.raise_alert('error', 'Audio device enumeration failed', {'error': error})
+        else:
+            self.update_status("Idle")
+
+        self.update_vu_meters()
+        self.update_stats_display()
+
+    def on_devices_changed(self, added, removed):
+        for device in added:
+            self.logger.log_event('device_added', device.to_dict())
+        for device in removed:
+            self.logger.log_event('device_removed', device.to_dict())
+        self.root.after(0, self.refresh_devices)
+
+    def refresh_devices(self):
+        self.device_combo.config(values=self.devices.labels('output'))
+
+    def on_device_event(self, event, device, details):
+        if self.engine is not None:
+            self.engine.handle_device_event(event, device, details)
+        if event == 'recovered':
+            self.root.after(0, lambda: (self.refresh_devices(), self.device_var.set(device.label)))
+
+    def on_supabase_ready(self):
+        self.preset_sync = PresetSync(self.preset_store, self.supabase,
+                                      on_change=lambda: self.root.after(0, self.refresh_presets_list))
+        self.preset_sync.start()
+
+        self.telemetry = TelemetryUploader(
+            self.supabase,
+            spool_path=self.config.get('telemetry_spool', 'telemetry_spool.db'),
+            batch_size=self.config.get('telemetry_batch_size', 50),
+            batch_interval=self.config.get('telemetry_batch_interval', 5.0)
+        )
+        self.telemetry.start()
+
+        if self.engine is not None:
+            self.engine.telemetry = self.telemetry
+
     def setup_gui(self):
         pass
 
@@ -95,12 +177,10 @@ class MPXReceiverPro:
         title_label = ttk.Label(main_frame, text="MPX RECEIVER PRO", style='Title.TLabel')
         title_label.grid(row=0, column=0, columnspan=2, pady=(0, 20))
 
-        _, output_devices = get_audio_devices()
-
         ttk.Label(main_frame, text="Audio Output Device:", font=self.theme.FONTS['body']).grid(row=1, column=0, sticky=tk.W, pady=8)
-        self.device_var = tk.StringVar(value=output_devices[0] if output_devices else "")
-        device_combo = ttk.Combobox(main_frame, textvariable=self.device_var, values=output_devices, width=50)
-        device_combo.grid(row=1, column=1, pady=8, padx=5, sticky=(tk.W, tk.E))
+        self.device_var = tk.StringVar(value="")
+        self.device_combo = ttk.Combobox(main_frame, textvariable=self.device_var, values=[], width=50)
+        self.device_combo.grid(row=1, column=1, pady=8, padx=5, sticky=(tk.W, tk.E))
 
         ttk.Label(main_frame, text="Host:", font=self.theme.FONTS['body']).grid(row=2, column=0, sticky=tk.W, pady=8)
         self.host_var = tk.StringVar(value="127.0.0.1")
@@ -152,14 +232,19 @@ class MPXReceiverPro:
         button_frame.grid(row=9, column=0, columnspan=2, pady=25)
 
         self.start_button = ttk.Button(button_frame, text="▶ START RECEIVE", command=self.start_receiver,
-                                       width=20, style='Success.TButton')
+                                       width=20, state=tk.DISABLED, style='Success.TButton')
         self.start_button.pack(side=tk.LEFT, padx=8)
 
         self.stop_button = ttk.Button(button_frame, text="⬛ STOP", command=self.stop_receiver, width=15,
                                        state=tk.DISABLED, style='Danger.TButton')
         self.stop_button.pack(side=tk.LEFT, padx=8)
 
+        self.apply_button = ttk.Button(button_frame, text="⟳ APPLY", command=self.apply_changes, width=12,
+                                       state=tk.DISABLED)
+        self.apply_button.pack(side=tk.LEFT, padx=8)
+
         ttk.Button(button_frame, text="⬤ RECORD", command=self.toggle_recording, width=15).pack(side=tk.LEFT, padx=8)
+        ttk.Button(button_frame, text="⏏ BLACK BOX", command=self.save_black_box, width=15).pack(side=tk.LEFT, padx=8)
 
         vu_frame = ttk.LabelFrame(main_frame, text="VU METERS WITH PEAK HOLD", padding="15")
         vu_frame.grid(row=10, column=0, columnspan=2, pady=20, sticky=(tk.W, tk.E))
@@ -188,7 +273,7 @@ class MPXReceiverPro:
         self.buffer_label = ttk.Label(buffer_frame, text="Buffer: 0%", font=self.theme.FONTS['mono'])
         self.buffer_label.pack(pady=5)
 
-        self.status_label = ttk.Label(main_frame, text="Status: Idle", style='Muted.TLabel',
+        self.status_label = ttk.Label(main_frame, text="Status: Loading audio devices...", style='Muted.TLabel',
                                       font=self.theme.FONTS['body'])
         self.status_label.grid(row=12, column=0, columnspan=2, pady=15)
 
@@ -257,7 +342,7 @@ class MPXReceiverPro:
         stats_frame = ttk.LabelFrame(frame, text="STATISTICS", padding="15")
         stats_frame.pack(fill=tk.BOTH, expand=True, pady=10)
 
-        self.stats_text = tk.Text(stats_frame, height=20, width=70,
+        self.stats_text = tk.Text(stats_frame, height=16, width=70,
                                   bg=self.theme.colors['bg_secondary'],
                                   fg=self.theme.colors['text_primary'],
                                   font=self.theme.FONTS['mono'],
@@ -265,6 +350,31 @@ class MPXReceiverPro:
                                   insertbackground=self.theme.colors['text_primary'])
         self.stats_text.pack(fill=tk.BOTH, expand=True)
 
+        pipeline_frame = ttk.LabelFrame(frame, text="PIPELINE BREAKDOWN", padding="15")
+        pipeline_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+
+        trace_controls = ttk.Frame(pipeline_frame)
+        trace_controls.pack(fill=tk.X, pady=(0, 8))
+
+        self.trace_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(trace_controls, text="Enable pipeline tracing", variable=self.trace_var,
+                        command=self.toggle_tracing).pack(side=tk.LEFT, padx=5)
+
+        ttk.Label(trace_controls, text="Sample 1 in").pack(side=tk.LEFT, padx=5)
+        self.trace_rate_var = tk.StringVar(value="64")
+        trace_rate_combo = ttk.Combobox(trace_controls, textvariable=self.trace_rate_var,
+                                        values=["1", "16", "64", "256"], width=6)
+        trace_rate_combo.pack(side=tk.LEFT, padx=5)
+        trace_rate_combo.bind('<<ComboboxSelected>>', lambda event: self.toggle_tracing())
+
+        self.pipeline_text = tk.Text(pipeline_frame, height=9, width=70,
+                                     bg=self.theme.colors['bg_secondary'],
+                                     fg=self.theme.colors['text_primary'],
+                                     font=self.theme.FONTS['mono'],
+                                     borderwidth=0,
+                                     insertbackground=self.theme.colors['text_primary'])
+        self.pipeline_text.pack(fill=tk.BOTH, expand=True)
+
     def setup_presets_tab(self, parent):
         parent.configure(style='TFrame')
         frame = ttk.Frame(parent, padding="20")
@@ -293,18 +403,42 @@ class MPXReceiverPro:
         self.refresh_presets_list()
 
     def toggle_agc(self):
-        self.audio_processor.agc_enabled = self.agc_var.get()
+        if self.engine is not None:
+            self.engine.set_processing(agc=self.agc_var.get())
 
     def toggle_limiter(self):
-        self.audio_processor.limiter_enabled = self.limiter_var.get()
+        if self.engine is not None:
+            self.engine.set_processing(limiter=self.limiter_var.get())
+
+    def toggle_tracing(self):
+        if self.engine is not None:
+            self.engine.configure_tracing(self.trace_var.get(), self.trace_sample_every())
+
+    def trace_sample_every(self):
+        try:
+            return int(self.trace_rate_var.get())
+        except ValueError:
+            return 64
 
     def toggle_recording(self):
         if not self.recorder.is_recording:
             self.recorder.start_recording("incoming")
             messagebox.showinfo("Recording", "Audio recording started")
         else:
-            self.recorder.stop_recording()
-            messagebox.showinfo("Recording", "Audio recording stopped")
+            files = self.recorder.stop_recording()
+            messagebox.showinfo("Recording", "Audio recording stopped\n" + "\n".join(files))
+
+    def save_black_box(self):
+        if not self.is_running:
+            messagebox.showinfo("Black Box", "The black box only holds audio while the link is running")
+            return
+
+        def dump():
+            path = self.engine.dump_black_box()
+            message = f"Black box saved to\n{path}" if path else "Nothing recorded yet"
+            self.root.after(0, lambda: messagebox.showinfo("Black Box", message))
+
+        threading.Thread(target=dump, daemon=True).start()
 
     def save_preset(self):
         name = simpledialog.askstring("Save Preset", "Enter preset name:")
@@ -318,8 +452,9 @@ class MPXReceiverPro:
                 'device': self.device_var.get(),
                 'channel_mode': self.channel_mode_var.get()
             }
-            self.config.save_preset(name, config)
-            self.supabase.save_preset(name, config, 'receiver')
+            self.preset_store.save(name, config, 'receiver')
+            if self.preset_sync is not None:
+                self.preset_sync.notify()
             self.refresh_presets_list()
             messagebox.showinfo("Success", f"Preset '{name}' saved!")
 
@@ -330,15 +465,22 @@ class MPXReceiverPro:
             return
 
         preset_name = self.presets_listbox.get(selection[0])
-        config = self.config.load_preset(preset_name)
+        config = self.preset_store.get(preset_name)
 
         if config:
+            try:
+                self.config.update(config)
+            except ConfigError as e:
+                messagebox.showerror("Error", f"Preset '{preset_name}' is invalid: {e}")
+                return
+            self.config.save()
             self.host_var.set(config.get('host', '127.0.0.1'))
             self.port_var.set(str(config.get('port', 5000)))
             self.protocol_var.set(config.get('protocol', 'TCP'))
             self.samplerate_var.set(str(config.get('samplerate', 192000)))
             self.blocksize_var.set(str(config.get('blocksize', 1024)))
             self.device_var.set(config.get('device', ''))
+            self.channel_mode_var.set(config.get('channel_mode', 'Stereo (L/R)'))
             messagebox.showinfo("Success", f"Preset '{preset_name}' loaded!")
 
     def delete_preset(self):
@@ -348,264 +490,114 @@ class MPXReceiverPro:
             return
 
         preset_name = self.presets_listbox.get(selection[0])
-        self.config.delete_preset(preset_name)
-        self.supabase.delete_preset(preset_name)
+        self.preset_store.delete(preset_name)
+        if self.preset_sync is not None:
+            self.preset_sync.notify()
         self.refresh_presets_list()
         messagebox.showinfo("Success", f"Preset '{preset_name}' deleted!")
 
     def refresh_presets_list(self):
         self.presets_listbox.delete(0, tk.END)
-        for preset_name in self.config.get_presets():
+        for preset_name in self.preset_store.list_names():
             self.presets_listbox.insert(tk.END, preset_name)
 
     def load_config(self):
         self.host_var.set(self.config.get('host', '127.0.0.1'))
         self.port_var.set(str(self.config.get('port', 5000)))
 
-    def start_receiver(self):
-        try:
-            device_str = self.device_var.get()
-            device_id = int(device_str.split(':')[0])
-            host = self.host_var.get()
-            port = int(self.port_var.get())
-            blocksize = int(self.blocksize_var.get())
-            samplerate = int(self.samplerate_var.get())
-
-            if self.encrypt_var.get() and self.password_var.get():
-                self.encryption.set_password(self.password_var.get())
-
-            if self.auth_var.get() and self.secret_var.get():
-                self.auth = AuthenticationManager(self.secret_var.get())
-
-            if self.fec_var.get():
-                self.fec = FECEncoder(redundancy=2)
-
-            self.is_running = True
-            self.reconnect_enabled = self.auto_reconnect_var.get()
-            self.expected_sequence = 0
-            self.monitor.start()
-
-            self.session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
-            self.logger.start_session('receiver', {
-                'host': host,
-                'port': port,
-                'protocol': self.protocol_var.get(),
-                'samplerate': samplerate,
-                'blocksize': blocksize
-            })
-
-            self.start_button.config(state=tk.DISABLED)
-            self.stop_button.config(state=tk.NORMAL)
+    def config_vars(self):
+        # config.json keys mirrored by widgets
+        return {
+            'host': self.host_var,
+            'port': self.port_var,
+            'protocol': self.protocol_var,
+            'samplerate': self.samplerate_var,
+            'blocksize': self.blocksize_var,
+            'agc_enabled': self.agc_var,
+            'limiter_enabled': self.limiter_var,
+            'encryption_enabled': self.encrypt_var,
+            'password': self.password_var,
+            'shared_secret': self.secret_var,
+            'fec_enabled': self.fec_var,
+            'auto_reconnect': self.auto_reconnect_var,
+        }
+
+    def on_config_changed(self, changes):
+        # Called from the config watcher thread when config.json is edited externally
+        if self.root.winfo_exists():
+            self.root.after(0, lambda: self.apply_config_changes(changes))
 
-            self.audio_processor = AudioProcessor(samplerate)
-            self.audio_processor.agc_enabled = self.agc_var.get()
-            self.audio_processor.limiter_enabled = self.limiter_var.get()
+    def apply_config_changes(self, changes):
+        config_vars = self.config_vars()
+        for key, (_, value) in changes.items():
+            if key in config_vars and value is not None:
+                config_vars[key].set(value)
 
-            self.is_mpx_mode = (self.channel_mode_var.get() == "MPX Composite")
-            channels = 1 if self.is_mpx_mode else 2
+        if not self.is_running:
+            return
+        try:
+            changed = self.engine.reconfigure(self.build_link_config())
+        except ValueError as e:
+            self.update_status(f"Config file changed: {e}")
+            return
+        if changed:
+            self.update_status(f"Config file changed, applied: {', '.join(changed)}")
+
+    def build_link_config(self):
+        return LinkConfig(
+            mode='receiver',
+            host=self.host_var.get(),
+            port=int(self.port_var.get()),
+            protocol=self.protocol_var.get(),
+            samplerate=int(self.samplerate_var.get()),
+            blocksize=int(self.blocksize_var.get()),
+            device=self.device_var.get(),
+            channel_mode=self.channel_mode_var.get(),
+            agc=self.agc_var.get(),
+            limiter=self.limiter_var.get(),
+            password=self.password_var.get() if self.encrypt_var.get() else '',
+            shared_secret=self.secret_var.get() if self.auth_var.get() else '',
+            fec=self.fec_var.get(),
+            auto_reconnect=self.auto_reconnect_var.get(),
+            reconnect_interval=self.config.get('reconnect_interval', 2.0),
+            trace=self.trace_var.get(),
+            trace_sample_every=self.trace_sample_every()
+        )
 
-            self.stream = sd.OutputStream(
-                device=device_id,
-                channels=channels,
-                samplerate=samplerate,
-                blocksize=blocksize,
-                dtype=np.int16,
-                callback=self.audio_output_callback
+    def start_receiver(self):
+        try:
+            self.engine = ReceiverEngine(
+                self.build_link_config(),
+                devices=self.devices,
+                device_watcher=self.device_watcher,
+                alerts=self.alerts,
+                logger=self.logger,
+                recorder=self.recorder,
+                supabase=self.supabase,
+                telemetry=self.telemetry,
+                metrics=self.metrics,
+                history_dir=self.config.get('history_dir', 'history'),
+                on_status=self.update_status
             )
-            self.stream.start()
+            self.engine.start()
 
-            protocol = self.protocol_var.get()
-
-            if protocol == "TCP":
-                threading.Thread(target=self.tcp_receiver_thread, args=(host, port), daemon=True).start()
-            else:
-                threading.Thread(target=self.udp_receiver_thread, args=(host, port), daemon=True).start()
+            self.start_button.config(state=tk.DISABLED)
+            self.stop_button.config(state=tk.NORMAL)
+            self.apply_button.config(state=tk.NORMAL)
 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to start receiver: {str(e)}")
             self.stop_receiver()
 
-    def tcp_receiver_thread(self, host, port):
-        while self.is_running and self.reconnect_enabled:
-            try:
-                self.update_status(f"Connecting to {host}:{port}...")
-                self.socket_obj = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.socket_obj.settimeout(5.0)
-                self.socket_obj.connect((host, port))
-                self.socket_obj.settimeout(None)
-                self.update_status(f"Connected to {host}:{port}")
-                self.logger.log_event('connection', {'remote': f"{host}:{port}"})
-
-                while self.is_running:
-                    seq_data = self.recv_exact(4)
-                    if not seq_data:
-                        break
-
-                    sequence = struct.unpack('!I', seq_data)[0]
-
-                    length_data = self.recv_exact(4)
-                    if not length_data:
-                        break
-
-                    length = struct.unpack('!I', length_data)[0]
-                    audio_data = self.recv_exact(length)
-                    if not audio_data:
-                        break
-
-                    if self.encrypt_var.get():
-                        audio_data = self.encryption.decrypt(audio_data)
-
-                    if self.fec_var.get():
-                        audio_data, valid = self.fec.decode(audio_data)
-                        if not valid:
-                            continue
-
-                    audio_array = np.frombuffer(audio_data, dtype=np.int16).reshape(-1, 2)
-
-                    with self.buffer_lock:
-                        self.audio_buffer.append(audio_array)
-
-                    self.monitor.record_packet_received(len(audio_data), sequence)
-                    self.update_vu_from_audio(audio_array)
-                    self.fft_analyzer.add_samples(audio_array)
-
-                    if self.recorder.is_recording:
-                        self.recorder.write_audio(audio_data)
-
-            except Exception as e:
-                if self.is_running:
-                    self.update_status(f"Connection lost: {str(e)}")
-                    self.alerts.raise_alert('warning', 'Connection lost', {'error': str(e)})
-
-            finally:
-                if self.socket_obj:
-                    try:
-                        self.socket_obj.close()
-                    except Exception:
-                        pass
-                    self.socket_obj = None
-
-                if self.is_running and self.reconnect_enabled:
-                    self.update_status("Reconnecting in 2 seconds...")
-                    time.sleep(2)
-
-    def udp_receiver_thread(self, host, port):
-        try:
-            self.socket_obj = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.socket_obj.bind((host, port))
-            self.socket_obj.settimeout(1.0)
-            self.update_status(f"Listening on {host}:{port} (UDP)")
-
-            while self.is_running:
-                try:
-                    data, addr = self.socket_obj.recvfrom(65536)
-
-                    seq_data = data[:4]
-                    audio_data = data[4:]
-
-                    sequence = struct.unpack('!I', seq_data)[0]
-
-                    if self.encrypt_var.get():
-                        audio_data = self.encryption.decrypt(audio_data)
-
-                    if self.fec_var.get():
-                        audio_data, valid = self.fec.decode(audio_data)
-                        if not valid:
-                            continue
-
-                    audio_array = np.frombuffer(audio_data, dtype=np.int16).reshape(-1, 2)
-
-                    with self.buffer_lock:
-                        self.audio_buffer.append(audio_array)
-
-                    self.monitor.record_packet_received(len(audio_data), sequence)
-                    self.update_vu_from_audio(audio_array)
-                    self.fft_analyzer.add_samples(audio_array)
-
-                    if self.recorder.is_recording:
-                        self.recorder.write_audio(audio_data)
-
-                except socket.timeout:
-                    continue
-                except Exception:
-                    if not self.is_running:
-                        break
-
-        except Exception as e:
-            if self.is_running:
-                self.update_status(f"UDP Error: {str(e)}")
-                self.alerts.raise_alert('error', 'UDP connection failed', {'error': str(e)})
-
-    def recv_exact(self, n):
-        data = bytearray()
-        while len(data) < n:
-            if not self.is_running:
-                return None
-            try:
-                packet = self.socket_obj.recv(n - len(data))
-                if not packet:
-                    return None
-                data.extend(packet)
-            except Exception:
-                return None
-        return bytes(data)
-
-    def audio_output_callback(self, outdata, frames, time_info, status):
-        if not self.is_running:
-            outdata.fill(0)
-            return
-
-        with self.buffer_lock:
-            if len(self.audio_buffer) > 0:
-                audio_chunk = self.audio_buffer.popleft()
-
-                if self.is_mpx_mode:
-                    if len(audio_chunk.shape) == 2 and audio_chunk.shape[1] > 1:
-                        audio_chunk = audio_chunk[:, 0].reshape(-1, 1)
-
-                if len(audio_chunk) >= frames:
-                    processed = self.audio_processor.process(audio_chunk[:frames])
-                    outdata[:] = processed
-                else:
-                    processed = self.audio_processor.process(audio_chunk)
-                    outdata[:len(processed)] = processed
-                    outdata[len(processed):].fill(0)
-            else:
-                outdata.fill(0)
-
-    def update_vu_from_audio(self, audio_data):
-        current_time = time.time()
-        if current_time - self.last_vu_update >= 0.1:
-            if self.is_mpx_mode:
-                if len(audio_data.shape) == 1 or audio_data.shape[1] == 1:
-                    mono_data = audio_data.flatten() if len(audio_data.shape) > 1 else audio_data
-                    mono_db = calculate_db_fs(np.array([mono_data.astype(np.float32) / 32768.0]).T)[0]
-                    peak_mono = self.peak_holder.update(mono_db, mono_db)[0]
-                    with self.vu_lock:
-                        self.vu_levels = [mono_db, mono_db]
-                        self.peak_levels = [peak_mono, peak_mono]
-                else:
-                    left_db, right_db = calculate_db_fs(audio_data.astype(np.float32) / 32768.0)
-                    peak_left, peak_right = self.peak_holder.update(left_db, right_db)
-                    with self.vu_lock:
-                        self.vu_levels = [left_db, right_db]
-                        self.peak_levels = [peak_left, peak_right]
-            else:
-                left_db, right_db = calculate_db_fs(audio_data.astype(np.float32) / 32768.0)
-                peak_left, peak_right = self.peak_holder.update(left_db, right_db)
-                with self.vu_lock:
-                    self.vu_levels = [left_db, right_db]
-                    self.peak_levels = [peak_left, peak_right]
-
-            self.last_vu_update = current_time
-
     def update_vu_meters(self):
         if not self.root.winfo_exists():
             return
 
-        with self.vu_lock:
-            left_db, right_db = self.vu_levels
-            peak_left, peak_right = self.peak_levels
+        if self.engine is None:
+            self.root.after(100, self.update_vu_meters)
+            return
+
+        (left_db, right_db), (peak_left, peak_right) = self.engine.get_levels()
 
         if self.channel_mode_var.get() == "MPX Composite":
             self.draw_vu_meter_with_peak(self.vu_left_canvas, left_db, peak_left)
@@ -618,14 +610,12 @@ class MPXReceiverPro:
             self.vu_left_label.config(text=f"{left_db:.1f} dB")
             self.vu_right_label.config(text=f"{right_db:.1f} dB")
 
-        with self.buffer_lock:
-            buffer_fill = len(self.audio_buffer) / self.audio_buffer.maxlen * 100
-
+        buffer_fill = self.engine.get_buffer_fill()
         self.draw_buffer_meter(buffer_fill)
         self.buffer_label.config(text=f"Buffer: {buffer_fill:.0f}%")
 
-        pilot_level = self.fft_analyzer.get_pilot_tone_level()
-        subcarrier_level = self.fft_analyzer.get_subcarrier_level()
+        pilot_level = self.engine.fft_analyzer.get_pilot_tone_level()
+        subcarrier_level = self.engine.fft_analyzer.get_subcarrier_level()
 
         self.pilot_label.config(text=f"19 kHz Pilot: {pilot_level:.1f} dB")
         self.subcarrier_label.config(text=f"38 kHz Subcarrier: {subcarrier_level:.1f} dB")
@@ -689,92 +679,132 @@ class MPXReceiverPro:
         if not self.root.winfo_exists():
             return
 
-        if self.is_running:
-            stats = self.monitor.get_stats()
-
-            with self.buffer_lock:
-                buffer_fill = len(self.audio_buffer) / self.audio_buffer.maxlen * 100
+        # The engine collects stats (history, alerts, telemetry, metrics) on its own thread
+        stats = self.engine.last_stats if self.is_running else None
+        if stats is not None:
+            history = self.engine.last_history
 
             stats_text = f"""
 Uptime: {stats['uptime']:.1f} seconds
 Packets Received: {stats['packets_received']}
 Packets Lost: {stats['packets_lost']}
 Packet Loss Rate: {stats['packet_loss_rate']:.2f}%
+Reordered / Duplicate / Late: {stats['packets_reordered']} / {stats['packets_duplicate']} / {stats['packets_late']}
+Jitter (RFC 3550): {stats['jitter']:.3f} ms
 Bytes Received: {stats['bytes_received']:,}
 Bitrate: {stats['bitrate']/1000000:.2f} Mbps
 Avg Latency: {stats['avg_latency']:.2f} ms
 Max Latency: {stats['max_latency']:.2f} ms
 Min Latency: {stats['min_latency']:.2f} ms
+Latency p50/p99/p99.9: {stats['latency_p50']:.2f} / {stats['latency_p99']:.2f} / {stats['latency_p999']:.2f} ms
+Glass-to-Glass: {stats['avg_glass_to_glass']:.2f} ms (max {stats['max_glass_to_glass']:.2f} ms)
+Jitter p99: {stats['histograms']['jitter']['p99']:.3f} ms
+Callback p99: {stats['histograms']['callback_duration']['p99']:.3f} ms ({stats['callback']['load_p99']:.0f}% of {stats['callback']['budget_ms']:.2f} ms budget)
+Deadline Overruns / Late Callbacks: {stats['callback']['overruns']} / {stats['callback']['late_calls']}
+Xruns: {self.format_xruns(stats['callback']['xruns'])}
+Round Trip: {stats['avg_rtt']:.2f} ms
+Clock Offset: {self.format_clock_offset(stats['clock_offset_ms'])}
 Quality: {stats['avg_quality']:.1f}%
-Buffer Fill: {buffer_fill:.1f}%
+Buffer Fill: {stats['buffer_fill']:.1f}% (p50 {stats['histograms']['buffer_fill']['p50']:.1f}%, p99 {stats['histograms']['buffer_fill']['p99']:.1f}%)
+Last Hour: {self.format_history(history)}
+Recording: {self.format_recording(stats.get('recorder'))}
             """
 
             self.stats_text.delete('1.0', tk.END)
             self.stats_text.insert('1.0', stats_text)
 
-            if self.supabase.enabled:
-                stats['buffer_fill'] = buffer_fill
-                self.supabase.log_statistics(self.session_id, stats)
+            self.pipeline_text.delete('1.0', tk.END)
+            self.pipeline_text.insert('1.0', format_breakdown(stats['pipeline']))
 
         self.root.after(1000, self.update_stats_display)
 
+    def format_clock_offset(self, offset_ms):
+        if offset_ms is None:
+            return "not synchronized"
+        return f"{offset_ms:+.3f} ms"
+
+    def format_xruns(self, xruns):
+        counts = [f"{flag.replace('_', ' ')} {count}" for flag, count in xruns.items() if count]
+        return ', '.join(counts) if counts else "none"
+
+    def format_recording(self, recorder):
+        if not recorder:
+            return "off"
+        text = f"{recorder['bytes_written'] / 1e6:.0f} MB" if recorder['recording'] else "off"
+        compression = recorder.get('compression')
+        if compression:
+            text += f", {compression['queue_depth']} segments queued, {compression['compressed']} compressed"
+            if compression['ratio'] is not None:
+                text += f" ({compression['ratio'] * 100:.0f}%)"
+            if compression['last_error']:
+                text += f", {compression['last_error']}"
+        return text
+
+    def start_metrics_exporter(self):
+        bind = self.config.get('metrics_bind', '127.0.0.1')
+        port = self.config.get('metrics_port', 9464)
+        try:
+            self.metrics = MetricsExporter(bind, port)
+            self.metrics.start()
+        except OSError as e:
+            self.metrics = None
+            self.alerts.raise_alert('warning', 'Metrics exporter failed to start',
+                                    {'bind': f"{bind}:{port}", 'error': str(e)})
+
+    def format_history(self, summary):
+        if not summary:
+            return "no history yet"
+
+        def peak(field, fmt):
+            return format(summary[field]['max'], fmt) if field in summary else "--"
+
+        return (f"loss max {peak('loss', '.2f')}%, jitter max {peak('jitter', '.3f')} ms, "
+                f"latency max {peak('latency', '.2f')} ms")
+
     def update_status(self, message):
         if self.root.winfo_exists():
             self.root.after(0, lambda: self.status_label.config(text=f"Status: {message}"))
 
-    def stop_receiver(self):
-        self.is_running = False
-        self.reconnect_enabled = False
+    def apply_changes(self):
+        # Applied to the running link at the next block boundary, without dropping the connection
+        if not self.is_running:
+            return
+        try:
+            changed = self.engine.reconfigure(self.build_link_config())
+        except ValueError as e:
+            messagebox.showwarning("Restart Required", str(e))
+            return
+        self.update_status(f"Applied: {', '.join(changed)}" if changed else "No changes to apply")
 
-        if self.stream is not None:
-            try:
-                self.stream.stop()
-                self.stream.close()
-            except Exception:
-                pass
-            self.stream = None
+    def stop_receiver(self):
+        if self.engine is not None:
+            self.engine.stop()
 
-        if self.socket_obj is not None:
-            try:
-                self.socket_obj.close()
-            except Exception:
-                pass
-            self.socket_obj = None
-
-        if self.recorder.is_recording:
-            self.recorder.stop_recording()
-
-        with self.buffer_lock:
-            self.audio_buffer.clear()
-
-        stats = self.monitor.get_stats()
-        self.logger.end_session(stats)
-
-        if self.supabase.enabled and self.session_id:
-            self.supabase.log_session({
-                'session_id': self.session_id,
-                'type': 'receiver',
-                'start_time': datetime.now().isoformat(),
-                'end_time': datetime.now().isoformat(),
-                'config': {
-                    'host': self.host_var.get(),
-                    'port': int(self.port_var.get()),
-                    'protocol': self.protocol_var.get(),
-                    'samplerate': int(self.samplerate_var.get()),
-                    'blocksize': int(self.blocksize_var.get())
-                },
-                'final_stats': stats
-            })
-
-        self.monitor.reset()
         self.start_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.DISABLED)
-        self.update_status("Stopped")
+        self.apply_button.config(state=tk.DISABLED)
 
     def on_closing(self):
         if self.is_running:
             self.stop_receiver()
 
+        self.device_watcher.stop()
+
+        if self.metrics is not None:
+            self.metrics.stop()
+
+        if self.telemetry is not None:
+            self.telemetry.stop()
+
+        if self.preset_sync is not None:
+            self.preset_sync.stop()
+        self.preset_store.close()
+
+        if self.recorder.compressor is not None:
+            self.recorder.compressor.stop()
+
+        self.alerts.close()
+        self.config.stop_watching()
         self.config.save()
         self.root.destroy()
 
@@ -786,4 +816,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Device probes and the segment compressor run in spawned processes, which re-run a frozen build
+    multiprocessing.freeze_support()
     main()
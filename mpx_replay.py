@@ -0,0 +1,157 @@
+"""
+Replays a packet capture (mpx_link.py --capture, LinkEngine.start_capture) through
+the receiver pipeline without network or audio device:
+
+    python mpx_replay.py field.mpxcap --output played.wav
+    python mpx_replay.py field.mpxcap --speed 1 --password secret
+    python mpx_replay.py field.mpxcap --blocksize 256 --json > result.json
+
+Packets are handed to ReceiverEngine.handle_packet with their captured arrival
+times, and the output callback is run on a virtual clock at the device block
+rate, so jitter buffer, FEC and concealment behaviour is reproducible run to
+run. --speed 0 (default) runs as fast as possible; 1 is real time.
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Dict, Optional
+import numpy as np
+from audio_recorder import WavWriter
+from link_engine import LinkConfig, ReceiverEngine
+from packet_capture import CaptureReader
+
+
+def build_config(reader: CaptureReader, args) -> LinkConfig:
+    data = dict(reader.metadata.get('config', {}))
+    if args.config:
+        with open(args.config, 'r') as f:
+            data.update(json.load(f))
+    data.update({'mode': 'receiver', 'black_box_seconds': 0})
+    if args.password is not None:
+        data['password'] = args.password
+    if args.blocksize:
+        data['blocksize'] = args.blocksize
+    return LinkConfig.from_dict(data)
+
+
+def replay(reader: CaptureReader, config: LinkConfig, speed: float = 0.0, start: float = 0.0,
+           duration: float = 0.0, output: Optional[str] = None) -> Dict:
+    engine = ReceiverEngine(config, history_dir=None, stats_interval=None)
+    engine.apply_config()
+    engine.monitor.start()
+    engine.is_running = True
+
+    protocol_switches = []
+
+    def record_switch(protocol: str):
+        # A PACKET_FORMAT for the other protocol would open real sockets; offline the change is only noted
+        if engine.protocol != protocol:
+            engine.protocol = protocol
+            engine.transport_switched = True
+            protocol_switches.append(protocol)
+
+    engine.switch_transport = record_switch
+
+    period_ns = config.blocksize * 1e9 / config.samplerate
+    outdata = np.zeros((config.blocksize, config.channels), dtype=np.int16)
+    writer = WavWriter(output, config.channels, config.samplerate, preallocate_bytes=0) if output else None
+
+    first_ns = None
+    next_output_ns = None
+    end_ns = None
+    packets = 0
+    blocks = 0
+    wall_start = time.monotonic()
+
+    def play_until(until_ns):
+        nonlocal next_output_ns, blocks
+        while next_output_ns <= until_ns:
+            if speed > 0:
+                delay = (next_output_ns - first_ns) / 1e9 / speed - (time.monotonic() - wall_start)
+                if delay > 0:
+                    time.sleep(delay)
+            engine.audio_output_callback(outdata, config.blocksize, None, None)
+            if writer is not None:
+                writer.write(outdata.tobytes())
+            next_output_ns += period_ns
+            blocks += 1
+
+    first = next(reader.packets(), None)
+    start_ns = first.time_ns + int(start * 1e9) if first is not None else None
+    end_ns = start_ns + int(duration * 1e9) if first is not None and duration else None
+    # With start_ns the reader seeks through the capture index instead of reading up to it
+    for packet in (reader.packets(start_ns) if first is not None else ()):
+        if end_ns is not None and packet.time_ns > end_ns:
+            break
+        if first_ns is None:
+            first_ns = packet.time_ns
+            # The output device starts one block after the first packet, as a live receiver would
+            next_output_ns = first_ns + period_ns
+
+        play_until(packet.time_ns)
+        engine.handle_packet(packet.packet_type, packet.sequence, packet.capture_ts, packet.time_ns,
+                             packet.payload)
+        packets += 1
+
+    # Play out what is still buffered
+    while first_ns is not None and (engine.audio_buffer or engine.playout_chunk is not None):
+        play_until(next_output_ns)
+
+    if writer is not None:
+        writer.close()
+
+    stats = engine.collect_stats()
+    return {
+        'packets': packets,
+        'blocks_played': blocks,
+        'audio_seconds': blocks * config.blocksize / config.samplerate,
+        'packets_received': stats['packets_received'],
+        'packets_lost': stats['packets_lost'],
+        'packets_reordered': stats['packets_reordered'],
+        'packets_duplicate': stats['packets_duplicate'],
+        'packets_late': stats['packets_late'],
+        'format_drops': stats['format_drops'],
+        'playout_underruns': stats['playout_underruns'],
+        'protocol_switches': protocol_switches,
+        'jitter_ms': stats['jitter']
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Replay a packet capture through the receiver pipeline')
+    parser.add_argument('capture', help='capture file')
+    parser.add_argument('--speed', type=float, default=0.0, help='1 = real time, 0 = as fast as possible')
+    parser.add_argument('--start', type=float, default=0.0, help='seconds into the capture to start at')
+    parser.add_argument('--duration', type=float, default=0.0, help='seconds to replay (0 = all)')
+    parser.add_argument('--blocksize', type=int, help='output device block size (default: from the capture)')
+    parser.add_argument('--config', help='JSON file with LinkConfig fields overriding the captured config')
+    parser.add_argument('--password', help='decrypt an encrypted capture with this password')
+    parser.add_argument('--output', help='write the played-out audio to this WAV file')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    args = parser.parse_args(argv)
+
+    try:
+        reader = CaptureReader(args.capture)
+        config = build_config(reader, args)
+        config.validate()
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if reader.metadata.get('encrypted') and not config.password:
+        print("Warning: the capture is encrypted; pass --password to decode it", file=sys.stderr)
+    if not reader.indexed:
+        print("Warning: capture was not closed cleanly; replaying up to its last whole packet", file=sys.stderr)
+
+    result = replay(reader, config, args.speed, args.start, args.duration, args.output)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for key, value in result.items():
+            print(f"{key:>20}: {value:.3f}" if isinstance(value, float) else f"{key:>20}: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
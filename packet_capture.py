@@ -0,0 +1,177 @@
+import collections
+import json
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from protocol import monotonic_ns
+
+MAGIC = b'MPXCAP01'
+INDEX_MAGIC = b'MPXIDX01'
+META_HEADER = struct.Struct('<8sI')
+RECORD = struct.Struct('<qqIIB')        # time_ns, capture_ts, sequence, payload length, packet type
+INDEX_ENTRY = struct.Struct('<qQ')      # time_ns, file offset of the record
+TRAILER = struct.Struct('<QQ8s')        # index offset, index entries, INDEX_MAGIC
+INDEX_EVERY_NS = 1_000_000_000
+
+
+class CapturedPacket(NamedTuple):
+    time_ns: int
+    packet_type: int
+    sequence: int
+    capture_ts: int
+    payload: bytes
+
+
+class PacketCapture:
+    """
+    Records wire frames (type, sequence, capture timestamp, payload) with the
+    monotonic nanosecond time they were sent or received.
+
+    write() only appends to a deque, so it is safe from the audio callback and
+    network threads; a writer thread appends records to `path`. An index entry
+    per second of capture is kept and written as a trailer by close(), so
+    CaptureReader can seek by time; a capture cut short by a crash has no
+    trailer and is read sequentially instead.
+    """
+
+    def __init__(self, path: str, metadata: Optional[Dict] = None, max_queue: int = 65536,
+                 buffer_bytes: int = 1024 * 1024, poll_interval: float = 0.02):
+        self.path = path
+        self.max_queue = max_queue
+        self.poll_interval = poll_interval
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'wb', buffering=buffer_bytes)
+        meta = json.dumps(metadata or {}, default=str).encode('utf-8')
+        self.file.write(META_HEADER.pack(MAGIC, len(meta)) + meta)
+        self.offset = META_HEADER.size + len(meta)
+
+        self.packets = collections.deque()
+        self.index: List[tuple] = []
+        self.last_indexed = None
+        self.packets_written = 0
+        self.packets_dropped = 0
+        self.bytes_written = 0
+        self.error = None
+
+        self.running = True
+        self.thread = threading.Thread(target=self._writer, daemon=True)
+        self.thread.start()
+
+    def write(self, time_ns: int, packet_type: int, sequence: int, capture_ts: Optional[int], payload: bytes):
+        if not self.running:
+            return
+        if len(self.packets) >= self.max_queue:
+            self.packets_dropped += 1
+            return
+        self.packets.append((time_ns, capture_ts or 0, sequence, packet_type, bytes(payload)))
+
+    def wrap(self, pack_frame):
+        """A pack_frame that records each frame as it is packed for sending."""
+        def pack(packet_type, sequence, capture_ts, payload):
+            self.write(monotonic_ns(), packet_type, sequence, capture_ts, payload)
+            return pack_frame(packet_type, sequence, capture_ts, payload)
+        return pack
+
+    def close(self) -> Dict:
+        if self.running:
+            self.running = False
+            self.thread.join()
+        return self.get_stats()
+
+    def get_stats(self) -> Dict:
+        return {
+            'path': self.path,
+            'packets_written': self.packets_written,
+            'packets_dropped': self.packets_dropped,
+            'bytes_written': self.bytes_written,
+            'queue_depth': len(self.packets),
+            'error': self.error
+        }
+
+    def _writer(self):
+        try:
+            while True:
+                running = self.running
+                while self.packets:
+                    time_ns, capture_ts, sequence, packet_type, payload = self.packets.popleft()
+                    if self.last_indexed is None or time_ns - self.last_indexed >= INDEX_EVERY_NS:
+                        self.index.append((time_ns, self.offset))
+                        self.last_indexed = time_ns
+                    record = RECORD.pack(time_ns, capture_ts, sequence & 0xFFFFFFFF, len(payload), packet_type)
+                    self.file.write(record)
+                    self.file.write(payload)
+                    self.offset += len(record) + len(payload)
+                    self.packets_written += 1
+                    self.bytes_written += len(payload)
+                if not running:
+                    break
+                time.sleep(self.poll_interval)
+
+            index_offset = self.offset
+            for entry in self.index:
+                self.file.write(INDEX_ENTRY.pack(*entry))
+            self.file.write(TRAILER.pack(index_offset, len(self.index), INDEX_MAGIC))
+        except OSError as e:
+            self.error = str(e)
+        finally:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+
+
+class CaptureReader:
+    """Reads a PacketCapture file; packets() yields CapturedPacket in capture order."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, length = META_HEADER.unpack(f.read(META_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a packet capture")
+            self.metadata = json.loads(f.read(length).decode('utf-8'))
+            self.data_offset = META_HEADER.size + length
+
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            self.data_end = size
+            self.index: List[tuple] = []
+            # Without the trailer (writer did not close) the file is read to its last whole record
+            self.indexed = False
+            if size - self.data_offset >= TRAILER.size:
+                f.seek(size - TRAILER.size)
+                index_offset, count, index_magic = TRAILER.unpack(f.read(TRAILER.size))
+                if index_magic == INDEX_MAGIC:
+                    f.seek(index_offset)
+                    raw = f.read(count * INDEX_ENTRY.size)
+                    self.index = list(INDEX_ENTRY.iter_unpack(raw))
+                    self.data_end = index_offset
+                    self.indexed = True
+
+    def packets(self, start_ns: Optional[int] = None) -> Iterator[CapturedPacket]:
+        offset = self.data_offset
+        if start_ns is not None and self.index:
+            for time_ns, entry_offset in self.index:
+                if time_ns > start_ns:
+                    break
+                offset = entry_offset
+
+        with open(self.path, 'rb', buffering=1024 * 1024) as f:
+            f.seek(offset)
+            while offset + RECORD.size <= self.data_end:
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    return
+                time_ns, capture_ts, sequence, length, packet_type = RECORD.unpack(header)
+                if offset + RECORD.size + length > self.data_end:
+                    return  # Torn last record of an interrupted capture
+                payload = f.read(length)
+                offset += RECORD.size + length
+                if start_ns is not None and time_ns < start_ns:
+                    continue
+                yield CapturedPacket(time_ns, packet_type, sequence, capture_ts, payload)
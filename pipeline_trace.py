@@ -0,0 +1,116 @@
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+from histogram import LogHistogram
+
+
+class NullTrace:
+    __slots__ = ()
+
+    def mark(self, stage: str):
+        pass
+
+    def add(self, stage: str, duration_ns: int):
+        pass
+
+    def commit(self):
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+
+class BlockTrace:
+    __slots__ = ('tracer', 'last', 'stages')
+
+    def __init__(self, tracer: 'PipelineTracer'):
+        self.tracer = tracer
+        self.last = time.perf_counter_ns()
+        self.stages: List[Tuple[str, int]] = []
+
+    def mark(self, stage: str):
+        now = time.perf_counter_ns()
+        self.stages.append((stage, now - self.last))
+        self.last = now
+
+    def add(self, stage: str, duration_ns: int):
+        self.stages.append((stage, duration_ns))
+
+    def commit(self):
+        self.tracer.record_many(self.stages)
+
+
+class PipelineTracer:
+    """
+    Samples one block in `sample_every` and accumulates per-stage durations.
+
+    Unsampled blocks get NULL_TRACE and only pay for a counter increment and a few
+    no-op calls, so tracing can stay on in production at the default rate.
+    """
+
+    def __init__(self, sample_every: int = 64):
+        self.enabled = False
+        self.sample_every = sample_every
+        self.counter = 0
+        self.histograms: Dict[str, LogHistogram] = {}
+        self.order: List[str] = []
+        self.lock = threading.Lock()
+
+    def configure(self, enabled: bool, sample_every: Optional[int] = None):
+        if sample_every is not None:
+            self.sample_every = max(1, int(sample_every))
+        self.enabled = enabled
+
+    def begin(self):
+        if not self.enabled:
+            return NULL_TRACE
+        self.counter += 1
+        if self.counter % self.sample_every:
+            return NULL_TRACE
+        return BlockTrace(self)
+
+    def record(self, stage: str, duration_ms: float):
+        with self.lock:
+            self._histogram(stage).record(duration_ms)
+
+    def record_many(self, stages: List[Tuple[str, int]]):
+        with self.lock:
+            for stage, duration_ns in stages:
+                self._histogram(stage).record(duration_ns / 1e6)
+
+    def _histogram(self, stage: str) -> LogHistogram:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = LogHistogram(0.001, 60000.0)
+            self.histograms[stage] = histogram
+            self.order.append(stage)
+        return histogram
+
+    def breakdown(self) -> Dict[str, Dict]:
+        with self.lock:
+            snapshot = [(stage, self.histograms[stage].copy()) for stage in self.order]
+
+        total_mean = sum(histogram.mean() for _, histogram in snapshot)
+        breakdown = {}
+        for stage, histogram in snapshot:
+            summary = histogram.summary((50.0, 99.0))
+            summary['share'] = (histogram.mean() / total_mean * 100) if total_mean > 0 else 0
+            breakdown[stage] = summary
+        return breakdown
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.order.clear()
+            self.counter = 0
+
+
+def format_breakdown(breakdown: Dict[str, Dict]) -> str:
+    if not breakdown:
+        return "Pipeline tracing disabled or no samples yet"
+
+    lines = [f"{'Stage':<12}{'Mean':>10}{'p50':>10}{'p99':>10}{'Share':>8}"]
+    for stage, summary in breakdown.items():
+        lines.append(f"{stage:<12}{summary['mean']:>8.3f}ms{summary['p50']:>8.3f}ms"
+                     f"{summary['p99']:>8.3f}ms{summary['share']:>7.1f}%")
+    return "\n".join(lines)
@@ -0,0 +1,226 @@
+import json
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def parse_timestamp(value: str) -> datetime:
+    """An ISO 8601 time from SQLite or PostgREST as an aware UTC datetime; naive times are taken as UTC."""
+    value = value.strip().replace('Z', '+00:00').replace(' ', 'T', 1)
+    # PostgREST trims the fraction to as few digits as it needs; older fromisoformat() wants 3 or 6
+    value = re.sub(r'\.(\d+)', lambda match: '.' + match.group(1)[:6].ljust(6, '0'), value, count=1)
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+class PresetStore:
+    """
+    Local source of truth for presets, kept in SQLite.
+
+    Every write is a single transaction, so a crash never leaves a half-written
+    store. Local edits are flagged dirty (deletes become tombstones) until the
+    background sync has pushed them.
+    """
+
+    def __init__(self, db_path: str = 'presets.db'):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS presets (
+                    name TEXT PRIMARY KEY,
+                    session_type TEXT NOT NULL,
+                    config TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    dirty INTEGER NOT NULL DEFAULT 0,
+                    deleted INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_presets_dirty ON presets(dirty)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_presets_type ON presets(session_type, deleted)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+    def save(self, name: str, config: Dict, session_type: str = 'sender'):
+        with self.lock, self.conn:
+            self.conn.execute('''
+                INSERT INTO presets (name, session_type, config, updated_at, dirty, deleted)
+                VALUES (?, ?, ?, ?, 1, 0)
+                ON CONFLICT(name) DO UPDATE SET
+                    session_type = excluded.session_type, config = excluded.config,
+                    updated_at = excluded.updated_at, dirty = 1, deleted = 0
+            ''', (name, session_type, json.dumps(config), utc_now()))
+
+    def delete(self, name: str):
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE presets SET deleted = 1, dirty = 1, updated_at = ? WHERE name = ?',
+                              (utc_now(), name))
+
+    def get(self, name: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute('SELECT config FROM presets WHERE name = ? AND deleted = 0',
+                                    (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list_names(self, session_type: Optional[str] = None) -> List[str]:
+        with self.lock:
+            if session_type:
+                rows = self.conn.execute('SELECT name FROM presets WHERE deleted = 0 AND session_type = ? '
+                                         'ORDER BY name', (session_type,)).fetchall()
+            else:
+                rows = self.conn.execute('SELECT name FROM presets WHERE deleted = 0 ORDER BY name').fetchall()
+        return [row[0] for row in rows]
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM presets').fetchone()[0] == 0
+
+    def import_legacy(self, presets: Dict[str, Dict], session_type: str):
+        """One-time import of the presets that used to live in config.json."""
+        now = utc_now()
+        with self.lock, self.conn:
+            self.conn.executemany('''
+                INSERT OR IGNORE INTO presets (name, session_type, config, updated_at, dirty, deleted)
+                VALUES (?, ?, ?, ?, 1, 0)
+            ''', [(name, session_type, json.dumps(config), now) for name, config in presets.items()])
+
+    def pending_changes(self) -> List[Dict]:
+        with self.lock:
+            rows = self.conn.execute('SELECT name, session_type, config, updated_at, deleted FROM presets '
+                                     'WHERE dirty = 1').fetchall()
+        return [{
+            'name': name,
+            'session_type': session_type,
+            'config': json.loads(config),
+            'updated_at': updated_at,
+            'deleted': bool(deleted)
+        } for name, session_type, config, updated_at, deleted in rows]
+
+    def mark_synced(self, name: str, updated_at: str, remote_updated_at: Optional[str] = None):
+        # Only clear the flag if nothing changed locally while the push was in flight. The database's
+        # time replaces ours, so later remote edits compare against its clock rather than this one's
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE presets SET dirty = 0, updated_at = COALESCE(?, updated_at) '
+                              'WHERE name = ? AND updated_at = ?', (remote_updated_at, name, updated_at))
+            self.conn.execute('DELETE FROM presets WHERE name = ? AND updated_at = ? AND deleted = 1',
+                              (name, updated_at))
+
+    def apply_remote(self, presets: List[Dict]) -> int:
+        """Merge pulled presets and tombstones; local unsynced edits win. Returns the number of presets changed."""
+        changed = 0
+        with self.lock, self.conn:
+            for preset in presets:
+                row = self.conn.execute('SELECT updated_at, dirty FROM presets WHERE name = ?',
+                                        (preset['name'],)).fetchone()
+                if row and (row[1] or parse_timestamp(row[0]) >= parse_timestamp(preset['updated_at'])):
+                    continue
+
+                if preset.get('deleted'):
+                    if row:
+                        self.conn.execute('DELETE FROM presets WHERE name = ?', (preset['name'],))
+                        changed += 1
+                    continue
+
+                self.conn.execute('''
+                    INSERT INTO presets (name, session_type, config, updated_at, dirty, deleted)
+                    VALUES (?, ?, ?, ?, 0, 0)
+                    ON CONFLICT(name) DO UPDATE SET
+                        session_type = excluded.session_type, config = excluded.config,
+                        updated_at = excluded.updated_at, dirty = 0, deleted = 0
+                ''', (preset['name'], preset['session_type'], json.dumps(preset['config']), preset['updated_at']))
+                changed += 1
+        return changed
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: str):
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class PresetSync:
+    """
+    Pushes dirty presets to Supabase with single-request upserts and pulls remote
+    changes incrementally by updated_at, on a background thread. updated_at is
+    set by the database, so the pull cursor (`last_pull_db`) is on its clock and a
+    client whose clock is behind cannot write rows that others skip.
+    """
+
+    page_size = 500
+
+    def __init__(self, store: PresetStore, supabase, interval: float = 30.0,
+                 on_change: Optional[Callable[[], None]] = None):
+        self.store = store
+        self.supabase = supabase
+        self.interval = interval
+        self.on_change = on_change
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def notify(self):
+        self.wakeup.set()
+
+    def _worker(self):
+        while self.running:
+            try:
+                self.sync_once()
+            except Exception:
+                pass
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+    def sync_once(self):
+        pending = self.store.pending_changes()
+
+        upserts = [change for change in pending if not change['deleted']]
+        if upserts:
+            stamped = self.supabase.upsert_presets(upserts)
+            if stamped is not None:
+                for change in upserts:
+                    self.store.mark_synced(change['name'], change['updated_at'], stamped.get(change['name']))
+
+        for change in pending:
+            if change['deleted'] and self.supabase.delete_preset(change['name']):
+                self.store.mark_synced(change['name'], change['updated_at'])
+
+        changed = 0
+        while True:
+            remote = self.supabase.get_presets_since(self.store.get_meta('last_pull_db'), self.page_size)
+            if not remote:
+                break
+            # Rows come oldest first; the cursor only advances past rows that have been applied
+            changed += self.store.apply_remote(remote)
+            self.store.set_meta('last_pull_db', max((preset['updated_at'] for preset in remote), key=parse_timestamp))
+            if len(remote) < self.page_size:
+                break
+
+        if changed and self.on_change is not None:
+            self.on_change()
@@ -0,0 +1,142 @@
+import struct
+import time
+from typing import Optional, Tuple
+
+
+PACKET_AUDIO = 0
+PACKET_PING = 1
+PACKET_PONG = 2
+PACKET_FORMAT = 3
+
+# Audio packets carry the stream format generation (mod 16) in the high nibble of the type byte;
+# generation 0 keeps the type byte at PACKET_AUDIO for receivers that predate format changes
+FORMAT_GENERATIONS = 16
+
+# type, sequence, sender capture timestamp (ns, monotonic), payload length
+TCP_HEADER = struct.Struct('!BIQI')
+# type, sequence, sender capture timestamp (ns, monotonic)
+UDP_HEADER = struct.Struct('!BIQ')
+
+# t1 (receiver send time), last one-way latency (us), last glass-to-glass latency (us)
+PING_PAYLOAD = struct.Struct('!QII')
+# t1 echoed back, t2 (sender receive time), t3 (sender send time)
+PONG_PAYLOAD = struct.Struct('!QQQ')
+# generation, channels, flags, sample rate, samples per packet
+FORMAT_PAYLOAD = struct.Struct('!BBBxII')
+
+FORMAT_ENCRYPTED = 0x01
+FORMAT_FEC = 0x02
+FORMAT_UDP = 0x04
+
+
+class StreamFormat:
+    """How the audio packets of one format generation are encoded, announced in-band with PACKET_FORMAT."""
+
+    def __init__(self, generation: int = 0, channels: int = 2, samplerate: int = 192000, blocksize: int = 1024,
+                 encrypted: bool = False, fec: bool = False, protocol: str = 'TCP'):
+        self.generation = generation % FORMAT_GENERATIONS
+        self.channels = channels
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.encrypted = encrypted
+        self.fec = fec
+        self.protocol = protocol
+
+    @property
+    def audio_type(self) -> int:
+        return PACKET_AUDIO | (self.generation << 4)
+
+    def pack(self) -> bytes:
+        flags = ((FORMAT_ENCRYPTED if self.encrypted else 0) | (FORMAT_FEC if self.fec else 0) |
+                 (FORMAT_UDP if self.protocol == 'UDP' else 0))
+        return FORMAT_PAYLOAD.pack(self.generation, self.channels, flags, self.samplerate, self.blocksize)
+
+    @classmethod
+    def unpack(cls, payload: bytes) -> 'StreamFormat':
+        generation, channels, flags, samplerate, blocksize = FORMAT_PAYLOAD.unpack_from(payload)
+        return cls(generation, channels, samplerate, blocksize, bool(flags & FORMAT_ENCRYPTED),
+                   bool(flags & FORMAT_FEC), 'UDP' if flags & FORMAT_UDP else 'TCP')
+
+    def describe(self) -> str:
+        parts = ['mono' if self.channels == 1 else 'stereo', f"{self.blocksize}-sample packets", self.protocol]
+        if self.fec:
+            parts.append('FEC')
+        if self.encrypted:
+            parts.append('encrypted')
+        return ', '.join(parts)
+
+
+def split_packet_type(packet_type: int) -> Tuple[int, int]:
+    """(packet kind, format generation) of a type byte."""
+    return packet_type & 0x0F, packet_type >> 4
+
+
+def monotonic_ns() -> int:
+    return time.monotonic_ns()
+
+
+def capture_timestamp_ns(time_info) -> int:
+    """
+    Convert the PortAudio ADC time of the first input sample to the monotonic clock.
+    Falls back to the callback entry time when the host API does not report ADC time.
+    """
+    now = time.monotonic_ns()
+    try:
+        adc_time = time_info.inputBufferAdcTime
+        age = time_info.currentTime - adc_time
+    except AttributeError:
+        return now
+
+    if adc_time <= 0 or not 0 <= age < 1.0:
+        return now
+    return now - int(age * 1e9)
+
+
+def playout_timestamp_ns(time_info) -> int:
+    """Convert the PortAudio DAC time of the first output sample to the monotonic clock."""
+    now = time.monotonic_ns()
+    try:
+        dac_time = time_info.outputBufferDacTime
+        lead = dac_time - time_info.currentTime
+    except AttributeError:
+        return now
+
+    if dac_time <= 0 or not 0 <= lead < 1.0:
+        return now
+    return now + int(lead * 1e9)
+
+
+def pack_tcp_frame(packet_type: int, sequence: int, timestamp_ns: int, payload: bytes) -> bytes:
+    return TCP_HEADER.pack(packet_type, sequence & 0xFFFFFFFF, timestamp_ns, len(payload)) + payload
+
+
+def pack_udp_frame(packet_type: int, sequence: int, timestamp_ns: int, payload: bytes) -> bytes:
+    return UDP_HEADER.pack(packet_type, sequence & 0xFFFFFFFF, timestamp_ns) + payload
+
+
+def unpack_udp_frame(data: bytes) -> Optional[Tuple[int, int, int, bytes]]:
+    if len(data) < UDP_HEADER.size:
+        return None
+    packet_type, sequence, timestamp_ns = UDP_HEADER.unpack_from(data)
+    return packet_type, sequence, timestamp_ns, data[UDP_HEADER.size:]
+
+
+def pack_ping(t1_ns: int, one_way_ms: float = 0.0, glass_to_glass_ms: float = 0.0) -> bytes:
+    return PING_PAYLOAD.pack(t1_ns, _ms_to_us(one_way_ms), _ms_to_us(glass_to_glass_ms))
+
+
+def unpack_ping(payload: bytes) -> Tuple[int, float, float]:
+    t1_ns, one_way_us, g2g_us = PING_PAYLOAD.unpack_from(payload)
+    return t1_ns, one_way_us / 1000.0, g2g_us / 1000.0
+
+
+def pack_pong(t1_ns: int, t2_ns: int, t3_ns: int) -> bytes:
+    return PONG_PAYLOAD.pack(t1_ns, t2_ns, t3_ns)
+
+
+def unpack_pong(payload: bytes) -> Tuple[int, int, int]:
+    return PONG_PAYLOAD.unpack_from(payload)
+
+
+def _ms_to_us(value_ms: float) -> int:
+    return max(0, min(int(value_ms * 1000), 0xFFFFFFFF))
@@ -0,0 +1,249 @@
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+
+RECORDING_EXTENSIONS = ('.wav', '.flac')
+
+
+def parse_cpu_list(text: str) -> Optional[List[int]]:
+    """'2,3' -> [2, 3]; empty -> None (no pinning)."""
+    cpus = [int(part) for part in text.replace(' ', '').split(',') if part]
+    return cpus or None
+
+
+def apply_retention(record_dir: str, max_age: float, max_total_bytes: int) -> List[str]:
+    """Delete finished recordings older than `max_age` seconds, then the oldest until under `max_total_bytes`."""
+    files = []
+    try:
+        with os.scandir(record_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(RECORDING_EXTENSIONS) and entry.is_file():
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return []
+
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    now = time.time()
+    deleted = []
+    for mtime, size, path in files:
+        expired = max_age and now - mtime > max_age
+        if not expired and not (max_total_bytes and total > max_total_bytes):
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        deleted.append(path)
+    return deleted
+
+
+def compress_to_flac(path: str, level: int, wrapper: List[str]) -> str:
+    """Encode `path` to FLAC next to it, verified against the input, then remove the WAV."""
+    target = path[:-len('.wav')] + '.flac'
+    tmp_path = target + '.tmp'
+    result = subprocess.run(wrapper + ['flac', '--silent', '--force', '--verify', f'-{level}', '-o', tmp_path, path],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise OSError(result.stderr.decode(errors='replace').strip() or f"flac exited with {result.returncode}")
+
+    os.replace(tmp_path, target)
+    os.remove(path)
+    return target
+
+
+def run_compressor(tasks, results, stop_event, record_dir: str, level: int, nice: int, cpus: Optional[List[int]],
+                   max_age: float, max_total_bytes: int, retention_interval: float):
+    """
+    Process entry point for SegmentCompressor: lowers its own CPU (and, via
+    ionice, disk) priority, compresses the WAV paths it is sent and applies
+    retention, reporting each outcome on `results`.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if nice and hasattr(os, 'nice'):
+        os.nice(nice)
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    wrapper = ['ionice', '-c', '3'] if shutil.which('ionice') else []
+    available = shutil.which('flac') is not None
+
+    # WAVs left from a previous run (stopped before the queue drained) come first
+    backlog = sorted(os.path.join(record_dir, name) for name in os.listdir(record_dir)
+                     if name.endswith('.wav')) if available and os.path.isdir(record_dir) else []
+    seen = set()
+    last_retention = 0.0
+
+    while not stop_event.is_set():
+        if backlog:
+            path = backlog.pop(0)
+            from_queue = False
+        else:
+            try:
+                path = tasks.get(timeout=retention_interval)
+            except queue.Empty:
+                path = ''
+            except (EOFError, OSError):
+                break
+            if path is None:
+                break
+            from_queue = bool(path)
+
+        if path in seen:
+            results.put(('duplicate', path, from_queue))
+        elif path and os.path.exists(path):
+            seen.add(path)
+            if not available:
+                results.put(('unavailable', path, from_queue))
+            else:
+                started = time.monotonic()
+                size = os.path.getsize(path)
+                try:
+                    target = compress_to_flac(path, level, wrapper)
+                    results.put(('compressed', path, from_queue, size, os.path.getsize(target),
+                                 time.monotonic() - started))
+                except OSError as e:
+                    results.put(('failed', path, from_queue, str(e)))
+        elif from_queue:
+            results.put(('missing', path, from_queue))
+
+        if (max_age or max_total_bytes) and time.monotonic() - last_retention >= retention_interval:
+            last_retention = time.monotonic()
+            for deleted in apply_retention(record_dir, max_age, max_total_bytes):
+                results.put(('deleted', deleted, False))
+
+
+class SegmentCompressor:
+    """
+    Compresses closed recording segments to FLAC in a separate, low-priority process.
+
+    The worker runs at `nice` (and idle I/O class where ionice exists), optionally
+    pinned to `cpus` away from the cores the audio threads use, so compression
+    never competes with the real-time path. Encoding uses the `flac` command line
+    tool with --verify; the WAV is removed only after a verified encode. Without
+    flac installed, segments stay WAV and are counted as uncompressed.
+
+    Retention deletes finished recordings older than `max_age_days` and then the
+    oldest ones while the directory exceeds `max_total_bytes` (0 disables either).
+    The worker starts with the first submit(); get_stats() reports the queue depth.
+    """
+
+    def __init__(self, record_dir: str = 'recordings', level: int = 5, nice: int = 19,
+                 cpus: Optional[List[int]] = None, max_age_days: float = 0.0, max_total_bytes: int = 0,
+                 retention_interval: float = 60.0):
+        self.record_dir = record_dir
+        self.level = level
+        self.nice = nice
+        self.cpus = cpus
+        self.max_age = max_age_days * 86400
+        self.max_total_bytes = max_total_bytes
+        self.retention_interval = retention_interval
+
+        self.context = multiprocessing.get_context('spawn')
+        self.process: Optional[multiprocessing.Process] = None
+        self.tasks = None
+        self.results = None
+        self.stop_event = self.context.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.compressed = 0
+        self.uncompressed = 0
+        self.failed = 0
+        self.deleted = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.encode_seconds = 0.0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.stop_event.clear()
+        self.tasks = self.context.Queue()
+        self.results = self.context.Queue()
+        self.process = self.context.Process(
+            target=run_compressor,
+            args=(self.tasks, self.results, self.stop_event, self.record_dir, self.level, self.nice, self.cpus,
+                  self.max_age, self.max_total_bytes, self.retention_interval),
+            daemon=True
+        )
+        self.process.start()
+        self.thread = threading.Thread(target=self._collector, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 30.0):
+        """Let the worker finish the segment in hand; queued segments are picked up on the next start."""
+        if not self.running:
+            return
+        self.stop_event.set()
+        self.tasks.put(None)
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process = None
+
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(2.0)
+            self.thread = None
+
+    def submit(self, path: str):
+        self.start()
+        with self.lock:
+            self.queued += 1
+        self.tasks.put(path)
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return {
+                'queue_depth': self.queued,
+                'compressed': self.compressed,
+                'uncompressed': self.uncompressed,
+                'failed': self.failed,
+                'deleted': self.deleted,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'ratio': self.bytes_out / self.bytes_in if self.bytes_in else None,
+                'encode_seconds': self.encode_seconds,
+                'last_error': self.last_error
+            }
+
+    def _collector(self):
+        while self.running:
+            try:
+                result = self.results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            kind, path, from_queue = result[:3]
+            with self.lock:
+                if from_queue:
+                    self.queued = max(0, self.queued - 1)
+                if kind == 'compressed':
+                    self.compressed += 1
+                    self.bytes_in += result[3]
+                    self.bytes_out += result[4]
+                    self.encode_seconds += result[5]
+                elif kind == 'unavailable':
+                    self.uncompressed += 1
+                    self.last_error = 'flac is not installed; segments are kept as WAV'
+                elif kind == 'failed':
+                    self.failed += 1
+                    self.last_error = f"{os.path.basename(path)}: {result[3]}"
+                elif kind == 'deleted':
+                    self.deleted += 1
@@ -0,0 +1,220 @@
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+# A segment is written as <session>.<n>.jsonl.live, renamed to .jsonl once closed, then gzipped
+LIVE_SUFFIX = '.live'
+SEGMENT_PATTERN = re.compile(r'^(?P<session>.+)\.(?P<index>\d{4})\.jsonl(?:(?P<gz>\.gz)|\.live)?$')
+ERROR_EVENT_TYPES = ('error', 'connection_lost', 'device_lost', 'device_failed')
+
+
+def is_error_event(event_type: str, data) -> bool:
+    return event_type in ERROR_EVENT_TYPES or (isinstance(data, dict) and 'error' in data)
+
+
+class SessionCatalog:
+    """
+    SQLite index of the sessions in a log directory.
+
+    SessionLogger records each session at start and end, so listing and filtering
+    (type, date range, host, error count) never opens session files. Directories
+    written before the catalog existed are back-filled in batches by
+    start_backfill(); files already indexed at the same mtime are skipped, so an
+    interrupted backfill resumes where it stopped.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.backfill_thread: Optional[threading.Thread] = None
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    session_type TEXT,
+                    start_time TEXT NOT NULL,
+                    end_time TEXT,
+                    host TEXT,
+                    port INTEGER,
+                    protocol TEXT,
+                    config TEXT,
+                    final_stats TEXT,
+                    event_count INTEGER,
+                    error_count INTEGER NOT NULL DEFAULT 0,
+                    events_dropped INTEGER NOT NULL DEFAULT 0,
+                    segments INTEGER NOT NULL DEFAULT 0,
+                    incomplete INTEGER NOT NULL DEFAULT 1
+                )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_start ON sessions(start_time)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_type ON sessions(session_type, start_time)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_host ON sessions(host, start_time)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_errors ON sessions(error_count)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS indexed_files (filename TEXT PRIMARY KEY, '
+                              'mtime_ns INTEGER NOT NULL)')
+
+    def record(self, session: Dict, incomplete: bool):
+        """Insert or update a session; an incomplete record never replaces a finished one."""
+        self._insert([session], incomplete)
+
+    def _insert(self, sessions: List[Dict], incomplete: bool):
+        verb = 'INSERT OR IGNORE' if incomplete else 'INSERT OR REPLACE'
+        rows = []
+        for session in sessions:
+            config = session.get('config') or {}
+            rows.append((session['session_id'], session.get('type'), session['start_time'], session.get('end_time'),
+                         config.get('host'), config.get('port'), config.get('protocol'),
+                         json.dumps(config, default=str), json.dumps(session.get('final_stats'), default=str),
+                         session.get('event_count'), session.get('error_count', 0), session.get('events_dropped', 0),
+                         session.get('segments', 0), int(incomplete)))
+        with self.lock, self.conn:
+            self.conn.executemany(verb + ''' INTO sessions (session_id, session_type, start_time, end_time, host,
+                    port, protocol, config, final_stats, event_count, error_count, events_dropped, segments,
+                    incomplete)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+
+    def query(self, session_type: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+              host: Optional[str] = None, min_errors: Optional[int] = None, limit: Optional[int] = 50,
+              offset: int = 0) -> List[Dict]:
+        """Sessions newest first; `since`/`until` compare against the ISO start time."""
+        where, params = self._filters(session_type, since, until, host, min_errors)
+        sql = ('SELECT session_id, session_type, start_time, end_time, config, final_stats, event_count, '
+               'error_count, events_dropped, segments, incomplete FROM sessions' + where +
+               ' ORDER BY start_time DESC, session_id DESC LIMIT ? OFFSET ?')
+        with self.lock:
+            rows = self.conn.execute(sql, params + [-1 if limit is None else limit, offset]).fetchall()
+
+        return [{
+            'session_id': session_id,
+            'type': session_type,
+            'start_time': start_time,
+            'end_time': end_time,
+            'config': json.loads(config) if config else {},
+            'final_stats': json.loads(final_stats) if final_stats else None,
+            'event_count': event_count,
+            'error_count': error_count,
+            'events_dropped': events_dropped,
+            'segments': segments,
+            'incomplete': bool(incomplete)
+        } for (session_id, session_type, start_time, end_time, config, final_stats, event_count, error_count,
+               events_dropped, segments, incomplete) in rows]
+
+    def count(self, session_type: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+              host: Optional[str] = None, min_errors: Optional[int] = None) -> int:
+        where, params = self._filters(session_type, since, until, host, min_errors)
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM sessions' + where, params).fetchone()[0]
+
+    def _filters(self, session_type, since, until, host, min_errors):
+        clauses, params = [], []
+        if session_type:
+            clauses.append('session_type = ?')
+            params.append(session_type)
+        if since:
+            clauses.append('start_time >= ?')
+            params.append(since)
+        if until:
+            clauses.append('start_time < ?')
+            params.append(until)
+        if host:
+            clauses.append('host = ?')
+            params.append(host)
+        if min_errors is not None:
+            clauses.append('error_count >= ?')
+            params.append(min_errors)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def start_backfill(self, log_dir: str):
+        if self.backfill_thread is None or not self.backfill_thread.is_alive():
+            self.backfill_thread = threading.Thread(target=self.backfill, args=(log_dir,), daemon=True)
+            self.backfill_thread.start()
+
+    def backfill(self, log_dir: str, batch_size: int = 100) -> int:
+        """Index summaries (and summary-less segment sets) not yet in the catalog; returns how many were added."""
+        if not os.path.isdir(log_dir):
+            return 0
+
+        with self.lock:
+            known = dict(self.conn.execute('SELECT filename, mtime_ns FROM indexed_files').fetchall())
+            recorded = {row[0] for row in self.conn.execute('SELECT session_id FROM sessions WHERE incomplete = 0')}
+
+        pending = []
+        segment_sessions = {}
+        with os.scandir(log_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.json'):
+                    mtime_ns = entry.stat().st_mtime_ns
+                    if known.get(entry.name) != mtime_ns:
+                        pending.append((entry.name, mtime_ns))
+                else:
+                    match = SEGMENT_PATTERN.match(entry.name)
+                    if match and match.group('index') == '0000':
+                        segment_sessions[match.group('session')] = entry.path
+
+        indexed = 0
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            sessions = [self._read_summary(os.path.join(log_dir, filename)) for filename, _ in batch]
+            sessions = [session for session in sessions if session is not None]
+            self._insert(sessions, incomplete=False)
+            self._mark_indexed(batch)
+            recorded.update(session['session_id'] for session in sessions)
+            indexed += len(sessions)
+
+        # Segments without a summary: the session is running or ended without end_session()
+        unfinished = []
+        for session_id, path in segment_sessions.items():
+            if session_id in recorded or os.path.basename(path) in known:
+                continue
+            first = _first_event(path)
+            if first is not None and first.get('type') == 'session_start':
+                unfinished.append({
+                    'session_id': session_id,
+                    'type': first['data'].get('session_type'),
+                    'start_time': first['timestamp'],
+                    'config': first['data'].get('config')
+                })
+        self._insert(unfinished, incomplete=True)
+        self._mark_indexed([(os.path.basename(path), 0) for path in segment_sessions.values()])
+        return indexed + len(unfinished)
+
+    def _mark_indexed(self, files):
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO indexed_files (filename, mtime_ns) VALUES (?, ?)', files)
+
+    def _read_summary(self, path: str) -> Optional[Dict]:
+        try:
+            with open(path, 'r') as f:
+                session = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(session, dict) or 'session_id' not in session or 'start_time' not in session:
+            return None
+
+        # Summaries from before streaming logs carry their events inline
+        events = session.pop('events', None)
+        if events is not None:
+            session.setdefault('event_count', len(events))
+            session.setdefault('error_count', sum(1 for event in events
+                                                  if is_error_event(event.get('type'), event.get('data'))))
+        return session
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def _first_event(path: str) -> Optional[Dict]:
+    opener = gzip.open if path.endswith('.gz') else open
+    try:
+        with opener(path, 'rt', encoding='utf-8') as f:
+            return json.loads(f.readline())
+    except (OSError, EOFError, ValueError):
+        return None
@@ -0,0 +1,70 @@
+/*
+  # Unique Preset Names for Upserts
+
+  1. Changes
+    - Add a unique constraint on `mpx_presets.name`
+      - Lets clients save a preset with a single upsert (on conflict name)
+        instead of a select followed by an update or insert
+    - Add an index on `mpx_presets.updated_at`
+      - Clients pull remote preset changes incrementally by updated_at
+    - Add `deleted` to `mpx_presets`
+      - Deleting a preset marks the row instead of removing it, so clients
+        pulling by updated_at see the delete
+    - Add `config` (jsonb) to `mpx_presets`
+      - Holds the full preset, including the settings that have no column
+        of their own (AGC, limiter, FEC, encryption, ...)
+    - Let the database set `mpx_presets.updated_at`
+      - Default now() and a trigger that stamps every insert and update, so
+        the incremental pull cursor does not depend on client clocks
+
+  2. Notes
+    - Duplicate names left behind by the old select-then-insert flow are
+      removed first, keeping the most recently updated row
+*/
+
+DELETE FROM mpx_presets a
+USING mpx_presets b
+WHERE a.name = b.name
+  AND (a.updated_at < b.updated_at OR (a.updated_at = b.updated_at AND a.id < b.id));
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_constraint WHERE conname = 'mpx_presets_name_key'
+  ) THEN
+    ALTER TABLE mpx_presets ADD CONSTRAINT mpx_presets_name_key UNIQUE (name);
+  END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_mpx_presets_updated_at ON mpx_presets(updated_at);
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_name = 'mpx_presets' AND column_name = 'deleted'
+  ) THEN
+    ALTER TABLE mpx_presets ADD COLUMN deleted boolean DEFAULT false NOT NULL;
+  END IF;
+
+  IF NOT EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_name = 'mpx_presets' AND column_name = 'config'
+  ) THEN
+    ALTER TABLE mpx_presets ADD COLUMN config jsonb DEFAULT '{}'::jsonb NOT NULL;
+  END IF;
+END $$;
+
+ALTER TABLE mpx_presets ALTER COLUMN updated_at SET DEFAULT now();
+
+CREATE OR REPLACE FUNCTION mpx_presets_set_updated_at() RETURNS trigger AS $$
+BEGIN
+  NEW.updated_at = now();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS mpx_presets_set_updated_at ON mpx_presets;
+CREATE TRIGGER mpx_presets_set_updated_at
+  BEFORE INSERT OR UPDATE ON mpx_presets
+  FOR EACH ROW EXECUTE FUNCTION mpx_presets_set_updated_at();
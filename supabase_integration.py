@@ -1,23 +1,42 @@
 import os
-from supabase import create_client, Client
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 
 class SupabaseManager:
-    def __init__(self):
-        url = os.environ.get("VITE_SUPABASE_URL")
-        key = os.environ.get("VITE_SUPABASE_ANON_KEY")
+    def __init__(self, connect: bool = True):
+        self.url = os.environ.get("VITE_SUPABASE_URL")
+        self.key = os.environ.get("VITE_SUPABASE_ANON_KEY")
 
-        self.client: Optional[Client] = None
+        self.client: Optional['Client'] = None
         self.enabled = False
 
-        if url and key:
-            try:
-                self.client = create_client(url, key)
-                self.enabled = True
-            except Exception as e:
-                print(f"Failed to initialize Supabase: {e}")
+        if connect:
+            self.connect()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.url and self.key)
+
+    def connect(self) -> bool:
+        """
+        Create the client. Importing supabase is slow, so the GUI apps construct
+        the manager with connect=False and call this from a background thread.
+        """
+        if self.enabled or not self.configured:
+            return self.enabled
+
+        try:
+            from supabase import create_client
+
+            self.client = create_client(self.url, self.key)
+            self.enabled = True
+        except Exception as e:
+            print(f"Failed to initialize Supabase: {e}")
+        return self.enabled
 
     def log_session(self, session_data: Dict) -> bool:
         if not self.enabled:
@@ -53,41 +72,88 @@ class SupabaseManager:
         except Exception:
             return []
 
+    def _preset_row(self, name: str, config: Dict, session_type: str) -> Dict:
+        # updated_at is stamped by the database, so pulls never depend on client clocks
+        return {
+            'name': name,
+            'session_type': session_type,
+            'host': config.get('host', '0.0.0.0'),
+            'port': config.get('port', 5000),
+            'protocol': config.get('protocol', 'TCP'),
+            'sample_rate': config.get('samplerate', 192000),
+            'block_size': config.get('blocksize', 1024),
+            'device_name': config.get('device', ''),
+            'channel_mode': config.get('channel_mode', 'Stereo (L/R)'),
+            'config': config,
+            'deleted': False
+        }
+
     def save_preset(self, name: str, config: Dict, session_type: str = 'sender') -> bool:
         if not self.enabled:
             return False
 
         try:
-            data = {
-                'name': name,
-                'session_type': session_type,
-                'host': config.get('host', '0.0.0.0'),
-                'port': config.get('port', 5000),
-                'protocol': config.get('protocol', 'TCP'),
-                'sample_rate': config.get('samplerate', 192000),
-                'block_size': config.get('blocksize', 1024),
-                'device_name': config.get('device', ''),
-                'updated_at': datetime.now().isoformat()
-            }
-
-            existing = self.client.table('mpx_presets').select('id').eq('name', name).execute()
-
-            if existing.data:
-                self.client.table('mpx_presets').update(data).eq('id', existing.data[0]['id']).execute()
-            else:
-                self.client.table('mpx_presets').insert(data).execute()
-
+            data = self._preset_row(name, config, session_type)
+            self.client.table('mpx_presets').upsert(data, on_conflict='name').execute()
             return True
         except Exception as e:
             print(f"Failed to save preset: {e}")
             return False
 
+    def upsert_presets(self, presets: List[Dict]) -> Optional[Dict[str, str]]:
+        """Push presets in one request; returns the updated_at the database gave each, or None on failure."""
+        if not self.enabled:
+            return None
+
+        try:
+            rows = [self._preset_row(p['name'], p['config'], p['session_type']) for p in presets]
+            response = self.client.table('mpx_presets').upsert(rows, on_conflict='name').execute()
+        except Exception as e:
+            print(f"Failed to sync presets: {e}")
+            return None
+        return {row['name']: row['updated_at'] for row in response.data or []}
+
+    def get_presets_since(self, since: Optional[str] = None, limit: int = 500) -> Optional[List[Dict]]:
+        """Up to `limit` presets and tombstones changed after `since` (a database updated_at), oldest first."""
+        if not self.enabled:
+            return None
+
+        try:
+            query = self.client.table('mpx_presets').select('*').order('updated_at').limit(limit)
+            if since:
+                query = query.gt('updated_at', since)
+            response = query.execute()
+        except Exception:
+            return None
+
+        return [{
+            'name': row['name'],
+            'session_type': row.get('session_type', 'sender'),
+            'updated_at': row['updated_at'],
+            'deleted': row.get('deleted', False),
+            'config': self._preset_config(row)
+        } for row in response.data]
+
+    def _preset_config(self, row: Dict) -> Dict:
+        # Rows written before the config column only have the settings that have columns of their own
+        if row.get('config'):
+            return dict(row['config'])
+        return {
+            'host': row.get('host'),
+            'port': row.get('port'),
+            'protocol': row.get('protocol'),
+            'samplerate': row.get('sample_rate'),
+            'blocksize': row.get('block_size'),
+            'device': row.get('device_name', ''),
+            'channel_mode': row.get('channel_mode', 'Stereo (L/R)')
+        }
+
     def get_presets(self, session_type: str = None) -> List[Dict]:
         if not self.enabled:
             return []
 
         try:
-            query = self.client.table('mpx_presets').select('*')
+            query = self.client.table('mpx_presets').select('*').eq('deleted', False)
             if session_type:
                 query = query.eq('session_type', session_type)
             response = query.execute()
@@ -96,37 +162,42 @@ class SupabaseManager:
             return []
 
     def delete_preset(self, preset_name: str) -> bool:
+        """Soft delete: the row stays as a tombstone (updated_at bumped by the database) so pulls see it."""
         if not self.enabled:
             return False
 
         try:
-            self.client.table('mpx_presets').delete().eq('name', preset_name).execute()
+            self.client.table('mpx_presets').update({'deleted': True}).eq('name', preset_name).execute()
             return True
         except Exception:
             return False
 
-    def log_statistics(self, session_id: str, stats: Dict) -> bool:
+    def build_statistics_row(self, session_id: str, stats: Dict) -> Dict:
+        return {
+            'session_id': session_id,
+            'latency_ms': stats.get('avg_latency', 0),
+            'packet_loss_percent': stats.get('packet_loss_rate', 0),
+            'buffer_fill_percent': stats.get('buffer_fill', 0),
+            'left_channel_db': stats.get('left_db', -60),
+            'right_channel_db': stats.get('right_db', -60),
+            'bytes_transferred': stats.get('bytes_sent', 0) + stats.get('bytes_received', 0),
+            'jitter_ms': stats.get('jitter', 0),
+            'timestamp': datetime.now().isoformat()
+        }
+
+    def insert_statistics(self, rows: List[Dict]) -> bool:
         if not self.enabled:
             return False
 
         try:
-            data = {
-                'session_id': session_id,
-                'latency_ms': stats.get('avg_latency', 0),
-                'packet_loss_percent': stats.get('packet_loss_rate', 0),
-                'buffer_fill_percent': stats.get('buffer_fill', 0),
-                'left_channel_db': stats.get('left_db', -60),
-                'right_channel_db': stats.get('right_db', -60),
-                'bytes_transferred': stats.get('bytes_sent', 0) + stats.get('bytes_received', 0),
-                'jitter_ms': stats.get('jitter', 0),
-                'timestamp': datetime.now().isoformat()
-            }
-
-            self.client.table('mpx_statistics').insert(data).execute()
+            self.client.table('mpx_statistics').insert(rows).execute()
             return True
         except Exception:
             return False
 
+    def log_statistics(self, session_id: str, stats: Dict) -> bool:
+        return self.insert_statistics([self.build_statistics_row(session_id, stats)])
+
     def get_statistics(self, days: int = 7) -> Dict:
         if not self.enabled:
             return {}
@@ -0,0 +1,180 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+from histogram import LogHistogram
+
+
+class TelemetryUploader:
+    """
+    Background uploader for statistics rows.
+
+    submit() never blocks: rows go into a bounded queue and are dropped (and
+    counted) when it is full. A worker thread inserts them in batches of
+    `batch_size` rows or every `batch_interval` seconds, backs off exponentially
+    while uploads fail, and spools undeliverable rows to SQLite; the spool is
+    drained automatically once uploads succeed again.
+    """
+
+    def __init__(self, supabase, spool_path: str = 'telemetry_spool.db', max_queue: int = 1000,
+                 batch_size: int = 50, batch_interval: float = 5.0, max_backoff: float = 300.0):
+        self.supabase = supabase
+        self.spool_path = spool_path
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.max_backoff = max_backoff
+
+        self.lock = threading.Lock()
+        self.upload_latency = LogHistogram(0.001, 600000.0)
+        self.dropped = 0
+        self.uploaded = 0
+        self.failed_batches = 0
+        self.spooled = 0
+        self.backoff = 0.0
+
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if not self.running:
+            return
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def submit(self, row: Dict) -> bool:
+        try:
+            self.queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            latency = self.upload_latency.summary()
+            return {
+                'queue_depth': self.queue.qsize(),
+                'dropped': self.dropped,
+                'uploaded': self.uploaded,
+                'failed_batches': self.failed_batches,
+                'spooled': self.spooled,
+                'backoff': self.backoff,
+                'upload_latency': latency
+            }
+
+    def _worker(self):
+        spool = self._open_spool()
+
+        while self.running or not self.queue.empty():
+            batch = self._collect_batch()
+
+            if batch and not self._upload(batch):
+                self._spool(spool, batch)
+
+            drained = 0
+            while self.backoff == 0 and spool is not None and self.spooled > 0 and drained < 10:
+                self._drain_spool(spool)
+                drained += 1
+
+            if self.backoff > 0 and self.running:
+                self._sleep(self.backoff)
+
+        if spool is not None:
+            spool.close()
+
+    def _collect_batch(self) -> List[Dict]:
+        batch = []
+        deadline = time.monotonic() + self.batch_interval
+
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (not self.running and self.queue.empty()):
+                break
+            try:
+                batch.append(self.queue.get(timeout=min(remaining, 0.5)))
+            except queue.Empty:
+                continue
+
+        return batch
+
+    def _upload(self, rows: List[Dict]) -> bool:
+        start = time.perf_counter()
+        try:
+            ok = self.supabase.insert_statistics(rows)
+        except Exception:
+            ok = False
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+
+        with self.lock:
+            self.upload_latency.record(elapsed_ms)
+            if ok:
+                self.uploaded += len(rows)
+                self.backoff = 0.0
+            else:
+                self.failed_batches += 1
+                self.backoff = min(max(self.backoff * 2, 1.0), self.max_backoff)
+        return ok
+
+    def _sleep(self, seconds: float):
+        deadline = time.monotonic() + seconds
+        while self.running and time.monotonic() < deadline:
+            time.sleep(min(0.5, deadline - time.monotonic()))
+
+    def _open_spool(self) -> Optional[sqlite3.Connection]:
+        try:
+            spool = sqlite3.connect(self.spool_path)
+            spool.execute('CREATE TABLE IF NOT EXISTS spool (id INTEGER PRIMARY KEY, row TEXT NOT NULL)')
+            spool.commit()
+            count = spool.execute('SELECT COUNT(*) FROM spool').fetchone()[0]
+            with self.lock:
+                self.spooled = count
+            return spool
+        except sqlite3.Error:
+            return None
+
+    def _spool(self, spool: Optional[sqlite3.Connection], rows: List[Dict]):
+        if spool is None:
+            with self.lock:
+                self.dropped += len(rows)
+            return
+
+        try:
+            with spool:
+                spool.executemany('INSERT INTO spool (row) VALUES (?)', [(json.dumps(row),) for row in rows])
+            with self.lock:
+                self.spooled += len(rows)
+        except sqlite3.Error:
+            with self.lock:
+                self.dropped += len(rows)
+
+    def _drain_spool(self, spool: sqlite3.Connection):
+        try:
+            records = spool.execute('SELECT id, row FROM spool ORDER BY id LIMIT ?', (self.batch_size,)).fetchall()
+        except sqlite3.Error:
+            return
+        if not records:
+            with self.lock:
+                self.spooled = 0
+            return
+
+        if self._upload([json.loads(row) for _, row in records]):
+            try:
+                with spool:
+                    spool.execute('DELETE FROM spool WHERE id <= ?', (records[-1][0],))
+                with self.lock:
+                    self.spooled = max(self.spooled - len(records), 0)
+            except sqlite3.Error:
+                pass
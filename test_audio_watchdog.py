@@ -0,0 +1,56 @@
+import numpy as np
+from audio_watchdog import AudioWatchdog, Hysteresis
+from logging_manager import AlertSystem
+
+SAMPLERATE = 48000
+BLOCK = 1024
+
+
+def tone(seconds: float, level: float = 0.5):
+    t = np.arange(int(seconds * SAMPLERATE)) / SAMPLERATE
+    mono = (level * 32767 * np.sin(2 * np.pi * 997 * t)).astype(np.int16)
+    return np.column_stack((mono, mono))
+
+
+def silence(seconds: float):
+    return np.zeros((int(seconds * SAMPLERATE), 2), dtype=np.int16)
+
+
+def feed(watchdog: AudioWatchdog, audio):
+    for start in range(0, len(audio), BLOCK):
+        watchdog.process(audio[start:start + BLOCK], SAMPLERATE)
+
+
+def raised(watchdog: AudioWatchdog):
+    alerts = AlertSystem(dedup_interval=0)
+    watchdog.check_alerts(alerts, 'test')
+    messages = [alert['message'] for alert in alerts.alerts]
+    alerts.close()
+    return messages
+
+
+def test_interrupted_silence_does_not_raise():
+    watchdog = AudioWatchdog(silence_seconds=10.0, clear_seconds=2.0)
+    for _ in range(10):
+        feed(watchdog, silence(1.5))
+        feed(watchdog, tone(0.5))
+    assert 'Silence detected' not in raised(watchdog)
+
+
+def test_continuous_silence_raises():
+    watchdog = AudioWatchdog(silence_seconds=10.0, clear_seconds=2.0)
+    feed(watchdog, tone(0.5))
+    feed(watchdog, silence(10.5))
+    assert 'Silence detected' in raised(watchdog)
+
+
+def test_intermittent_condition_accumulates():
+    timer = Hysteresis(raise_after=1.0, clear_after=2.0)
+    changes = [timer.update(present, 0.25) for present in [True, False] * 4]
+    assert True in changes
+
+
+def test_continuous_condition_restarts_on_absence():
+    timer = Hysteresis(raise_after=1.0, clear_after=2.0, continuous=True)
+    changes = [timer.update(present, 0.25) for present in [True, True, True, False] * 4]
+    assert True not in changes
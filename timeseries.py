@@ -0,0 +1,164 @@
+from __future__ import annotations
+import os
+import math
+import threading
+import warnings
+from typing import Dict, Optional, Tuple
+from lazy_import import lazy_import
+
+np = lazy_import('numpy')
+
+
+HISTORY_FIELDS = ('bitrate', 'loss', 'jitter', 'latency', 'buffer_fill', 'left_db', 'right_db')
+
+SECONDS_CAPACITY = 3600
+MINUTES_CAPACITY = 7 * 24 * 60
+AGGREGATES = ('min', 'max', 'avg')
+
+
+class TimeSeriesStore:
+    """
+    Fixed-memory ring time-series of link statistics.
+
+    Per-second samples are kept for the last hour; each completed minute is
+    downsampled to min/max/avg and kept for 7 days. When `path` is given the rings
+    are memory-mapped .npy files, so history survives restarts; flush() (called
+    every `flush_every` appends and on close) syncs them to disk.
+    """
+
+    def __init__(self, path: Optional[str] = None, fields=HISTORY_FIELDS, flush_every: int = 10):
+        self.path = path
+        self.fields = tuple(fields)
+        self.field_index = {name: i for i, name in enumerate(self.fields)}
+        self.flush_every = flush_every
+        self.appends_since_flush = 0
+        self.lock = threading.Lock()
+
+        width = len(self.fields)
+        self.second_ts = self._open('seconds_ts', (SECONDS_CAPACITY,), np.int64, -1)
+        self.seconds = self._open('seconds', (SECONDS_CAPACITY, width), np.float32, np.nan)
+        self.minute_ts = self._open('minutes_ts', (MINUTES_CAPACITY,), np.int64, -1)
+        self.minutes = self._open('minutes', (MINUTES_CAPACITY, len(AGGREGATES), width), np.float32, np.nan)
+
+        latest = int(self.second_ts.max())
+        self.current_minute = latest // 60 if latest >= 0 else None
+
+    def _open(self, name: str, shape, dtype, fill) -> np.ndarray:
+        if self.path is None:
+            return np.full(shape, fill, dtype=dtype)
+
+        os.makedirs(self.path, exist_ok=True)
+        filename = os.path.join(self.path, f"{name}.npy")
+
+        if os.path.exists(filename):
+            try:
+                array = np.lib.format.open_memmap(filename, mode='r+')
+                if array.shape == shape and array.dtype == dtype:
+                    return array
+                del array
+            except (ValueError, OSError):
+                pass
+
+        array = np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=shape)
+        array[...] = fill
+        return array
+
+    def append(self, timestamp: float, values: Dict[str, float]):
+        second = int(timestamp)
+        row = np.full(len(self.fields), np.nan, dtype=np.float32)
+        for name, value in values.items():
+            index = self.field_index.get(name)
+            if index is not None and value is not None:
+                row[index] = value
+
+        with self.lock:
+            minute = second // 60
+            if self.current_minute is not None and minute != self.current_minute:
+                self._downsample(self.current_minute)
+            self.current_minute = minute
+
+            slot = second % SECONDS_CAPACITY
+            self.second_ts[slot] = second
+            self.seconds[slot] = row
+
+            self.appends_since_flush += 1
+            if self.path is not None and self.appends_since_flush >= self.flush_every:
+                self._flush()
+
+    def _downsample(self, minute: int):
+        start = minute * 60
+        mask = (self.second_ts >= start) & (self.second_ts < start + 60)
+        if not mask.any():
+            return
+
+        rows = self.seconds[mask]
+        slot = minute % MINUTES_CAPACITY
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            self.minute_ts[slot] = start
+            self.minutes[slot, 0] = np.nanmin(rows, axis=0)
+            self.minutes[slot, 1] = np.nanmax(rows, axis=0)
+            self.minutes[slot, 2] = np.nanmean(rows, axis=0)
+
+    def query(self, start: float, end: float, field: Optional[str] = None,
+              resolution: str = 'auto') -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return (timestamps, values) between start and end, sorted by time.
+
+        Per-second values have shape (n, fields); per-minute values have shape
+        (n, 3, fields) with min/max/avg. 'auto' uses seconds when the range fits
+        inside the last hour.
+        """
+        with self.lock:
+            if resolution == 'auto':
+                oldest = self.second_ts[self.second_ts >= 0]
+                fits = oldest.size > 0 and start >= oldest.min()
+                resolution = 'second' if fits else 'minute'
+
+            if resolution == 'second':
+                timestamps, values = self.second_ts, self.seconds
+            else:
+                timestamps, values = self.minute_ts, self.minutes
+
+            mask = (timestamps >= math.floor(start)) & (timestamps <= end)
+            selected_ts = timestamps[mask]
+            selected = np.array(values[mask])
+
+        order = np.argsort(selected_ts, kind='stable')
+        selected_ts = selected_ts[order]
+        selected = selected[order]
+
+        if field is not None:
+            selected = selected[..., self.field_index[field]]
+        return selected_ts, selected
+
+    def summary(self, window_seconds: float, now: float) -> Dict[str, Dict[str, float]]:
+        _, values = self.query(now - window_seconds, now, resolution='second')
+        summary = {}
+        for name, index in self.field_index.items():
+            column = values[:, index]
+            column = column[~np.isnan(column)]
+            if column.size == 0:
+                continue
+            summary[name] = {
+                'min': float(column.min()),
+                'max': float(column.max()),
+                'avg': float(column.mean())
+            }
+        return summary
+
+    def _flush(self):
+        for array in (self.second_ts, self.seconds, self.minute_ts, self.minutes):
+            if isinstance(array, np.memmap):
+                array.flush()
+        self.appends_since_flush = 0
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            if self.current_minute is not None:
+                self._downsample(self.current_minute)
+            self._flush()